@@ -0,0 +1,365 @@
+#
+#   Benchmarks of the combination code, so a change that slows it down, or makes it use more memory,
+#   is noticed.  Synthetic flat stacks and a calibration library are generated into a temporary
+#   directory (see SyntheticFlatGenerator), always the same for the same options, and then timed:
+#
+#       combine-<method>        Each ImageMath combination method, reading the files included
+#       calibrate-<mode>        Each Calibrator mode, on a stack already read
+#       groups-<n>-workers      FileCombiner.process_groups on several filter groups, combining
+#                               1, 2 and 4 groups at once
+#
+#   Each benchmark runs in a fresh process of its own, so its peak memory is its own and the
+#   calibration library starts empty.  It is repeated, and the best time is used for the throughput
+#   (megapixels of input combined per second); the first, cold, time is reported too.  Peak memory
+#   is the process's peak resident memory, and that of the largest group worker if there were any.
+#
+#   The results are printed and saved as JSON.  Given the JSON of an earlier run, the speed and memory
+#   of each benchmark are compared with it.  No GUI or network is used.
+#
+#   Run as:  python Benchmark.py [options]          (python Benchmark.py -h lists them)
+#
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Optional
+
+import numpy
+
+from Constants import Constants
+from StageProfiler import StageProfiler
+from SyntheticFlatGenerator import SyntheticFlatGenerator
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class Benchmark:
+
+    COMBINE_METHODS = {"mean": Constants.COMBINE_MEAN,
+                       "median": Constants.COMBINE_MEDIAN,
+                       "minmax": Constants.COMBINE_MINMAX,
+                       "sigma": Constants.COMBINE_SIGMA_CLIP}
+    CALIBRATION_MODES = ["pedestal", "file", "overscan", "auto", "auto-scaled-dark", "auto-synthesized-bias"]
+    GROUP_WORKERS = [1, 2, 4]
+    FILTER_NAMES = ["Lum", "Red", "Green", "Blue", "Ha", "OIII", "SII", "Clear"]
+    FLAT_EXPOSURE = 2.0
+    DARK_EXPOSURES = [2.0, 30.0]
+    BIAS_FRAMES = 5
+
+    def __init__(self, options):
+        """
+        Initialize the benchmarks
+        :param options:     Parsed command-line options
+        """
+        self._options = options
+        self._directory = ""
+
+    @staticmethod
+    def make_argument_parser() -> ArgumentParser:
+        parser = ArgumentParser(description="Benchmark the combination of synthetic flat frames")
+        parser.add_argument("--frames", type=int, default=16, help="Frames in each stack (default 16)")
+        parser.add_argument("--width", type=int, default=1024, help="Frame width in pixels (default 1024)")
+        parser.add_argument("--height", type=int, default=1024, help="Frame height in pixels (default 1024)")
+        parser.add_argument("--binning", type=int, default=1, help="Binning recorded in the files (default 1)")
+        parser.add_argument("--noise", type=float, default=50.0, help="Read noise in ADUs (default 50)")
+        parser.add_argument("--hot-pixels", type=int, default=100, help="Hot pixels per frame (default 100)")
+        parser.add_argument("--vignetting", type=float, default=0.3,
+                            help="Fraction of the light lost in the corners (default 0.3)")
+        parser.add_argument("--groups", type=int, default=4,
+                            help="Filter groups in the grouped benchmarks, at most 8 (default 4)")
+        parser.add_argument("--repeats", type=int, default=3, help="Times each benchmark is run (default 3)")
+        parser.add_argument("--seed", type=int, default=1, help="Random seed for the frames (default 1)")
+        parser.add_argument("--only", type=str, nargs="*", metavar="<name>",
+                            help="Run only the benchmarks whose names start with one of these")
+        parser.add_argument("--output", type=str, metavar="<JSON file>",
+                            help="File to receive the results (default benchmark-<date>-<time>.json)")
+        parser.add_argument("--compare", type=str, metavar="<JSON file>",
+                            help="Results of an earlier run to compare with")
+        parser.add_argument("--keep", action="store_true", help="Keep the generated files, and list where")
+        return parser
+
+    def validate_options(self) -> bool:
+        options = self._options
+        valid = True
+        for (name, value) in [("frames", options.frames), ("height", options.height), ("binning", options.binning),
+                              ("repeats", options.repeats)]:
+            if value < 1:
+                print(f"Number of {name} must be > 0, not {value}")
+                valid = False
+        if options.width <= SyntheticFlatGenerator.OVERSCAN_COLUMNS:
+            print(f"Width must be > {SyntheticFlatGenerator.OVERSCAN_COLUMNS}, "
+                  f"the width of the overscan strip, not {options.width}")
+            valid = False
+        if not 1 <= options.groups <= len(self.FILTER_NAMES):
+            print(f"Number of groups must be 1 to {len(self.FILTER_NAMES)}, not {options.groups}")
+            valid = False
+        if options.compare is not None and not os.path.isfile(options.compare):
+            print(f"Results to compare with not found: {options.compare}")
+            valid = False
+        return valid
+
+    def benchmark_names(self) -> [str]:
+        """
+        Get the names of the benchmarks to be run, as selected by the --only option
+        :return:    Names, in the order they are run
+        """
+        names = [f"combine-{method}" for method in self.COMBINE_METHODS] \
+            + [f"calibrate-{mode}" for mode in self.CALIBRATION_MODES] \
+            + [f"groups-{workers}-workers" for workers in self.GROUP_WORKERS]
+        if self._options.only:
+            names = [name for name in names if any(name.startswith(prefix) for prefix in self._options.only)]
+        return names
+
+    def run(self) -> bool:
+        """
+        Generate the files, run the benchmarks, and report and save the results
+        :return:    True if the options were valid and every benchmark ran
+        """
+        if not self.validate_options():
+            return False
+        names = self.benchmark_names()
+        if len(names) == 0:
+            print("No benchmarks selected")
+            return False
+        self._directory = tempfile.mkdtemp(prefix="MasterFlatMaker-benchmark-")
+        try:
+            start_time = time.perf_counter()
+            self.generate_files()
+            print(f"Generated files in {time.perf_counter() - start_time:.1f} seconds")
+            results = []
+            context = multiprocessing.get_context("spawn")
+            for name in names:
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    result = executor.submit(Benchmark.run_benchmark, name, self._directory,
+                                             vars(self._options)).result()
+                results.append(result)
+                self.print_result(result)
+        finally:
+            if self._options.keep:
+                print(f"Generated files kept in {self._directory}")
+            else:
+                shutil.rmtree(self._directory, ignore_errors=True)
+        report = {"created": datetime.now().isoformat(timespec="seconds"),
+                  "platform": platform.platform(),
+                  "python": platform.python_version(),
+                  "numpy": numpy.__version__,
+                  "cpu_count": os.cpu_count(),
+                  "options": {key: value for (key, value) in vars(self._options).items()
+                              if key not in ("only", "output", "compare", "keep")},
+                  "results": results}
+        output_path = self._options.output if self._options.output is not None \
+            else f"benchmark-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+        with open(output_path, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+        print(f"Results saved in {output_path}")
+        if self._options.compare is not None:
+            self.compare_results(report, self._options.compare)
+        return True
+
+    def generate_files(self):
+        """
+        Write the flat stacks and the calibration library the benchmarks use
+        """
+        options = self._options
+        generator = SyntheticFlatGenerator(options.seed, options.width, options.height, options.binning,
+                                           noise=options.noise, hot_pixels=options.hot_pixels,
+                                           vignetting=options.vignetting)
+        for filter_name in self.FILTER_NAMES[:options.groups]:
+            generator.write_flat_stack(os.path.join(self._directory, "flats"), options.frames,
+                                       filter_name, self.FLAT_EXPOSURE)
+        calibration_paths = generator.write_calibration_library(os.path.join(self._directory, "calibration"),
+                                                                self.BIAS_FRAMES, self.DARK_EXPOSURES)
+        # A single bias frame for the fixed-file calibration
+        shutil.copy(calibration_paths[0], os.path.join(self._directory, "fixed-bias.fit"))
+
+    @classmethod
+    def run_benchmark(cls, name: str, directory: str, options: dict) -> dict:
+        """
+        Run one benchmark, repeatedly, and measure it.  Runs in a process of its own.
+        :param name:        Name of the benchmark
+        :param directory:   Directory holding the generated files
+        :param options:     Command-line options, as a dictionary
+        :return:            Dictionary of the benchmark's measurements
+        """
+        # Imported here so their import time and memory are outside the measurements
+        from Calibrator import Calibrator
+        from ConsoleBuffer import ConsoleBuffer
+        from FileCombiner import FileCombiner
+        from ImageMath import ImageMath
+        from RmFitsUtil import RmFitsUtil
+        from SessionController import SessionController
+
+        data_model = cls.make_data_model(directory, options)
+        flats_directory = os.path.join(directory, "flats")
+        all_flats = sorted(os.path.join(flats_directory, f) for f in os.listdir(flats_directory))
+        stack = [path for path in all_flats if os.path.basename(path).startswith(f"flat-{cls.FILTER_NAMES[0]}-")]
+        console = ConsoleBuffer()
+        session_controller = SessionController()
+        benchmark: callable
+        if name.startswith("combine-"):
+            method = name[len("combine-"):]
+            data_model.set_master_combine_method(cls.COMBINE_METHODS[method])
+            calibrator = Calibrator(data_model)
+            combine_function = {"mean": lambda: ImageMath.combine_mean(stack, calibrator, console,
+                                                                        session_controller),
+                                "median": lambda: ImageMath.combine_median(stack, calibrator, console,
+                                                                            session_controller),
+                                "minmax": lambda: ImageMath.combine_min_max_clip(stack, 2, calibrator, console,
+                                                                                 session_controller),
+                                "sigma": lambda: ImageMath.combine_sigma_clip(stack, 2.0, calibrator, console,
+                                                                              session_controller)}[method]
+            benchmark = combine_function
+            input_files = stack
+        elif name.startswith("calibrate-"):
+            cls.set_calibration_mode(data_model, name[len("calibrate-"):], directory, options)
+            calibrator = Calibrator(data_model)
+            descriptors = RmFitsUtil.make_file_descriptions(stack)
+            file_data = numpy.asarray(RmFitsUtil.read_all_files_data(stack))
+            benchmark = lambda: calibrator.calibrate_images(file_data, descriptors, console, session_controller)
+            input_files = stack
+        else:
+            workers = int(name.split("-")[1])
+            data_model.set_group_by_filter(True)
+            data_model.set_concurrent_groups(workers)
+            descriptors = RmFitsUtil.make_file_descriptions(all_flats)
+            output_directory = os.path.join(directory, f"output-{name}")
+            file_combiner = FileCombiner(session_controller, lambda path: None)
+            benchmark = lambda: file_combiner.process_groups(data_model, descriptors, output_directory, console)
+            input_files = all_flats
+
+        baseline_bytes = StageProfiler.peak_memory_bytes()
+        timings: [float] = []
+        for repeat in range(options["repeats"]):
+            start_time = time.perf_counter()
+            benchmark()
+            timings.append(time.perf_counter() - start_time)
+            console.take_lines()
+        megapixels = len(input_files) * options["width"] * options["height"] / 1e6
+        peak_bytes = StageProfiler.peak_memory_bytes()
+        megabyte = 1024 * 1024
+        return {"name": name,
+                "files": len(input_files),
+                "megapixels": round(megapixels, 3),
+                "best_seconds": round(min(timings), 6),
+                "first_seconds": round(timings[0], 6),
+                "megapixels_per_second": round(megapixels / min(timings), 3),
+                "peak_memory_mb": round(peak_bytes / megabyte, 1),
+                "memory_growth_mb": round((peak_bytes - baseline_bytes) / megabyte, 1),
+                "worker_peak_memory_mb": round(cls.children_peak_memory_bytes() / megabyte, 1)}
+
+    @classmethod
+    def make_data_model(cls, directory: str, options: dict):
+        """
+        Make a data model with the default preferences, not the user's, so runs are comparable
+        :param directory:   Directory holding the generated files, which receives the preferences file
+        :param options:     Command-line options, as a dictionary
+        :return:            Data model with no calibration and no grouping
+        """
+        from DataModel import DataModel
+        from JsonSettings import JsonSettings
+        from Preferences import Preferences
+        data_model = DataModel(Preferences(JsonSettings(os.path.join(directory, f"preferences-{os.getpid()}.json"))))
+        data_model.set_precalibration_type(Constants.CALIBRATION_NONE)
+        data_model.set_group_by_size(False)
+        data_model.set_group_by_temperature(False)
+        data_model.set_group_by_exposure(False)
+        data_model.set_group_by_filter(False)
+        data_model.set_ignore_groups_fewer_than(False)
+        data_model.set_input_file_disposition(Constants.INPUT_DISPOSITION_NOTHING)
+        data_model.set_resume_groups(False)
+        data_model.set_concurrent_groups(1)
+        data_model.set_worker_memory_megabytes(0)
+        data_model.set_maximum_memory_megabytes(0)
+        data_model.set_master_combine_method(Constants.COMBINE_SIGMA_CLIP)
+        data_model.set_sigma_clip_threshold(2.0)
+        data_model.set_bias_cache_directory(os.path.join(directory, f"bias-cache-{os.getpid()}"))
+        return data_model
+
+    @classmethod
+    def set_calibration_mode(cls, data_model, mode: str, directory: str, options: dict):
+        """
+        Set the data model's calibration to one of the benchmarked modes
+        :param data_model:  Data model to be set
+        :param mode:        Name of the mode, one of CALIBRATION_MODES
+        :param directory:   Directory holding the generated files
+        :param options:     Command-line options, as a dictionary
+        """
+        if mode == "pedestal":
+            data_model.set_precalibration_type(Constants.CALIBRATION_PEDESTAL)
+            data_model.set_precalibration_pedestal(int(SyntheticFlatGenerator.BIAS_LEVEL))
+        elif mode == "file":
+            data_model.set_precalibration_type(Constants.CALIBRATION_FIXED_FILE)
+            data_model.set_precalibration_fixed_path(os.path.join(directory, "fixed-bias.fit"))
+        elif mode == "overscan":
+            data_model.set_precalibration_type(Constants.CALIBRATION_OVERSCAN)
+            data_model.set_overscan_rectangle((options["width"] - SyntheticFlatGenerator.OVERSCAN_COLUMNS,
+                                               options["width"], 0, options["height"]))
+            data_model.set_overscan_trim(False)
+        else:
+            data_model.set_precalibration_type(Constants.CALIBRATION_AUTO_DIRECTORY)
+            data_model.set_precalibration_auto_directory(os.path.join(directory, "calibration"))
+            data_model.set_auto_directory_recursive(False)
+            data_model.set_auto_directory_bias_only(False)
+            data_model.set_display_auto_select_results(False)
+            data_model.set_auto_directory_scale_dark(mode == "auto-scaled-dark")
+            data_model.set_auto_directory_synthesize_bias(mode == "auto-synthesized-bias")
+
+    @staticmethod
+    def children_peak_memory_bytes() -> int:
+        """
+        Get the peak resident memory of the largest finished child process (group workers) of this one
+        :return:    Peak memory in bytes, or 0 if there were none or it can't be measured
+        """
+        if resource is None:
+            return 0
+        peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+    @staticmethod
+    def print_result(result: dict):
+        print(f"{result['name']:<32} {result['megapixels_per_second']:9.1f} MP/s  "
+              f"best {result['best_seconds']:8.3f} s  first {result['first_seconds']:8.3f} s  "
+              f"peak {result['peak_memory_mb']:8.1f} MB (+{result['memory_growth_mb']:.1f})"
+              + (f"  workers {result['worker_peak_memory_mb']:.1f} MB" if result["worker_peak_memory_mb"] > 0 else ""))
+
+    @staticmethod
+    def compare_results(report: dict, earlier_path: str):
+        """
+        Compare the results of this run with those of an earlier one, benchmark by benchmark
+        :param report:          Results of this run
+        :param earlier_path:    Path of the JSON results of the earlier run
+        """
+        try:
+            with open(earlier_path, "r") as earlier_file:
+                earlier = json.load(earlier_file)
+            earlier_results = {result["name"]: result for result in earlier["results"]}
+        except (OSError, ValueError, KeyError, TypeError) as exception:
+            print(f"Unable to read earlier results {earlier_path}: {exception}")
+            return
+        if earlier.get("options") != report["options"]:
+            print("Note: the earlier run used different options, so its results may not be comparable")
+        print(f"Compared with {earlier_path} ({earlier.get('created', 'unknown date')}):")
+        for result in report["results"]:
+            previous: Optional[dict] = earlier_results.get(result["name"])
+            if previous is None:
+                print(f"   {result['name']:<32} not in the earlier run")
+                continue
+            speed_ratio = result["megapixels_per_second"] / previous["megapixels_per_second"] \
+                if previous["megapixels_per_second"] > 0 else 0.0
+            memory_change = result["peak_memory_mb"] - previous["peak_memory_mb"]
+            print(f"   {result['name']:<32} speed x{speed_ratio:.2f}  peak memory {memory_change:+.1f} MB")
+
+
+if __name__ == "__main__":
+    succeeded = Benchmark(Benchmark.make_argument_parser().parse_args()).run()
+    sys.exit(0 if succeeded else 1)
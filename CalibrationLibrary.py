@@ -0,0 +1,132 @@
+#
+#   Process-wide index of the calibration files in auto-calibration directories.
+#   Reading the FITS headers of a large calibration library is the slow part of starting an
+#   auto-directory calibration, so the descriptors are remembered here, by path, and re-used as long
+#   as the file on disk is unchanged (same modification time and size).  Decoded calibration frames
+#   are also kept, up to a memory limit, so a frame read once (or pre-loaded in the background
+#   by the GUI) need not be read again by the next session.
+#
+#   Everything is held at class level and guarded by a mutex, since the GUI fills the index
+#   from a background thread while a combination session may be reading it from another.
+#
+import os
+import threading
+from collections import OrderedDict
+
+from numpy import ndarray
+
+from Constants import Constants
+from FileDescriptor import FileDescriptor
+from RmFitsUtil import RmFitsUtil
+from SharedUtils import SharedUtils
+
+
+class CalibrationLibrary:
+    _mutex = threading.Lock()
+    # Path to (modification time, size, descriptor) for every file whose header has been read
+    _descriptors: {str: (int, int, FileDescriptor)} = {}
+    # Path to (modification time, size, pixels), in least-recently-used order
+    _frames: OrderedDict = OrderedDict()
+    _frame_bytes: int = 0
+    _maximum_frame_bytes: int = Constants.CALIBRATION_LIBRARY_MEGABYTES * 1024 * 1024
+
+    @classmethod
+    def directory_descriptors(cls, directory_path: str, recursive: bool) -> [FileDescriptor]:
+        """
+        Get file-descriptors for all the FITS files in the specified directory, reading the
+        headers only of files that are new or have changed since they were last indexed
+        :param directory_path:  Absolute path to directory to be scanned
+        :param recursive:       If True, also recursively scan all sub-directories
+        :return:                Array of file descriptors for contents
+        """
+        paths: [str] = SharedUtils.files_in_directory(directory_path, recursive)
+        return [cls.file_descriptor(path) for path in paths]
+
+    @classmethod
+    def file_descriptor(cls, path: str) -> FileDescriptor:
+        """
+        Get the descriptor of one calibration file, from the index if it is still current
+        :param path:    Absolute path to the file
+        :return:        Descriptor of the file
+        """
+        (modified, size) = cls.file_signature(path)
+        cls._mutex.acquire()
+        entry = cls._descriptors.get(path)
+        cls._mutex.release()
+        if entry is not None and entry[0] == modified and entry[1] == size:
+            return entry[2]
+        descriptor = RmFitsUtil.make_file_descriptor(path)
+        cls._mutex.acquire()
+        cls._descriptors[path] = (modified, size, descriptor)
+        cls._mutex.release()
+        return descriptor
+
+    @classmethod
+    def frame_data(cls, path: str) -> ndarray:
+        """
+        Get the pixel data of a calibration file, from memory if it has already been read
+        and is still current.  The returned matrix is shared, so it is marked read-only.
+        :param path:    Absolute path to the file
+        :return:        Matrix of pixel values of the file
+        """
+        (modified, size) = cls.file_signature(path)
+        cls._mutex.acquire()
+        entry = cls._frames.get(path)
+        if entry is not None and entry[0] == modified and entry[1] == size:
+            cls._frames.move_to_end(path)
+            cls._mutex.release()
+            return entry[2]
+        cls._mutex.release()
+
+        frame = RmFitsUtil.fits_data_from_path(path)
+        frame.flags.writeable = False
+        cls._mutex.acquire()
+        if path in cls._frames:
+            cls._frame_bytes -= cls._frames.pop(path)[2].nbytes
+        cls._frames[path] = (modified, size, frame)
+        cls._frame_bytes += frame.nbytes
+        cls.drop_frames_over_limit()
+        cls._mutex.release()
+        return frame
+
+    @classmethod
+    def set_maximum_megabytes(cls, megabytes: int):
+        """
+        Set how much memory the decoded frames may use, dropping frames at once if now over it
+        :param megabytes:   Limit on the total size of the frames held, in megabytes
+        """
+        cls._mutex.acquire()
+        cls._maximum_frame_bytes = megabytes * 1024 * 1024
+        cls.drop_frames_over_limit()
+        cls._mutex.release()
+
+    @classmethod
+    def drop_frames_over_limit(cls):
+        """
+        Drop least-recently used frames beyond the memory limit, but always keep the most recent one.
+        The caller must hold the mutex.
+        """
+        while cls._frame_bytes > cls._maximum_frame_bytes and len(cls._frames) > 1:
+            (_, (_, _, dropped)) = cls._frames.popitem(last=False)
+            cls._frame_bytes -= dropped.nbytes
+
+    @classmethod
+    def release_frames(cls):
+        """
+        Drop all the decoded frames held in memory, keeping the header index.  Used when the
+        calibration directory changes, since frames from the old directory won't be asked for again.
+        """
+        cls._mutex.acquire()
+        cls._frames.clear()
+        cls._frame_bytes = 0
+        cls._mutex.release()
+
+    @classmethod
+    def file_signature(cls, path: str) -> (int, int):
+        """
+        Get the values used to tell if a file has changed since it was indexed
+        :param path:    Absolute path to the file
+        :return:        Tuple of modification time (nanoseconds) and size in bytes
+        """
+        status = os.stat(path)
+        return status.st_mtime_ns, status.st_size
@@ -0,0 +1,114 @@
+#
+#   Result of planning a calibration without doing it: which calibration frames each input file
+#   will be calibrated with, which inputs could not be matched, and how much will be read.
+#   Built from FITS headers only, so it is cheap to produce before committing to a long run.
+#
+import os
+
+from Console import Console
+from FileDescriptor import FileDescriptor
+
+
+class CalibrationPlan:
+
+    def __init__(self, calibration_type: int):
+        """
+        Create an empty plan for the given calibration type
+        :param calibration_type:    Code of the calibration method that was planned
+        """
+        self._calibration_type = calibration_type
+        self._input_descriptors: [FileDescriptor] = []
+        self._frames_for_input: {str: [FileDescriptor]} = {}
+        self._missing_reasons: {str: str} = {}
+        self._frame_descriptors: {str: FileDescriptor} = {}
+
+    def get_calibration_type(self) -> int:
+        return self._calibration_type
+
+    def add_assignment(self, input_file: FileDescriptor, calibration_frames: [FileDescriptor]):
+        """
+        Record the calibration frames that will be read to calibrate a given input file
+        :param input_file:          Descriptor of the file to be calibrated
+        :param calibration_frames:  Descriptors of the calibration files that will be read for it
+        """
+        self._input_descriptors.append(input_file)
+        self._frames_for_input[input_file.get_absolute_path()] = calibration_frames
+        for frame in calibration_frames:
+            self._frame_descriptors[frame.get_absolute_path()] = frame
+
+    def add_missing(self, input_file: FileDescriptor, reason: str):
+        """
+        Record that no suitable calibration could be found for a given input file
+        :param input_file:      Descriptor of the file that can't be calibrated
+        :param reason:          Short explanation of what is missing
+        """
+        self._input_descriptors.append(input_file)
+        self._missing_reasons[input_file.get_absolute_path()] = reason
+
+    def get_input_count(self) -> int:
+        return len(self._input_descriptors)
+
+    def get_frames_for_input(self, input_path: str) -> [FileDescriptor]:
+        return self._frames_for_input.get(input_path, [])
+
+    def get_missing(self) -> {str: str}:
+        """
+        Get the inputs for which no calibration was found
+        :return:    Dictionary of input path to the reason it has no match
+        """
+        return self._missing_reasons
+
+    def get_distinct_frames(self) -> [FileDescriptor]:
+        """
+        Get the distinct calibration files that will be read, each of which is read only once
+        :return:    List of descriptors, sorted by path
+        """
+        return [self._frame_descriptors[path] for path in sorted(self._frame_descriptors)]
+
+    def get_inputs_sharing_frames(self) -> {str: [str]}:
+        """
+        Get, for each distinct calibration file, the input files that it will calibrate
+        :return:    Dictionary of calibration file path to list of input file paths
+        """
+        sharing: {str: [str]} = {path: [] for path in self._frame_descriptors}
+        for (input_path, frames) in self._frames_for_input.items():
+            for frame in frames:
+                sharing[frame.get_absolute_path()].append(input_path)
+        return sharing
+
+    def get_estimated_bytes_read(self) -> int:
+        """
+        Estimate how many bytes of calibration data will be read from disk
+        :return:    Total size of the distinct calibration files
+        """
+        return sum(os.path.getsize(path) for path in self._frame_descriptors)
+
+    def get_estimated_bytes_in_memory(self) -> int:
+        """
+        Estimate how much memory the decoded calibration frames will occupy, since each is
+        held in memory, as 8-byte floating point pixels, once it has been read
+        :return:    Total bytes of the decoded distinct calibration frames
+        """
+        return sum(d.get_x_dimension() * d.get_y_dimension() * 8 for d in self._frame_descriptors.values())
+
+    def describe(self, console: Console):
+        """
+        Write a readable report of the plan to the given console
+        :param console:     Redirectable console output object
+        """
+        megabyte = 1024.0 * 1024.0
+        console.push_level()
+        console.message(f"{self.get_input_count()} input files, "
+                        f"{len(self._frame_descriptors)} distinct calibration files, "
+                        f"{len(self._missing_reasons)} inputs with no match", +1)
+        console.message(f"Estimated {self.get_estimated_bytes_read() / megabyte:.1f} MB read from disk, "
+                        f"{self.get_estimated_bytes_in_memory() / megabyte:.1f} MB decoded in memory", 0)
+        sharing = self.get_inputs_sharing_frames()
+        for frame in self.get_distinct_frames():
+            input_paths = sharing[frame.get_absolute_path()]
+            console.message(f"{frame.get_name()} ({frame.get_exposure():.1f}s at {frame.get_temperature():.1f} C)"
+                            f" used by {len(input_paths)} files", 0)
+            console.message(", ".join(os.path.basename(path) for path in input_paths), +1, temp=True)
+        for (input_path, reason) in self._missing_reasons.items():
+            console.message(f"No match for {os.path.basename(input_path)}: {reason}", 0)
+        console.pop_level()
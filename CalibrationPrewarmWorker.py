@@ -0,0 +1,81 @@
+#
+#   Object that pre-loads the auto-calibration directory into the calibration library, run as a
+#   sub-thread of the GUI as soon as the directory is known.  The directory's FITS headers are indexed
+#   and, optionally, the calibration frames that the loaded files would be calibrated with are read,
+#   so that when the user clicks Combine the calibration can start immediately.
+#   This is only a head start: any problem found here is ignored, and will be reported properly
+#   by the combination session if it still exists then.
+#
+
+import os
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from CalibrationLibrary import CalibrationLibrary
+from Calibrator import Calibrator
+from DataModel import DataModel
+from FileDescriptor import FileDescriptor
+from SessionController import SessionController
+from SharedUtils import SharedUtils
+
+
+class CalibrationPrewarmWorker(QObject):
+
+    #   Signals emitted from the thread
+
+    finished = pyqtSignal()             # Tell interested parties that we are finished
+
+    def __init__(self, data_model: DataModel,
+                 descriptors: [FileDescriptor],
+                 decode_frames: bool,
+                 session_controller: SessionController):
+        """
+        Initialize the prewarm worker object
+        :param data_model:          Snapshot of the data model giving the auto-directory options
+        :param descriptors:         Files loaded so far, used to pick which frames are worth reading
+        :param decode_frames:       Read the matching calibration frames, not just the headers
+        :param session_controller:  Session controller, used to stop the prewarm early
+        """
+        QObject.__init__(self)
+        self._data_model = data_model
+        self._descriptors = descriptors
+        self._decode_frames = decode_frames
+        self._session_controller = session_controller
+
+    def run_prewarm(self):
+        """
+        Index the calibration directory and, if requested, read the likely calibration frames
+        """
+        try:
+            directory_path = self._data_model.get_precalibration_auto_directory()
+            paths = SharedUtils.files_in_directory(directory_path,
+                                                   self._data_model.get_auto_directory_recursive())
+            for path in paths:
+                if self._session_controller.thread_cancelled():
+                    break
+                CalibrationLibrary.file_descriptor(path)
+            if self._decode_frames and len(self._descriptors) > 0:
+                for frame in self.likely_frames():
+                    if self._session_controller.thread_cancelled():
+                        break
+                    CalibrationLibrary.frame_data(frame.get_absolute_path())
+        except Exception:
+            # Unreadable or vanished files, or no suitable match: the combination will report these
+            pass
+        self.finished.emit()
+
+    def likely_frames(self) -> [FileDescriptor]:
+        """
+        Get the calibration frames the loaded files would be calibrated with.  Raw bias frames
+        that would be median-combined into a synthesized master are left out, since they are read
+        only once, for the synthesis; a master bias already saved in the bias cache is included.
+        :return:    Descriptors of the distinct calibration frames worth reading in advance
+        """
+        plan = Calibrator(self._data_model).plan_calibration(self._descriptors)
+        frames = plan.get_distinct_frames()
+        if self._data_model.get_auto_directory_synthesize_bias():
+            cache_directory = os.path.normpath(self._data_model.get_bias_cache_directory())
+            frames = [d for d in frames
+                      if d.get_type() != FileDescriptor.FILE_TYPE_BIAS
+                      or os.path.dirname(d.get_absolute_path()) == cache_directory]
+        return frames
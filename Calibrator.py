@@ -1,19 +1,25 @@
 #
 #   Class to handle calibration of images using specified method (including none)
 #
+import hashlib
+import math
+import os
+import time
 from typing import Optional
 
 import numpy
 from numpy import ndarray
 
 import MasterMakerExceptions
+from CalibrationLibrary import CalibrationLibrary
+from CalibrationPlan import CalibrationPlan
 from Console import Console
 from Constants import Constants
 from DataModel import DataModel
 from FileDescriptor import FileDescriptor
 from RmFitsUtil import RmFitsUtil
 from SessionController import SessionController
-from SharedUtils import SharedUtils
+from StageProfiler import StageProfiler
 
 
 class Calibrator:
@@ -24,6 +30,46 @@ class Calibrator:
         :param data_model:      Data model giving relevant options such as calibration method
         """
         self._data_model = data_model
+        # Caches used by the scaled-dark calibration so that each calibration frame is read, and each
+        # dark current rate computed, only once per calibrator.  Only the most recent scaled dark is kept:
+        # flat exposures vary through a session, so it is re-used only while the exposure repeats
+        self._calibration_frames: {str: ndarray} = {}
+        self._dark_current_frames: {(str, str): ndarray} = {}
+        self._last_scaled_dark_key: Optional[(str, str, float)] = None
+        self._last_scaled_dark_frame: Optional[ndarray] = None
+        # When a large group is combined a band of rows at a time: (first row, row after the last, rows in
+        # the whole image) of the band the images being calibrated hold.  None when they are whole images.
+        self._row_band: Optional[(int, int, int)] = None
+
+    def set_row_band(self, row_start: int, row_end: int, image_rows: int):
+        """
+        Calibrate bands of rows from now on, rather than whole images: the images given to
+        calibrate_images will hold only the given rows, and only those rows of the calibration frames are used
+        :param row_start:   First row of the band
+        :param row_end:     Row after the last row of the band
+        :param image_rows:  Number of rows in the whole image
+        """
+        self._row_band = (row_start, row_end, image_rows)
+
+    def clear_row_band(self):
+        """
+        Calibrate whole images from now on
+        """
+        self._row_band = None
+
+    def band_of_frame(self, calibration_image: ndarray) -> ndarray:
+        """
+        Get the rows of a whole calibration frame matching the band of rows being calibrated
+        :param calibration_image:   Matrix of pixel values of the whole calibration frame
+        :return:                    The band's rows of the frame, or the whole frame if not calibrating a band
+        """
+        if self._row_band is None:
+            return calibration_image
+        (row_start, row_end, image_rows) = self._row_band
+        # Compare the whole frame's height with the whole image's, since any taller frame has the band's rows
+        if calibration_image.shape[0] != image_rows:
+            raise MasterMakerExceptions.IncompatibleSizes
+        return calibration_image[row_start:row_end]
 
     def calibrate_images(self,
                          file_data: [ndarray],
@@ -39,28 +85,35 @@ class Calibrator:
         :param session_controller:  Controller for this subtask
         :return:                    List of calibrated images, same format as input file_data
         """
-        assert len(descriptors) > 0
-        calibration_type = self._data_model.get_precalibration_type()
-        if calibration_type == Constants.CALIBRATION_NONE:
-            # We're actually not doing calibration, return original images
-            return file_data
-        elif calibration_type == Constants.CALIBRATION_PEDESTAL:
-            return self.calibrate_with_pedestal(file_data,
-                                                self._data_model.get_precalibration_pedestal(),
+        with StageProfiler.stage("calibrate"):
+            assert len(descriptors) > 0
+            calibration_type = self._data_model.get_precalibration_type()
+            if calibration_type == Constants.CALIBRATION_NONE:
+                # We're actually not doing calibration, return original images
+                return file_data
+            elif calibration_type == Constants.CALIBRATION_PEDESTAL:
+                return self.calibrate_with_pedestal(file_data,
+                                                    self._data_model.get_precalibration_pedestal(),
+                                                    console,
+                                                    session_controller)
+            elif calibration_type == Constants.CALIBRATION_FIXED_FILE:
+                return self.calibrate_with_file(file_data,
+                                                self._data_model.get_precalibration_fixed_path(),
                                                 console,
                                                 session_controller)
-        elif calibration_type == Constants.CALIBRATION_FIXED_FILE:
-            return self.calibrate_with_file(file_data,
-                                            self._data_model.get_precalibration_fixed_path(),
-                                            console,
-                                            session_controller)
-        else:
-            assert calibration_type == Constants.CALIBRATION_AUTO_DIRECTORY
-            return self.calibrate_with_auto_directory(file_data,
-                                                      self._data_model.get_precalibration_auto_directory(),
-                                                      descriptors,
-                                                      console,
-                                                      session_controller)
+            elif calibration_type == Constants.CALIBRATION_OVERSCAN:
+                return self.calibrate_with_overscan(file_data,
+                                                    self._data_model.get_overscan_rectangle(),
+                                                    self._data_model.get_overscan_trim(),
+                                                    console,
+                                                    session_controller)
+            else:
+                assert calibration_type == Constants.CALIBRATION_AUTO_DIRECTORY
+                return self.calibrate_with_auto_directory(file_data,
+                                                          self._data_model.get_precalibration_auto_directory(),
+                                                          descriptors,
+                                                          console,
+                                                          session_controller)
 
     def calibrate_with_pedestal(self,
                                 file_data: [ndarray],
@@ -105,7 +158,7 @@ class Calibrator:
         """
         console.message(f"Calibrate with file: {calibration_file_path}", 0)
         result = file_data.copy()
-        calibration_image = RmFitsUtil.fits_data_from_path(calibration_file_path)
+        calibration_image = self.band_of_frame(RmFitsUtil.fits_data_from_path(calibration_file_path))
         (calibration_x, calibration_y) = calibration_image.shape
         for index in range(len(result)):
             if session_controller.thread_cancelled():
@@ -117,6 +170,58 @@ class Calibrator:
             result[index] = difference.clip(0, 0xFFFF)
         return result
 
+    def calibrate_with_overscan(self,
+                                file_data: [ndarray],
+                                overscan_rectangle: (int, int, int, int),
+                                trim: bool,
+                                console: Console,
+                                session_controller: SessionController
+                                ) -> [ndarray]:
+        """
+        Calibrate given set of images using the camera's overscan strip: for each row, the median
+        of the row's pixels in the overscan columns estimates that row's bias, and is subtracted from
+        the whole row (clipping at zero).  Rows above or below the overscan rectangle use the estimate
+        of the nearest rectangle row.  All the images are processed at once, as one 3-d array.
+        No calibration files are needed.
+        :param file_data:               List of images' data. Each is 2d image matrix
+        :param overscan_rectangle:      Overscan region: (x_start, x_end, y_start, y_end), ends excluded
+        :param trim:                    Remove the overscan columns from the calibrated images?
+        :param console:                 Redirectable console output object
+        :param session_controller:      Controller for this subtask
+        :return:                        List of calibrated images
+        """
+        (x_start, x_end, y_start, y_end) = overscan_rectangle
+        console.message(f"Calibrate with overscan columns {x_start}-{x_end - 1}, rows {y_start}-{y_end - 1}", 0)
+        if self._row_band is not None:
+            # Bands are only used when the overscan rectangle covers every row (FileGroup.may_combine_in_bands),
+            # so each of the band's rows is estimated from its own overscan pixels
+            (row_start, row_end, image_rows) = self._row_band
+            assert y_start == 0 and y_end == image_rows
+            (y_start, y_end) = (0, row_end - row_start)
+        # Images of differing sizes can't be stacked
+        if any(image.shape != file_data[0].shape for image in file_data):
+            raise MasterMakerExceptions.IncompatibleSizes
+        image_stack = numpy.asarray(file_data, dtype=float)
+        (_, y_size, x_size) = image_stack.shape
+        if not (0 <= x_start < x_end <= x_size and 0 <= y_start < y_end <= y_size):
+            raise MasterMakerExceptions.InvalidOverscanRegion
+        if session_controller.thread_cancelled():
+            raise MasterMakerExceptions.SessionCancelled
+
+        # Median across the strip's columns gives one bias estimate per (image, row)
+        strip_estimates = numpy.median(image_stack[:, y_start:y_end, x_start:x_end], axis=2)
+        row_estimates = numpy.empty(image_stack.shape[0:2])
+        row_estimates[:, y_start:y_end] = strip_estimates
+        row_estimates[:, :y_start] = strip_estimates[:, :1]
+        row_estimates[:, y_end:] = strip_estimates[:, -1:]
+
+        calibrated = (image_stack - row_estimates[:, :, numpy.newaxis]).clip(0, 0xFFFF)
+        if trim:
+            calibrated = numpy.delete(calibrated, numpy.s_[x_start:x_end], axis=2)
+        if session_controller.thread_cancelled():
+            raise MasterMakerExceptions.SessionCancelled
+        return calibrated
+
     def calibrate_with_auto_directory(self,
                                       file_data: [ndarray],
                                       auto_directory_path: str,
@@ -149,6 +254,10 @@ class Calibrator:
             # No files in that directory, raise exception
             raise MasterMakerExceptions.AutoCalibrationDirectoryEmpty(auto_directory_path)
 
+        if self._data_model.get_auto_directory_scale_dark():
+            return self.calibrate_with_scaled_dark(file_data, directory_files, descriptors,
+                                                   console, session_controller)
+
         console.push_level()
         console.message(f"Calibrating from directory containing {len(directory_files)} files.", +1)
         result = file_data.copy()
@@ -156,12 +265,23 @@ class Calibrator:
             if session_controller.thread_cancelled():
                 raise MasterMakerExceptions.SessionCancelled
             this_file: FileDescriptor = descriptors[input_index]
-            calibration_file = self.get_best_calibration_file(directory_files,
-                                                              this_file,
-                                                              session_controller, console)
-            if session_controller.thread_cancelled():
-                raise MasterMakerExceptions.SessionCancelled
-            calibration_image = RmFitsUtil.fits_data_from_path(calibration_file)
+            start_time = time.monotonic()
+            if self._data_model.get_auto_directory_synthesize_bias():
+                master_bias_key = self.synthesized_master_bias(directory_files, this_file,
+                                                               console, session_controller)
+                calibration_image = self.cached_calibration_frame(master_bias_key)
+                console.event("calibration_match", path=this_file.get_absolute_path(),
+                              bias=master_bias_key, seconds=round(time.monotonic() - start_time, 6))
+            else:
+                calibration_file = self.get_best_calibration_file(directory_files,
+                                                                  this_file,
+                                                                  session_controller, console)
+                if session_controller.thread_cancelled():
+                    raise MasterMakerExceptions.SessionCancelled
+                calibration_image = self.cached_calibration_frame(calibration_file)
+                console.event("calibration_match", path=this_file.get_absolute_path(),
+                              bias=calibration_file, seconds=round(time.monotonic() - start_time, 6))
+            calibration_image = self.band_of_frame(calibration_image)
             (calibration_x, calibration_y) = calibration_image.shape
             (layer_x, layer_y) = result[input_index].shape
             if (layer_x != calibration_x) or (layer_y != calibration_y):
@@ -171,6 +291,259 @@ class Calibrator:
         console.pop_level()
         return result
 
+    def calibrate_with_scaled_dark(self,
+                                   file_data: [ndarray],
+                                   directory_files: [FileDescriptor],
+                                   descriptors: [FileDescriptor],
+                                   console: Console,
+                                   session_controller: SessionController
+                                   ) -> [ndarray]:
+        """
+        Calibrate the given files' contents by subtracting a master bias plus a dark-current frame
+        scaled to each image's exposure time.  The bias and dark are chosen from the auto-directory
+        files by temperature, so the directory need only hold one bias and one (long) dark per
+        temperature instead of a dark for every exposure time that might be used for flats.
+        The dark current rate is computed once and cached; a scaled dark is re-used while the exposure repeats.
+        :param file_data:               List of images' data (list of 2-d matrix of pixel values)
+        :param directory_files:         Descriptors of all the files in the calibration directory
+        :param descriptors:             Descs of files corresponding to the given images
+        :param console:                 Redirectable console output object
+        :param session_controller:      Controller for this subtask
+        :return:                        List of calibrated images
+        """
+        console.push_level()
+        console.message(f"Calibrating with exposure-scaled dark from directory "
+                        f"containing {len(directory_files)} files.", +1)
+        result = file_data.copy()
+        for input_index in range(len(descriptors)):
+            if session_controller.thread_cancelled():
+                raise MasterMakerExceptions.SessionCancelled
+            this_file: FileDescriptor = descriptors[input_index]
+            start_time = time.monotonic()
+            correct_size_files = self.filter_to_correct_size(directory_files, this_file)
+            if self._data_model.get_auto_directory_synthesize_bias():
+                bias_key = self.synthesized_master_bias(correct_size_files, this_file,
+                                                        console, session_controller)
+                bias_name = "synthesized master"
+            else:
+                bias_file = self.closest_bias_match(correct_size_files, this_file.get_temperature())
+                bias_key = bias_file.get_absolute_path()
+                bias_name = f"{bias_file.get_name()} at {bias_file.get_temperature():.1f} C"
+            dark_file = self.closest_dark_match(correct_size_files, this_file.get_temperature())
+            if self._data_model.get_display_auto_select_results():
+                console.message(f"Target {this_file.get_exposure():.1f}s at {this_file.get_temperature():.1f} C,"
+                                f" bias {bias_name},"
+                                f" dark {dark_file.get_name()} ({dark_file.get_exposure():.1f}s) at"
+                                f" {dark_file.get_temperature():.1f} C", +1, temp=True)
+            calibration_image = self.band_of_frame(self.scaled_dark_frame(bias_key, dark_file,
+                                                                          this_file.get_exposure()))
+            console.event("calibration_match", path=this_file.get_absolute_path(),
+                          bias=bias_key,
+                          dark=dark_file.get_absolute_path(), exposure=this_file.get_exposure(),
+                          seconds=round(time.monotonic() - start_time, 6))
+            if session_controller.thread_cancelled():
+                raise MasterMakerExceptions.SessionCancelled
+            if calibration_image.shape != result[input_index].shape:
+                raise MasterMakerExceptions.IncompatibleSizes
+            difference = result[input_index] - calibration_image
+            result[input_index] = difference.clip(0, 0xFFFF)
+        console.pop_level()
+        return result
+
+    def closest_bias_match(self, descriptors: [FileDescriptor],
+                           target_temperature: float) -> FileDescriptor:
+        """
+        From the given correct-sized calibration files, find the bias frame closest in temperature
+        Exceptions thrown:
+            NoSuitableAutoBias
+        :param descriptors:             Descriptions of potential calibration files
+        :param target_temperature:      CCD temperature of the image to be calibrated
+        :return:                        Description of the best-matching bias file
+        """
+        d: FileDescriptor
+        bias_files = [d for d in descriptors if d.get_type() == FileDescriptor.FILE_TYPE_BIAS]
+        if len(bias_files) == 0:
+            raise MasterMakerExceptions.NoSuitableAutoBias
+        temperature_differences = numpy.abs(numpy.array([d.get_temperature() for d in bias_files])
+                                            - target_temperature)
+        return bias_files[int(numpy.argmin(temperature_differences))]
+
+    def closest_dark_match(self, descriptors: [FileDescriptor],
+                           target_temperature: float) -> FileDescriptor:
+        """
+        From the given correct-sized calibration files, find the dark frame closest in temperature.
+        Among equally-close darks, the longest exposure is used since it measures the dark current
+        rate with the least noise.
+        Exceptions thrown:
+            NoSuitableAutoDark
+        :param descriptors:             Descriptions of potential calibration files
+        :param target_temperature:      CCD temperature of the image to be calibrated
+        :return:                        Description of the best-matching dark file
+        """
+        d: FileDescriptor
+        dark_files = [d for d in descriptors
+                      if d.get_type() == FileDescriptor.FILE_TYPE_DARK and d.get_exposure() > 0]
+        if len(dark_files) == 0:
+            raise MasterMakerExceptions.NoSuitableAutoDark
+        temperature_differences = numpy.abs(numpy.array([d.get_temperature() for d in dark_files])
+                                            - target_temperature)
+        exposures = numpy.array([d.get_exposure() for d in dark_files])
+        # lexsort uses the last key as the primary sort key
+        best_index = numpy.lexsort((-exposures, temperature_differences))[0]
+        return dark_files[int(best_index)]
+
+    def scaled_dark_frame(self, bias_path: str,
+                          dark_file: FileDescriptor,
+                          exposure: float) -> ndarray:
+        """
+        Get the calibration frame for the given exposure: the bias plus the dark current rate
+        scaled to the exposure.  The dark current rate is cached, and the last scaled frame is kept
+        so a run of files with the same exposure computes it only once.
+        :param bias_path:       Path (or synthesized-master key) of the master bias frame
+        :param dark_file:       Description of the dark frame used to measure the dark current
+        :param exposure:        Exposure time, in seconds, of the image to be calibrated
+        :return:                Calibration frame to be subtracted from the image
+        """
+        dark_path = dark_file.get_absolute_path()
+        cache_key = (bias_path, dark_path, round(exposure, 3))
+        if cache_key != self._last_scaled_dark_key:
+            dark_current_key = (bias_path, dark_path)
+            if dark_current_key not in self._dark_current_frames:
+                bias_image = self.cached_calibration_frame(bias_path)
+                dark_image = self.cached_calibration_frame(dark_path)
+                if bias_image.shape != dark_image.shape:
+                    raise MasterMakerExceptions.IncompatibleSizes
+                # Dark current in ADUs per second.  Don't clip at zero: negative values are noise
+                # that averages out, and clipping would bias the scaled result upward
+                self._dark_current_frames[dark_current_key] = (dark_image - bias_image) / dark_file.get_exposure()
+            # Drop the previous frame before computing the new one, so only one is held at a time
+            self._last_scaled_dark_frame = None
+            self._last_scaled_dark_frame = self.cached_calibration_frame(bias_path) \
+                + self._dark_current_frames[dark_current_key] * exposure
+            self._last_scaled_dark_key = cache_key
+        return self._last_scaled_dark_frame
+
+    def cached_calibration_frame(self, path: str) -> ndarray:
+        """
+        Read the pixel data of a calibration file, reading each file only once.  Files are read
+        through the calibration library, so a frame pre-loaded by an earlier session is re-used.
+        Synthesized master frames are also held here, under their synthesis key.
+        :param path:    Absolute path to the calibration file, or key of a synthesized frame
+        :return:        Matrix of pixel values of the file
+        """
+        if path not in self._calibration_frames:
+            self._calibration_frames[path] = CalibrationLibrary.frame_data(path)
+        return self._calibration_frames[path]
+
+    def synthesized_master_bias(self, directory_files: [FileDescriptor],
+                                sample_file: FileDescriptor,
+                                console: Console,
+                                session_controller: SessionController) -> str:
+        """
+        Median-combine all the bias files in the auto directory that match the given file's size,
+        binning and temperature bucket into a master bias.  The master is kept in memory and also
+        saved in the bias cache directory, named by a hash of the contributing files (path, modification
+        time and size), so later runs with an unchanged library read one file instead of all of them.
+
+        Exceptions thrown:
+            NoSuitableAutoBias
+
+        :param directory_files:         Descriptors of the files in the calibration directory
+        :param sample_file:             Description of file to be calibrated
+        :param console:                 Redirectable console output object
+        :param session_controller:      Controller for this subtask
+        :return:                        Key under which the master is held in the calibration frame cache
+        """
+        bias_files = self.synthesis_bias_files(directory_files, sample_file)
+        bias_paths = [d.get_absolute_path() for d in bias_files]
+        (file_set_hash, cache_path) = self.synthesis_hash_and_cache_path(bias_files, sample_file)
+        master_key = f"synthesized-bias:{file_set_hash}"
+        if master_key in self._calibration_frames:
+            return master_key
+
+        bucket_temperature = self.temperature_bucket(sample_file.get_temperature()) \
+            * Constants.BIAS_SYNTHESIS_TEMPERATURE_BUCKET
+        if cache_path != "" and os.path.isfile(cache_path):
+            console.message(f"Using cached master bias of {len(bias_paths)} files"
+                            f" at {bucket_temperature:.1f} C", +1, temp=True)
+            master_bias = CalibrationLibrary.frame_data(cache_path)
+        else:
+            # Imported here because ImageMath itself imports this module
+            from ImageMath import ImageMath
+            console.message(f"Synthesizing master bias from {len(bias_paths)} files"
+                            f" at {bucket_temperature:.1f} C", +1, temp=True)
+            bias_data = RmFitsUtil.read_all_files_data(bias_paths, console)
+            if session_controller.thread_cancelled():
+                raise MasterMakerExceptions.SessionCancelled
+            if any(data.shape != bias_data[0].shape for data in bias_data):
+                raise MasterMakerExceptions.IncompatibleSizes
+            master_bias = ImageMath.median_of_images(bias_data)
+            if cache_path != "":
+                os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+                RmFitsUtil.create_calibration_cache_file(cache_path, master_bias,
+                                                         FileDescriptor.FILE_TYPE_BIAS, "Bias Frame",
+                                                         bucket_temperature, sample_file.get_binning(),
+                                                         f"Master bias median of {len(bias_paths)} files")
+        self._calibration_frames[master_key] = master_bias
+        return master_key
+
+    def synthesis_bias_files(self, directory_files: [FileDescriptor],
+                             sample_file: FileDescriptor) -> [FileDescriptor]:
+        """
+        Get the bias files that are median-combined into the master bias for the given file:
+        all those of the same size and binning, in the same temperature bucket.
+        Exceptions thrown:
+            NoSuitableAutoBias
+        :param directory_files:     Descriptors of the files in the calibration directory
+        :param sample_file:         Description of file to be calibrated
+        :return:                    Descriptors of the matching bias files, sorted by path
+        """
+        bucket = self.temperature_bucket(sample_file.get_temperature())
+        d: FileDescriptor
+        bias_files = [d for d in self.filter_to_correct_size(directory_files, sample_file)
+                      if d.get_type() == FileDescriptor.FILE_TYPE_BIAS
+                      and self.temperature_bucket(d.get_temperature()) == bucket]
+        if len(bias_files) == 0:
+            raise MasterMakerExceptions.NoSuitableAutoBias
+        return sorted(bias_files, key=lambda f: f.get_absolute_path())
+
+    def synthesis_hash_and_cache_path(self, bias_files: [FileDescriptor],
+                                      sample_file: FileDescriptor) -> (str, str):
+        """
+        Identify a synthesized master bias by the exact set of files it is made from, using
+        each file's path, modification time and size, and find where it is saved in the cache
+        :param bias_files:      Descriptors of the contributing bias files, sorted by path
+        :param sample_file:     Description of file to be calibrated
+        :return:                Tuple: hex hash of the file set, and path of the cached master
+                                (empty string if no bias cache directory is set)
+        """
+        file_set_hash = hashlib.sha1()
+        for descriptor in bias_files:
+            path = descriptor.get_absolute_path()
+            status = os.stat(path)
+            file_set_hash.update(f"{path}|{status.st_mtime_ns}|{status.st_size}\n".encode("utf-8"))
+        hash_string = file_set_hash.hexdigest()
+        cache_directory = self._data_model.get_bias_cache_directory()
+        cache_path = ""
+        if cache_directory != "":
+            bucket_temperature = self.temperature_bucket(sample_file.get_temperature()) \
+                * Constants.BIAS_SYNTHESIS_TEMPERATURE_BUCKET
+            cache_name = f"MasterBias-{sample_file.get_x_dimension()}x{sample_file.get_y_dimension()}" \
+                         f"-bin{sample_file.get_binning()}-{bucket_temperature:.1f}C" \
+                         f"-{hash_string[:16]}.fit"
+            cache_path = os.path.join(cache_directory, cache_name)
+        return hash_string, cache_path
+
+    @classmethod
+    def temperature_bucket(cls, temperature: float) -> int:
+        """
+        Get the temperature bucket into which bias frames are grouped for master synthesis
+        :param temperature:     CCD temperature of a frame
+        :return:                Integer bucket number, centred on multiples of the bucket width.
+                                Each bucket covers the same half-open range [centre - width/2, centre + width/2)
+        """
+        return math.floor(temperature / Constants.BIAS_SYNTHESIS_TEMPERATURE_BUCKET + 0.5)
+
     #
     # Get the best matched calibration file in the auto directory.  Only BIAS files
     # of the correct size will be selected
@@ -228,14 +601,13 @@ class Calibrator:
                                        directory_path: str,
                                        recursive: bool) -> [FileDescriptor]:
         """
-        Get file-descriptors for all the files in the specified directory
+        Get file-descriptors for all the files in the specified directory.  Headers already
+        read into the calibration library, and unchanged since, are not read again.
         :param directory_path:  Absolute path to directory to be scanned
         :param recursive:       If True, also recursively scann all sub-directories
         :return:                Array of file descriptors for contents
         """
-        paths: [str] = SharedUtils.files_in_directory(directory_path, recursive)
-        descriptors = RmFitsUtil.make_file_descriptions(paths)
-        return descriptors
+        return CalibrationLibrary.directory_descriptors(directory_path, recursive)
 
     def filter_to_correct_size(self,
                                all_descriptors: [FileDescriptor],
@@ -260,7 +632,7 @@ class Calibrator:
     def closest_match(self, descriptors: [FileDescriptor],
                       target_exposure: float,
                       target_temperature: float,
-                      console: Console) -> FileDescriptor:
+                      console: Optional[Console]) -> FileDescriptor:
         """
         Find the calibration file, from the given list of candidates, that is the best match for calibrating
         an image with the given exposure and temperature.  We have already ensured that the candidate calibration
@@ -270,7 +642,7 @@ class Calibrator:
         :param descriptors:             Descriptions of potential calibration files
         :param target_exposure:         Exposure time of the image to be calibrated
         :param target_temperature:      CCD temperature of the image to be calibrated
-        :param console:                 Redirectable console output object
+        :param console:                 Redirectable console output object (None for no output)
         :return:                        Description of the best-matching calibration file
         """
 
@@ -287,7 +659,7 @@ class Calibrator:
         match_index = indices[0].tolist()[0]
         best_match = descriptors[match_index]
 
-        if self._data_model.get_display_auto_select_results():
+        if console is not None and self._data_model.get_display_auto_select_results():
             console.message(f"Target {target_exposure:.1f}s at {target_temperature:.1f} C,"
                             f" best match is {best_match.get_exposure():.1f}s at"
                             f" {best_match.get_temperature():.1f} C: "
@@ -295,6 +667,97 @@ class Calibrator:
 
         return best_match
 
+    def plan_calibration(self, descriptors: [FileDescriptor]) -> CalibrationPlan:
+        """
+        Work out, without reading any pixel data, which calibration files would be read to calibrate
+        the given files with the current settings.  The same matching rules as the calibration itself
+        are used, on the FITS headers only.  Inputs with no suitable match are recorded in the plan
+        rather than raising an exception, so all the problems can be reported at once.
+
+        Exceptions thrown:
+            AutoCalibrationDirectoryEmpty
+
+        :param descriptors:     Descriptors of the files that would be calibrated
+        :return:                Plan giving the calibration files for each input and the missing matches
+        """
+        calibration_type = self._data_model.get_precalibration_type()
+        plan = CalibrationPlan(calibration_type)
+        if calibration_type == Constants.CALIBRATION_FIXED_FILE:
+            fixed_file = RmFitsUtil.make_file_descriptor(self._data_model.get_precalibration_fixed_path())
+            for descriptor in descriptors:
+                plan.add_assignment(descriptor, [fixed_file])
+        elif calibration_type == Constants.CALIBRATION_AUTO_DIRECTORY:
+            auto_directory_path = self._data_model.get_precalibration_auto_directory()
+            directory_files = self.all_descriptors_from_directory(auto_directory_path,
+                                                                  self._data_model.get_auto_directory_recursive())
+            if len(directory_files) == 0:
+                raise MasterMakerExceptions.AutoCalibrationDirectoryEmpty(auto_directory_path)
+            for descriptor in descriptors:
+                try:
+                    plan.add_assignment(descriptor, self.planned_auto_directory_files(directory_files, descriptor))
+                except MasterMakerExceptions.NoSuitableAutoBias:
+                    plan.add_missing(descriptor, self.missing_bias_reason())
+                except MasterMakerExceptions.NoSuitableAutoDark:
+                    plan.add_missing(descriptor, "no dark file with an exposure, of the same size and binning")
+                except MasterMakerExceptions.AutoCalibrationNoBiasFiles:
+                    plan.add_missing(descriptor, "no bias or dark files in the directory")
+        else:
+            # Pedestal, overscan and no calibration don't read any calibration files
+            for descriptor in descriptors:
+                plan.add_assignment(descriptor, [])
+        return plan
+
+    def missing_bias_reason(self) -> str:
+        """
+        Explain, for the plan report, why no bias could be matched.  What was required depends
+        on which auto-directory matching mode raised NoSuitableAutoBias.
+        :return:    Short description of the missing calibration file
+        """
+        if self._data_model.get_auto_directory_synthesize_bias():
+            return "no bias file of the same size, binning and temperature range"
+        elif self._data_model.get_auto_directory_scale_dark():
+            return "no bias file of the same size and binning"
+        elif self._data_model.get_auto_directory_bias_only():
+            return "no bias or dark file of the same size and binning"
+        else:
+            return "no calibration file of the same size and binning"
+
+    def planned_auto_directory_files(self, directory_files: [FileDescriptor],
+                                     sample_file: FileDescriptor) -> [FileDescriptor]:
+        """
+        Get the calibration files the auto-directory calibration would read for the given file.
+        Exceptions thrown:
+            NoSuitableAutoBias, NoSuitableAutoDark, AutoCalibrationNoBiasFiles
+        :param directory_files:     Descriptors of the files in the calibration directory
+        :param sample_file:         Description of file to be calibrated
+        :return:                    Descriptors of the calibration files that would be read for it
+        """
+        correct_size_files = self.filter_to_correct_size(directory_files, sample_file)
+        if self._data_model.get_auto_directory_synthesize_bias():
+            bias_files = self.synthesis_bias_files(directory_files, sample_file)
+            (_, cache_path) = self.synthesis_hash_and_cache_path(bias_files, sample_file)
+            if cache_path != "" and os.path.isfile(cache_path):
+                bias_files = [RmFitsUtil.make_file_descriptor(cache_path)]
+        elif self._data_model.get_auto_directory_scale_dark():
+            bias_files = [self.closest_bias_match(correct_size_files, sample_file.get_temperature())]
+        else:
+            if self._data_model.get_auto_directory_bias_only():
+                if not any(d.get_type() == FileDescriptor.FILE_TYPE_BIAS
+                           or d.get_type() == FileDescriptor.FILE_TYPE_DARK for d in directory_files):
+                    raise MasterMakerExceptions.AutoCalibrationNoBiasFiles
+                correct_size_files = [d for d in correct_size_files
+                                      if d.get_type() == FileDescriptor.FILE_TYPE_BIAS
+                                      or d.get_type() == FileDescriptor.FILE_TYPE_DARK]
+            if len(correct_size_files) == 0:
+                raise MasterMakerExceptions.NoSuitableAutoBias
+            bias_files = [self.closest_match(correct_size_files,
+                                             sample_file.get_exposure(),
+                                             sample_file.get_temperature(),
+                                             None)]
+        if self._data_model.get_auto_directory_scale_dark():
+            return bias_files + [self.closest_dark_match(correct_size_files, sample_file.get_temperature())]
+        return bias_files
+
     def fits_comment_tag(self) -> str:
         """
         Get a small text tag about the calibration mode to include in the FITs file comment
@@ -305,8 +768,16 @@ class Calibrator:
         if calibration_type == Constants.CALIBRATION_NONE:
             return "(no calibration)"
         elif calibration_type == Constants.CALIBRATION_AUTO_DIRECTORY:
-            return "(auto-selected bias file calibration)"
+            bias_string = "synthesized master bias" if self._data_model.get_auto_directory_synthesize_bias() \
+                else "auto-selected bias"
+            if self._data_model.get_auto_directory_scale_dark():
+                return f"({bias_string} and exposure-scaled dark calibration)"
+            return f"({bias_string} file calibration)"
         elif calibration_type == Constants.CALIBRATION_PEDESTAL:
             return f"(pedestal {self._data_model.get_precalibration_pedestal()} calibration)"
         elif calibration_type == Constants.CALIBRATION_FIXED_FILE:
             return "(fixed bias file calibration)"
+        elif calibration_type == Constants.CALIBRATION_OVERSCAN:
+            (x_start, x_end, y_start, y_end) = self._data_model.get_overscan_rectangle()
+            trimmed = ", trimmed" if self._data_model.get_overscan_trim() else ""
+            return f"(overscan {x_start}:{x_end},{y_start}:{y_end} calibration{trimmed})"
@@ -0,0 +1,177 @@
+#
+#   One combine job, submitted to the combine server or listed in a jobs file: the command-line
+#   arguments it was given, its state, and the lines of output it has produced so far.  The job is
+#   run exactly as the command line would run it, with its standard output directed here, so the
+#   progress lines the command line would print are collected - to be fetched, while it runs, by the
+#   client that submitted it, or displayed when it finishes - and, optionally, echoed as they arrive.
+#
+#   Other threads read the job while the job's thread writes to it, so the changing parts are
+#   guarded by a mutex.
+#
+import threading
+import traceback
+from argparse import ArgumentParser
+from datetime import datetime
+
+from CommandLineHandler import CommandLineHandler
+from DataModel import DataModel
+from JobOutputRouter import JobOutputRouter
+from Preferences import Preferences
+from SessionController import SessionController
+
+
+class CombineJob:
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    def __init__(self, job_id: int, arguments: [str], echo_stream=None):
+        """
+        Initialize a job waiting to be run
+        :param job_id:          Number identifying the job
+        :param arguments:       Command-line arguments of the job, as they would be given to the program
+        :param echo_stream:     Stream to which the job's output is also written as it arrives, if any
+        """
+        self._mutex = threading.Lock()
+        self._echo_stream = echo_stream
+        self._job_id = job_id
+        self._arguments = arguments
+        self._state = self.QUEUED
+        self._session_controller = SessionController()
+        self._output_lines: [str] = []
+        self._partial_line = ""
+        self._submitted = datetime.now()
+        self._started = None
+        self._finished = None
+
+    def get_job_id(self) -> int:
+        return self._job_id
+
+    def get_arguments(self) -> [str]:
+        return self._arguments
+
+    def get_session_controller(self) -> SessionController:
+        return self._session_controller
+
+    def get_state(self) -> str:
+        self._mutex.acquire()
+        result = self._state
+        self._mutex.release()
+        return result
+
+    def start(self) -> bool:
+        """
+        Mark the job as running, unless it was cancelled while waiting
+        :return:    True if the job should be run
+        """
+        self._mutex.acquire()
+        runnable = self._state == self.QUEUED
+        if runnable:
+            self._state = self.RUNNING
+            self._started = datetime.now()
+        self._mutex.release()
+        return runnable
+
+    def run(self, arg_parser: ArgumentParser):
+        """
+        Run the job as the command line would, with its output collected here, and record how it ended.
+        The preferences are read afresh, so changes made in the GUI apply to the next job.
+        :param arg_parser:  The program's command-line argument parser
+        """
+        success = False
+        with JobOutputRouter.capture(self):
+            try:
+                args = arg_parser.parse_args(self._arguments)
+                if args.gui or args.serve is not None or args.jobs_file is not None:
+                    print("The --gui, --serve and --jobs-file options can't be used within a job")
+                else:
+                    data_model = DataModel(Preferences.for_command_line())
+                    command_line_handler = CommandLineHandler(args, data_model, self._session_controller)
+                    success = command_line_handler.execute()
+            except SystemExit:
+                # The argument parser has written its message about the invalid arguments
+                pass
+            except Exception:
+                traceback.print_exc()
+        self.finish(success)
+
+    def finish(self, success: bool):
+        """
+        Record that the job has finished, and how
+        :param success:     True if the job's files were combined without error
+        """
+        self.flush()
+        self._mutex.acquire()
+        if self._session_controller.thread_cancelled():
+            self._state = self.CANCELLED
+        else:
+            self._state = self.SUCCEEDED if success else self.FAILED
+        self._finished = datetime.now()
+        self._mutex.release()
+
+    def cancel(self):
+        """
+        Cancel the job: a waiting job will not be run, and a running one stops at its next check
+        """
+        self._session_controller.cancel_thread()
+        self._mutex.acquire()
+        if self._state == self.QUEUED:
+            self._state = self.CANCELLED
+            self._finished = datetime.now()
+        self._mutex.release()
+
+    def write(self, text: str) -> int:
+        """
+        Take output written by the job, as a text stream does, keeping it as lines
+        :param text:    Text written, possibly several lines or part of one
+        :return:        Number of characters written
+        """
+        self._mutex.acquire()
+        lines = (self._partial_line + text).split("\n")
+        self._output_lines.extend(lines[:-1])
+        self._partial_line = lines[-1]
+        self._mutex.release()
+        if self._echo_stream is not None:
+            self._echo_stream.write(text)
+        return len(text)
+
+    def flush(self):
+        """
+        Keep any unfinished last line of output as a line of its own
+        """
+        self._mutex.acquire()
+        if self._partial_line != "":
+            self._output_lines.append(self._partial_line)
+            self._partial_line = ""
+        self._mutex.release()
+        if self._echo_stream is not None:
+            self._echo_stream.flush()
+
+    def get_output_lines(self) -> [str]:
+        self._mutex.acquire()
+        result = list(self._output_lines)
+        self._mutex.release()
+        return result
+
+    def to_json(self, first_line: int = 0) -> dict:
+        """
+        Describe the job, for the server to return to its clients as JSON
+        :param first_line:  Number of the first output line to include, so a client following a
+                            running job can fetch only the lines added since it last asked
+        :return:            Dictionary of the job's state and output
+        """
+        self._mutex.acquire()
+        result = {"id": self._job_id,
+                  "state": self._state,
+                  "arguments": self._arguments,
+                  "submitted": self._submitted.isoformat(timespec="seconds"),
+                  "started": None if self._started is None else self._started.isoformat(timespec="seconds"),
+                  "finished": None if self._finished is None else self._finished.isoformat(timespec="seconds"),
+                  "line_count": len(self._output_lines),
+                  "first_line": first_line,
+                  "output": self._output_lines[first_line:]}
+        self._mutex.release()
+        return result
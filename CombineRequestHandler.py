@@ -0,0 +1,36 @@
+#
+#   Handler for the HTTP requests made to the combine server.  The HTTP server creates one of these
+#   for each request; it only translates between HTTP and JSON, leaving the work to the server.
+#
+import json
+from http.server import BaseHTTPRequestHandler
+
+
+class CombineRequestHandler(BaseHTTPRequestHandler):
+
+    # noinspection PyPep8Naming
+    def do_GET(self):
+        self.handle_combine_request(None)
+
+    # noinspection PyPep8Naming
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.handle_combine_request(self.rfile.read(length) if length > 0 else b"")
+
+    def handle_combine_request(self, body):
+        """
+        Pass the request to the combine server and send back its response as JSON
+        :param body:    Body of a POST request, or None for a GET
+        """
+        (status, response) = self.server.combine_server.handle_request(self.command, self.path, body)
+        encoded = json.dumps(response, indent=1).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def log_message(self, format_string, *args):
+        # Requests are not logged: the job thread's output is being collected from the standard
+        # streams, and a client polling a job would fill the log with requests
+        pass
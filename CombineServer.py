@@ -0,0 +1,184 @@
+#
+#   Long-running server mode (--serve), for acquisition software that would otherwise start the
+#   program once for each set of flats.  Started once, it keeps the imported modules and the
+#   calibration library (indexed calibration headers and decoded frames) warm between jobs.
+#
+#   Jobs are submitted over HTTP on the local machine, with the same arguments as the command line,
+#   and run one at a time, in the order received, on a job thread, exactly as the command line
+#   would run them.  A job may combine several groups at once with the usual option.  Each job's
+#   progress and result are reported as JSON:
+#
+#       POST /jobs                  Submit a job: {"arguments": ["-gs", "-od", "/out", "/in/a.fit", ...]}
+#       GET  /jobs                  List all jobs, without their output
+#       GET  /jobs/<id>?since=<n>   A job's state and its output lines, from line n (default 0)
+#       POST /jobs/<id>/cancel      Cancel a job, waiting or running
+#
+#   The preferences are read again for each job, so changes made in the GUI apply to the next job.
+#
+import json
+import queue
+import sys
+import threading
+from argparse import ArgumentParser
+from http.server import ThreadingHTTPServer
+from typing import Optional
+
+from CombineJob import CombineJob
+from CombineRequestHandler import CombineRequestHandler
+from Constants import Constants
+from Preferences import Preferences
+
+
+class CombineServer:
+
+    # The server accepts connections only from the local machine
+    HOST = "127.0.0.1"
+
+    def __init__(self, arg_parser: ArgumentParser, port: int):
+        """
+        Initialize the server
+        :param arg_parser:  The program's command-line argument parser, used to parse each job's arguments
+        :param port:        Local port on which to accept jobs
+        """
+        self._arg_parser = arg_parser
+        self._port = port
+        self._mutex = threading.Lock()
+        self._jobs: {int: CombineJob} = {}
+        self._next_job_id = 1
+        self._job_queue: queue.Queue = queue.Queue()
+
+    def serve(self):
+        """
+        Run the server until interrupted
+        """
+        try:
+            http_server = ThreadingHTTPServer((self.HOST, self._port), CombineRequestHandler)
+        except (OSError, OverflowError) as exception:
+            print(f"Unable to serve on port {self._port}: {exception}")
+            return
+        http_server.combine_server = self
+        print(f"Serving combine jobs on http://{self.HOST}:{http_server.server_address[1]}/jobs")
+        sys.stdout.flush()
+        job_thread = threading.Thread(target=self.run_jobs, name="combine-jobs", daemon=True)
+        job_thread.start()
+        try:
+            http_server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            http_server.server_close()
+
+    def submit(self, arguments: [str]) -> CombineJob:
+        """
+        Add a job to the end of the queue
+        :param arguments:   Command-line arguments of the job
+        :return:            The new job
+        """
+        self._mutex.acquire()
+        job = CombineJob(self._next_job_id, arguments)
+        self._jobs[job.get_job_id()] = job
+        self._next_job_id += 1
+        self._mutex.release()
+        self._job_queue.put(job)
+        return job
+
+    def get_job(self, job_id: int) -> Optional[CombineJob]:
+        self._mutex.acquire()
+        result = self._jobs.get(job_id)
+        self._mutex.release()
+        return result
+
+    def get_jobs(self) -> [CombineJob]:
+        self._mutex.acquire()
+        result = list(self._jobs.values())
+        self._mutex.release()
+        return result
+
+    def run_jobs(self):
+        """
+        Warm the caches, then run the jobs as they arrive, one at a time.  Runs on the job thread.
+        """
+        self.prewarm()
+        while True:
+            job: CombineJob = self._job_queue.get()
+            if job.start():
+                job.run(self._arg_parser)
+
+    @staticmethod
+    def prewarm():
+        """
+        Load the modules that read and combine files, and index the auto-calibration directory if the
+        preferences call for one, so the first job starts as quickly as the ones after it
+        """
+        from CalibrationLibrary import CalibrationLibrary
+        from SharedUtils import SharedUtils
+        # Importing the file combiner loads astropy, numpy and the rest of the combination code
+        import FileCombiner
+        preferences = Preferences.for_command_line()
+        CalibrationLibrary.set_maximum_megabytes(preferences.get_frame_cache_megabytes())
+        if preferences.get_precalibration_type() == Constants.CALIBRATION_AUTO_DIRECTORY:
+            try:
+                for path in SharedUtils.files_in_directory(preferences.get_precalibration_auto_directory(),
+                                                           preferences.get_auto_directory_recursive()):
+                    CalibrationLibrary.file_descriptor(path)
+            except Exception:
+                # Unreadable or vanished files: the job that needs them will report these
+                pass
+
+    def handle_request(self, method: str, path: str, body: Optional[bytes]) -> (int, object):
+        """
+        Carry out one request from a client.  Runs on the request's own thread.
+        :param method:  HTTP method, GET or POST
+        :param path:    Path requested, possibly with a query
+        :param body:    Body of a POST request
+        :return:        HTTP status code, and the object to return as JSON
+        """
+        (path_part, _, query) = path.partition("?")
+        parts = [p for p in path_part.split("/") if p != ""]
+        if len(parts) == 0 or parts[0] != "jobs":
+            return 404, {"error": f"Unknown path {path_part}"}
+        if len(parts) == 1:
+            if method == "GET":
+                return 200, {"jobs": [self.job_summary(job) for job in self.get_jobs()]}
+            return self.submit_request(body)
+        job = self.get_job(int(parts[1])) if parts[1].isdigit() else None
+        if job is None:
+            return 404, {"error": f"No job {parts[1]}"}
+        if len(parts) == 2 and method == "GET":
+            since = 0
+            for parameter in query.split("&"):
+                (name, _, value) = parameter.partition("=")
+                if name == "since" and value.isdigit():
+                    since = int(value)
+            return 200, job.to_json(since)
+        if len(parts) == 3 and parts[2] == "cancel" and method == "POST":
+            job.cancel()
+            return 200, self.job_summary(job)
+        return 404, {"error": f"Unknown request {method} {path_part}"}
+
+    def submit_request(self, body: Optional[bytes]) -> (int, object):
+        """
+        Submit the job described in the body of a POST request
+        :param body:    JSON object with an "arguments" list of strings
+        :return:        HTTP status code, and the new job or an error
+        """
+        try:
+            request = json.loads(body.decode("utf-8")) if body else None
+        except (ValueError, UnicodeDecodeError):
+            request = None
+        arguments = request.get("arguments") if isinstance(request, dict) else None
+        if not isinstance(arguments, list) or not all(isinstance(a, str) for a in arguments):
+            return 400, {"error": "Expected a JSON object with an \"arguments\" list of strings"}
+        return 201, self.job_summary(self.submit(arguments))
+
+    @staticmethod
+    def job_summary(job: CombineJob) -> dict:
+        """
+        Describe a job without its output lines
+        :param job:     Job to be described
+        :return:        Dictionary of the job's state
+        """
+        summary = job.to_json()
+        del summary["output"]
+        del summary["first_line"]
+        return summary
@@ -14,6 +14,7 @@ from DataModel import DataModel
 from FileCombiner import FileCombiner
 from FileDescriptor import FileDescriptor
 from SessionController import SessionController
+from StageProfiler import StageProfiler
 
 
 class CombineThreadWorker(QObject):
@@ -60,7 +61,8 @@ class CombineThreadWorker(QObject):
             # Are we using grouped processing?
             if self._data_model.get_group_by_size() \
                     or self._data_model.get_group_by_filter() \
-                    or self._data_model.get_group_by_temperature():
+                    or self._data_model.get_group_by_temperature() \
+                    or self._data_model.get_group_by_exposure():
                 file_combiner.process_groups(self._data_model, self._descriptors,
                                              self._output_path,
                                              console)
@@ -97,6 +99,10 @@ class CombineThreadWorker(QObject):
             self.error_dialog("No matching calibration file",
                               "No bias or dark file of appropriate size could be found in the provided "
                               "calibration file directory.")
+        except MasterMakerExceptions.NoSuitableAutoDark:
+            self.error_dialog("No matching dark file",
+                              "Scaled-dark calibration needs a dark file, with a non-zero exposure and of "
+                              "appropriate size, in the provided calibration file directory.")
         except PermissionError as exception:
             self.error_dialog("Unable to write file",
                               f"The specified output file, "
@@ -105,9 +111,14 @@ class CombineThreadWorker(QObject):
         except MasterMakerExceptions.AutoCalibrationNoBiasFiles:
             self.error_dialog("No Bias Files",
                               f"The auto-directory does not contain any Bias files")
+        except MasterMakerExceptions.InvalidOverscanRegion:
+            self.error_dialog("Invalid overscan region",
+                              "The overscan region is empty or extends outside the images being calibrated.")
         except MasterMakerExceptions.SessionCancelled:
             self.console_callback("*** Session cancelled ***")
 
+        if StageProfiler.is_enabled():
+            StageProfiler.report(console)
         self.finished.emit()
 
     def console_callback(self, message: str):
@@ -2,55 +2,88 @@
 #   Class used to handle processing when the program is running in pure command line mode
 #   (i.e. no GUI interface).
 #
+#   The modules that read and combine the files bring in astropy and numpy, which are slow to import,
+#   so they are imported only where the files are processed.  Checking the arguments, and reporting
+#   any that are wrong, happens before they are loaded.
+#
 
 import os
+import time
 from datetime import datetime
 
 import MasterMakerExceptions
+from Console import Console
+from ConsoleJsonLines import ConsoleJsonLines
 from ConsoleSimplePrint import ConsoleSimplePrint
 from Constants import Constants
 from DataModel import DataModel
-from FileCombiner import FileCombiner
 from FileDescriptor import FileDescriptor
-from RmFitsUtil import RmFitsUtil
 from SessionController import SessionController
+from StageProfiler import StageProfiler
 
 
 class CommandLineHandler:
 
-    def __init__(self, args, data_model: DataModel):
+    def __init__(self, args, data_model: DataModel, session_controller: SessionController = None):
         """
         Initialize this object
-        :param args:        Text arguments given on the unix command line
-        :param data_model:  Data model describing the program options (initialized with defaults)
+        :param args:                Text arguments given on the unix command line
+        :param data_model:          Data model describing the program options (initialized with defaults)
+        :param session_controller:  Controller through which the session can be cancelled, as the combine
+                                    server does; if none is given, the session can't be cancelled
         """
         self._args = args
         self._data_model: DataModel = data_model
+        self._session_controller = session_controller if session_controller is not None \
+            else SessionController()
+        # Made before the options are checked, so the checking is reported in the chosen log format
+        self._console = self.make_console()
 
-    def execute(self):
+    def execute(self) -> bool:
         """
         Execute the program with the options specified on the command line, no GUI
+        :return:    True if the options were valid and the files were processed without error
         """
         valid: bool
         file_names: [str]
         single_output_path: str
         (valid, single_output_path, file_names) = self.validate_inputs()
         if valid:
-            groups_output_directory = self._args.outputdirectory
-            if self.process_files(file_names, single_output_path, groups_output_directory):
-                print("Successful completion")
+            if self._args.profile:
+                StageProfiler.start()
+            if self._args.plan:
+                self.report_calibration_plan(file_names)
+            elif self._args.dry_run:
+                self.report_group_plan(file_names, self._args.outputdirectory)
+            elif self._args.watch is not None:
+                valid = self.run_combination_session([], single_output_path, self._args.outputdirectory)
+            else:
+                groups_output_directory = self._args.outputdirectory
+                valid = self.process_files(file_names, single_output_path, groups_output_directory)
+                if valid and not self.logging_json_lines():
+                    print("Successful completion")
+        return valid
 
     # Make sure the command-line inputs are valid.  Fill in any give parameters into the existing
     # data model (which is already set up with defaults).
     # Check the following:
-    #   -   One or more input files, and all files exist
+    #   -   One or more input files, and all files exist (or, if -w used, no input files)
     #   -   If a bias file is specified, it exists
+    #   -   If a bias cache directory is specified, it is not an existing non-directory file
     #   -   If a pedestal value is specified, it is > 0
+    #   -   If an overscan region is specified, starts are >= 0 and less than ends
     #   -   If a min-max clip value is specified, it is > 0
     #   -   If a sigma threshold is specified, it is > 0
     #   -   If -ge used, bandwidth is 0.1 to 50
     #   -   If -gt used, bandwidth is 0.1 to 50
     #   -   If -mg used, group size is > 0
+    #   -   If -cg used, number of groups at once is > 0
+    #   -   If -wm used, worker memory is >= 0
+    #   -   If -mx used, memory ceiling is >= 0
+    #   -   If -r used, files are being grouped
+    #   -   If -dr used, files are being grouped
+    #   -   If -w used, the directory exists, files are being grouped, and -pl and -dr are not used
+    #   -   If -wq used, -w is used and the quiet time is > 0
     #   Returns:  validity flag, output path if specified, array of file names
 
     def validate_inputs(self) -> (bool, str, [str]):
@@ -66,134 +99,226 @@ class CommandLineHandler:
         output_path = ""
 
         # File names
-        if len(args.filenames) > 0:
+        if args.watch is not None:
+            if len(args.filenames) > 0:
+                self.report_invalid("File names can't be given when watching a directory")
+                valid = False
+        elif len(args.filenames) > 0:
             for file_name in args.filenames:
                 if os.path.isfile(file_name):
                     # This file is OK, we're good here
                     pass
                 else:
-                    print(f"File does not exist: {file_name}")
+                    self.report_invalid(f"File does not exist: {file_name}")
                     valid = False
             file_names = args.filenames
         else:
-            print("No file names given")
+            self.report_invalid("No file names given")
             valid = False
 
         # Pre-calibration method and related info
 
         if args.noprecal:
-            print("   Setting no precalibration")
+            self.report_option("   Setting no precalibration")
             self._data_model.set_precalibration_type(Constants.CALIBRATION_NONE)
         elif args.pedestal is not None:
             self._data_model.set_precalibration_type(Constants.CALIBRATION_PEDESTAL)
             if args.pedestal > 0:
-                print(f"   Setting pedestal = {args.pedestal}")
+                self.report_option(f"   Setting pedestal = {args.pedestal}")
                 self._data_model.set_precalibration_pedestal(args.pedestal)
             else:
-                print(f"Pedestal value must be greater than zero, not {args.pedestal}")
+                self.report_invalid(f"Pedestal value must be greater than zero, not {args.pedestal}")
                 valid = False
         elif args.bias is not None:
             self._data_model.set_precalibration_type(Constants.CALIBRATION_FIXED_FILE)
             if os.path.isfile(args.bias):
-                print(f"   Setting fixed bias file = {args.bias}")
+                self.report_option(f"   Setting fixed bias file = {args.bias}")
                 self._data_model.set_precalibration_fixed_path(args.bias)
             else:
-                print(f"Calibration bias file does not exist: {args.bias}")
+                self.report_invalid(f"Calibration bias file does not exist: {args.bias}")
                 valid = False
         elif args.auto is not None:
             if os.path.isdir(args.auto):
-                print(f"   Setting automatic bias directory = {args.auto}")
+                self.report_option(f"   Setting automatic bias directory = {args.auto}")
                 self._data_model.set_precalibration_type(Constants.CALIBRATION_AUTO_DIRECTORY)
                 self._data_model.set_precalibration_auto_directory(args.auto)
             else:
-                print("Automatic bias directory not found or not a directory: " + args.auto)
+                self.report_invalid(f"Automatic bias directory not found or not a directory: {args.auto}")
+                valid = False
+        elif args.overscan is not None:
+            self._data_model.set_precalibration_type(Constants.CALIBRATION_OVERSCAN)
+            (x_start, x_end, y_start, y_end) = args.overscan
+            if 0 <= x_start < x_end and 0 <= y_start < y_end:
+                self.report_option(f"   Setting overscan columns {x_start} to {x_end}, rows {y_start} to {y_end}")
+                self._data_model.set_overscan_rectangle((x_start, x_end, y_start, y_end))
+            else:
+                self.report_invalid(f"Overscan region must have 0 <= start < end for both x and y, not {args.overscan}")
                 valid = False
 
+        if args.overscantrim:
+            self.report_option(f"   Setting trim of overscan columns")
+            self._data_model.set_overscan_trim(True)
+
         if args.autorecursive:
-            print(f"   Setting auto-directory recursive")
+            self.report_option(f"   Setting auto-directory recursive")
             self._data_model.set_auto_directory_recursive(True)
         if args.autobias:
-            print(f"   Setting auto bias is bias files only")
+            self.report_option(f"   Setting auto bias is bias files only")
             self._data_model.set_auto_directory_bias_only(True)
         if args.autoresults:
-            print(f"   Setting display of automatic selection results")
+            self.report_option(f"   Setting display of automatic selection results")
             self._data_model.set_display_auto_select_results(True)
+        if args.autoscaledark:
+            self.report_option(f"   Setting auto calibration with bias and exposure-scaled dark")
+            self._data_model.set_auto_directory_scale_dark(True)
+        if args.autosynthesize:
+            self.report_option(f"   Setting auto calibration with synthesized master bias")
+            self._data_model.set_auto_directory_synthesize_bias(True)
+        if args.biascache is not None:
+            if os.path.exists(args.biascache) and not os.path.isdir(args.biascache):
+                self.report_invalid(f"Bias cache location exists but is not a directory: {args.biascache}")
+                valid = False
+            else:
+                self.report_option(f"   Setting master bias cache directory = {args.biascache}")
+                self._data_model.set_bias_cache_directory(args.biascache)
 
         # Master frame combination algorithm and parameters
         if args.mean:
-            print(f"   Setting MEAN combination")
+            self.report_option(f"   Setting MEAN combination")
             self._data_model.set_master_combine_method(Constants.COMBINE_MEAN)
         elif args.median:
-            print(f"   Setting MEDIAN combination")
+            self.report_option(f"   Setting MEDIAN combination")
             self._data_model.set_master_combine_method(Constants.COMBINE_MEDIAN)
         elif args.minmax is not None:
             self._data_model.set_master_combine_method(Constants.COMBINE_MINMAX)
             if args.minmax >= 1:
-                print(f"   Setting MIN-MAX combination, clipping {args.minmax} extremes")
+                self.report_option(f"   Setting MIN-MAX combination, clipping {args.minmax} extremes")
                 self._data_model.set_min_max_number_clipped_per_end(args.minmax)
             else:
-                print(f"Min-Max clipping argument must be > 0, not {args.minmax}")
+                self.report_invalid(f"Min-Max clipping argument must be > 0, not {args.minmax}")
                 valid = False
         elif args.sigma is not None:
             self._data_model.set_master_combine_method(Constants.COMBINE_SIGMA_CLIP)
             if args.sigma > 0:
-                print(f"   Setting SIGMA combination, z-threshold = {args.sigma}")
+                self.report_option(f"   Setting SIGMA combination, z-threshold = {args.sigma}")
                 self._data_model.set_sigma_clip_threshold(args.sigma)
             else:
-                print(f"Sigma clipping threshold must be > 0, not {args.sigma}")
+                self.report_invalid(f"Sigma clipping threshold must be > 0, not {args.sigma}")
                 valid = False
 
         # Insist on same file type in all files?
         if args.ignoretype:
-            print(f"   Ignoring file types")
+            self.report_option(f"   Ignoring file types")
             self._data_model.set_ignore_file_type(True)
 
         # What to do with input files after a successful run
         if args.moveinputs is not None:
             self._data_model.set_input_file_disposition(Constants.INPUT_DISPOSITION_SUBFOLDER)
             self._data_model.set_disposition_subfolder_name(args.moveinputs)
-            print(f"   After processing move files to {args.moveinputs}")
+            self.report_option(f"   After processing move files to {args.moveinputs}")
 
         # Where should output files go?
         if args.output is not None:
-            print(f"   Output path: {args.output}")
+            self.report_option(f"   Output path: {args.output}")
             output_path = args.output
 
-        # Grouping   gs   gf   gt <threshold>   mg <minimum>
+        # Grouping   gs   gf   gt <threshold>   ge <gap>   mg <minimum>
         #   -   If -ge used, bandwidth is 0.1 to 50
         #   -   If -gt used, bandwidth is 0.1 to 50
         #   -   If -mg used, group size is > 0
         if args.groupsize:
-            print("   Group files by size")
+            self.report_option("   Group files by size")
             self._data_model.set_group_by_size(True)
         if args.groupfilter:
-            print("   Group files by filter name")
+            self.report_option("   Group files by filter name")
             self._data_model.set_group_by_filter(True)
         if args.grouptemperature is not None:
             self._data_model.set_group_by_temperature(True)
             bandwidth = float(args.grouptemperature)
             if 0.1 <= bandwidth <= 50:
-                print(f"   Group files by temperature with bandwidth {bandwidth}")
+                self.report_option(f"   Group files by temperature with bandwidth {bandwidth}")
                 self._data_model.set_temperature_group_bandwidth(bandwidth)
             else:
-                print("-gt bandwidth must be between 0.1 and 50")
+                self.report_invalid("-gt bandwidth must be between 0.1 and 50")
+                valid = False
+        if args.groupexposure is not None:
+            self._data_model.set_group_by_exposure(True)
+            bandwidth = float(args.groupexposure)
+            if 0.1 <= bandwidth <= 50:
+                self.report_option(f"   Group files by exposure with bandwidth {bandwidth}")
+                self._data_model.set_exposure_group_bandwidth(bandwidth)
+            else:
+                self.report_invalid("-ge bandwidth must be between 0.1 and 50")
                 valid = False
         if args.minimumgroup is not None:
             self._data_model.set_ignore_groups_fewer_than(True)
             minimum_size = int(args.minimumgroup)
             if minimum_size > 0:
-                print(f"   Ignore groups smaller than {minimum_size}")
+                self.report_option(f"   Ignore groups smaller than {minimum_size}")
                 self._data_model.set_minimum_group_size(minimum_size)
             else:
-                print(f"   Minimum group size must be > 0, not {minimum_size}")
+                self.report_invalid(f"Minimum group size must be > 0, not {minimum_size}")
+                valid = False
+        if args.concurrentgroups is not None:
+            if args.concurrentgroups > 0:
+                self.report_option(f"   Combine {args.concurrentgroups} groups at once")
+                self._data_model.set_concurrent_groups(args.concurrentgroups)
+            else:
+                self.report_invalid(f"Number of groups combined at once must be > 0, not {args.concurrentgroups}")
+                valid = False
+        if args.workermemory is not None:
+            if args.workermemory >= 0:
+                self.report_option(f"   Group worker memory budget {args.workermemory} MB")
+                self._data_model.set_worker_memory_megabytes(args.workermemory)
+            else:
+                self.report_invalid(f"Group worker memory must be >= 0, not {args.workermemory}")
                 valid = False
+        if args.maxmemory is not None:
+            if args.maxmemory >= 0:
+                self.report_option(f"   Memory ceiling for groups combined at once {args.maxmemory} MB")
+                self._data_model.set_maximum_memory_megabytes(args.maxmemory)
+            else:
+                self.report_invalid(f"Memory ceiling must be >= 0, not {args.maxmemory}")
+                valid = False
+        if args.resume:
+            self.report_option("   Skip groups already combined into the output directory")
+            self._data_model.set_resume_groups(True)
 
         # If any of the grouping options are in use, then the output directory is mandatory
         if self._data_model.get_group_by_filter() \
                 or self._data_model.get_group_by_temperature() \
+                or self._data_model.get_group_by_exposure() \
                 or self._data_model.get_group_by_size():
             if args.outputdirectory is None:
-                print("If any of the group-by options are used, then the output directory option is mandatory")
+                self.report_invalid("If any of the group-by options are used, then the output directory option is mandatory")
+                valid = False
+        else:
+            if self._data_model.get_resume_groups():
+                self.report_invalid("The resume option applies only when one of the group-by options is used")
+                valid = False
+            if args.dry_run:
+                self.report_invalid("The dry-run option applies only when one of the group-by options is used")
+                valid = False
+            if args.watch is not None:
+                self.report_invalid("The watch option applies only when one of the group-by options is used")
+                valid = False
+
+        # Watching a directory
+        if args.watch is not None:
+            if not os.path.isdir(args.watch):
+                self.report_invalid(f"Watch directory not found or not a directory: {args.watch}")
+                valid = False
+            if args.plan or args.dry_run:
+                self.report_invalid("The plan and dry-run options can't be used when watching a directory")
+                valid = False
+        if args.watchquiet is not None:
+            if args.watch is None:
+                self.report_invalid("The watch quiet time applies only when watching a directory")
+                valid = False
+            elif args.watchquiet > 0:
+                self.report_option(f"   Combine groups when quiet for {args.watchquiet:g} seconds")
+            else:
+                self.report_invalid(f"Watch quiet time must be > 0, not {args.watchquiet}")
                 valid = False
 
         return valid, output_path, file_names
@@ -206,42 +331,98 @@ class CommandLineHandler:
         :param groups_output_directory:     Path for output directory if grouping option is used
         :return:                            Success indicator
         """
-        success = True
+        from FileCombiner import FileCombiner
+        from RmFitsUtil import RmFitsUtil
         file_descriptors = RmFitsUtil.make_file_descriptions(file_names)
         # check types are all Flat
         if self._data_model.get_ignore_file_type() \
                 or FileCombiner.all_of_type(file_descriptors, FileDescriptor.FILE_TYPE_FLAT):
             output_file_path = self.make_output_path(output_path, file_descriptors)
-            self.run_combination_session(file_descriptors, output_file_path, groups_output_directory)
+            success = self.run_combination_session(file_descriptors, output_file_path, groups_output_directory)
         else:
-            print("Files are not all Flat files.  (Use -t option to suppress this check.)")
+            self.report_invalid("Files are not all Flat files.  (Use -t option to suppress this check.)")
             success = False
         return success
 
-    def run_combination_session(self, descriptors: [FileDescriptor], output_path: str, output_directory: str):
+    def report_calibration_plan(self, file_names: [str]):
+        """
+        Report which calibration files would be used for each of the given files, how many distinct
+        calibration files would be read and how large they are, and which files have no suitable match.
+        Only the FITS headers are read, no pixel data.
+        :param file_names:      List of file path names that would be processed
+        """
+        from Calibrator import Calibrator
+        from RmFitsUtil import RmFitsUtil
+        console = self._console
+        calibration_type = self._data_model.get_precalibration_type()
+        console.message(f"Calibration plan: {Constants.calibration_string(calibration_type)}", +1)
+        try:
+            file_descriptors = RmFitsUtil.make_file_descriptions(file_names)
+            plan = Calibrator(self._data_model).plan_calibration(file_descriptors)
+            plan.describe(console)
+        except FileNotFoundError as exception:
+            self.error_dialog("File not found", f"File \"{exception.filename}\" not found or not readable")
+        except MasterMakerExceptions.AutoCalibrationDirectoryEmpty as exception:
+            self.error_dialog("Auto Calibration Directory Empty",
+                              f"The specified directory for auto-calibration files, "
+                              f"\"{exception.get_directory_name()}\","
+                              f" does not contain any calibration files (or cannot be read).")
+
+    def report_group_plan(self, file_names: [str], output_directory: str):
+        """
+        Report the groups that would be combined from the given files, with their file counts, sizes,
+        estimated peak memory and output names, and the groups too small to combine.
+        Only the FITS headers are read, no pixel data.
+        :param file_names:          List of file path names that would be processed
+        :param output_directory:    Directory that would receive the grouped output files
+        """
+        from FileCombiner import FileCombiner
+        from RmFitsUtil import RmFitsUtil
+        console = self._console
+        try:
+            file_descriptors = RmFitsUtil.make_file_descriptions(file_names)
+            file_combiner = FileCombiner(SessionController(), None)
+            file_combiner.preview_groups(self._data_model, file_descriptors, output_directory, console)
+        except FileNotFoundError as exception:
+            self.error_dialog("File not found", f"File \"{exception.filename}\" not found or not readable")
+
+    def run_combination_session(self, descriptors: [FileDescriptor], output_path: str,
+                                output_directory: str) -> bool:
         """
         Create a console output object.  This is passed in to the various math routines
         to allow them to output progress.  We use this indirect method of getting progress
         so that it can go to the console window in this case, but the same worker code can send
         progress lines to the standard system output when being run from the command line
 
-        :param descriptors:         File descriptors of all input files to be processed
+        :param descriptors:         File descriptors of all input files to be processed (none if watching)
         :param output_path:         Path for single combined output file
         :param output_directory:    Path for output directory if grouping is in use
+        :return:                    True if the files were combined without error
         """
-        console = ConsoleSimplePrint()
+        from FileCombiner import FileCombiner
+        console = self._console
         console.message("Starting session", 0)
-        # A "session controller" is necessary, but has an interesting effect only in the GUI version
-        # In our command-line case we'll create it but its state will never change so it does nothing
-        dummy_session_controller = SessionController()
-        file_combiner = FileCombiner(dummy_session_controller, self.file_moved_callback)
+        start_time = time.monotonic()
+        console.event("session_start", files=len(descriptors))
+        # A "session controller" is necessary, but its state changes only if the session is run
+        # by the combine server, which can cancel it; from the command line it does nothing
+        file_combiner = FileCombiner(self._session_controller, self.file_moved_callback)
+        success = False
 
-        # Do the file combination - two methods depending on whether we are processing by groups
+        # Do the file combination - two methods depending on whether we are processing by groups,
+        # or combining groups as their files arrive in a watched directory
         try:
+            if self._args.watch is not None:
+                from FolderWatcher import FolderWatcher
+                quiet_seconds = self._args.watchquiet if self._args.watchquiet is not None \
+                    else Constants.WATCH_QUIET_SECONDS
+                FolderWatcher(self._data_model, self._args.watch, output_directory, quiet_seconds,
+                              self._session_controller, console).watch()
             # Are we using grouped processing?
-            if self._data_model.get_group_by_filter() \
+            elif self._data_model.get_group_by_filter() \
                     or self._data_model.get_group_by_size() \
-                    or self._data_model.get_group_by_temperature():
+                    or self._data_model.get_group_by_temperature() \
+                    or self._data_model.get_group_by_exposure():
                 file_combiner.process_groups(self._data_model, descriptors,
                                              output_directory,
                                              console)
@@ -250,6 +431,7 @@ class CommandLineHandler:
                 file_combiner.original_non_grouped_processing(descriptors, self._data_model,
                                                               output_path,
                                                               console)
+            success = True
         except FileNotFoundError as exception:
             self.error_dialog("File not found", f"File \"{exception.filename}\" not found or not readable")
         except MasterMakerExceptions.NoGroupOutputDirectory as exception:
@@ -278,6 +460,10 @@ class CommandLineHandler:
             self.error_dialog("No matching calibration file",
                               "No bias or dark file of appropriate size could be found in the provided "
                               "calibration file directory.")
+        except MasterMakerExceptions.NoSuitableAutoDark:
+            self.error_dialog("No matching dark file",
+                              "Scaled-dark calibration needs a dark file, with a non-zero exposure and of "
+                              "appropriate size, in the provided calibration file directory.")
         except PermissionError as exception:
             self.error_dialog("Unable to write file",
                               f"The specified output file, "
@@ -286,8 +472,16 @@ class CommandLineHandler:
         except MasterMakerExceptions.AutoCalibrationNoBiasFiles:
             self.error_dialog("No Bias Files",
                               f"The auto-directory does not contain any Bias files")
+        except MasterMakerExceptions.InvalidOverscanRegion:
+            self.error_dialog("Invalid overscan region",
+                              "The overscan region is empty or extends outside the images being calibrated.")
         except MasterMakerExceptions.SessionCancelled:
-            self.error_dialog("Session Cancelled", " (This should not be possible in the non-GUI version)")
+            self.error_dialog("Session Cancelled", "The session was cancelled before it completed")
+        if self._args.profile:
+            StageProfiler.report(console)
+            StageProfiler.stop()
+        console.event("session_end", succeeded=success, seconds=round(time.monotonic() - start_time, 6))
+        return success
 
     def make_output_path(self,
                          output_path_parameter,
@@ -367,10 +561,44 @@ class CommandLineHandler:
         # We have to have this callback telling us a file was moved.
         # Ignore it, since no UI needs to be updated
 
+    def make_console(self) -> Console:
+        """
+        Create the console for the session's output: structured JSON lines if the log format option
+        asks for them, otherwise plain text
+        :return:    Console writing to the standard output
+        """
+        return ConsoleJsonLines() if self.logging_json_lines() else ConsoleSimplePrint()
+
+    def logging_json_lines(self) -> bool:
+        return self._args.log_format == "jsonl"
+
     def error_dialog(self, short_message: str, long_message: str):
         """
         Put error message from a program exception on the console.
         :param short_message:   Brief form of message
         :param long_message:    More detail if available
         """
-        print("*** ERROR *** " + short_message + ":\n   " + long_message)
+        if self.logging_json_lines():
+            self._console.event("error", title=short_message, detail=long_message)
+        else:
+            print("*** ERROR *** " + short_message + ":\n   " + long_message)
+
+    def report_option(self, text: str):
+        """
+        Report an option taken from the command line, as the options are checked
+        :param text:    Description of the option's setting
+        """
+        if self.logging_json_lines():
+            self._console.message(text.strip(), 0)
+        else:
+            print(text)
+
+    def report_invalid(self, text: str):
+        """
+        Report a command-line option, or file, that stops the session from running
+        :param text:    What is wrong
+        """
+        if self.logging_json_lines():
+            self._console.event("error", title="Invalid command line", detail=text)
+        else:
+            print(text)
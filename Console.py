@@ -5,6 +5,11 @@
 #   Messages can be indented.  Current indentation level can be saved on a stack,
 #   incremented in the messaging call, and restored from the stack
 #
+#   Alongside the messages, the combination code reports events - a group started, a file read,
+#   an output file written, and so on - with their timings and sizes.  Consoles showing messages
+#   to people ignore these; the JSON-lines console writes them out for other programs to read.
+#
+import time
 from datetime import datetime
 
 from Constants import Constants
@@ -37,6 +42,34 @@ class Console:
         if temp:
             self._message_level -= level_change
 
+    def event(self, name: str, **fields):
+        """
+        Report an event, with the time it happened on the monotonic clock (in seconds), which is
+        comparable between the processes combining groups at the same time
+        :param name:        Name of the event, e.g. "file_read"
+        :param fields:      Details of the event: paths, counts, durations in seconds, sizes in bytes
+        """
+        record = {"event": name, "time": round(time.monotonic(), 6)}
+        record.update(fields)
+        self.output_event(record)
+
+    def output_event(self, record: dict):
+        """
+        Put an event on the console.  Consoles of messages for people ignore events; a subclass
+        that records events overrides this.
+        :param record:      Dictionary describing the event, including its name and time
+        """
+        pass
+
+    def output_message_record(self, record: dict):
+        """
+        Put on the console a message kept earlier by a ConsoleBuffer, perhaps in another process.
+        Consoles of messages for people just display its text; a subclass that records the time of
+        each message overrides this to keep the time the message was made.
+        :param record:      Dictionary {"event": "message", "time": time made, "text": formatted message}
+        """
+        self.output_message(record["text"])
+
     def push_level(self):
         """
         Save the current indentation level on a push-down stack for easy restoration
@@ -50,6 +83,20 @@ class Console:
         assert len(self._message_level_stack) > 0
         self._message_level = self._message_level_stack.pop()
 
+    def get_message_level(self) -> int:
+        """
+        Return the current indentation level, so another console can carry on at the same place
+        :return:        Integer indentation level
+        """
+        return self._message_level
+
+    def set_message_level(self, level: int):
+        """
+        Set the current indentation level, to carry on from where another console was
+        :param level:   Integer indentation level
+        """
+        self._message_level = level
+
     def verify_done(self):
         """
         We're finished with operation that is supposed to be balanced with respect to console indentation.
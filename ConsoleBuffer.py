@@ -0,0 +1,62 @@
+import time
+
+from Console import Console
+
+
+#
+#   A console handler that keeps the lines it is given instead of displaying them.
+#   Groups processed at the same time in worker processes each write to one of these, and the
+#   main process displays each group's lines, in group order, when the group is done, so the
+#   output of simultaneous groups is not interleaved.  Starts at a given indentation level so
+#   the lines are indented as they would have been on the console they are destined for.
+#   Each line is kept as a "message" record with the time it was made, so a console recording times
+#   can give it that time rather than the time it is displayed; events are kept too, in order among
+#   the lines, as the dictionaries describing them.
+#
+class ConsoleBuffer(Console):
+
+    def __init__(self, message_level: int = 0):
+        """
+        Initialize this object with an empty buffer
+        :param message_level:   Indentation level to start at
+        """
+        Console.__init__(self)
+        self.set_message_level(message_level)
+        self._lines: [dict] = []
+
+    def output_message(self, message: str):
+        """
+        Keep the given message for later display, with the time it was made
+        :param message:     Message to be displayed.
+        """
+        self._lines.append({"event": "message", "time": round(time.monotonic(), 6), "text": message})
+
+    def output_message_record(self, record: dict):
+        """
+        Keep a message taken from another buffer, with the time it was first made
+        :param record:      Message record
+        """
+        self._lines.append(record)
+
+    def output_event(self, record: dict):
+        """
+        Keep the given event for later display
+        :param record:      Dictionary describing the event
+        """
+        self._lines.append(record)
+
+    def take_lines(self) -> [dict]:
+        """
+        Return the lines and events kept so far, emptying the buffer
+        :return:    List of message records and event dictionaries, oldest first
+        """
+        lines = self._lines
+        self._lines = []
+        return lines
+
+    def take_text(self) -> str:
+        """
+        Return the text of the lines kept so far, without the events, emptying the buffer
+        :return:    The formatted console lines, one per line of text
+        """
+        return "\n".join(line["text"] for line in self.take_lines() if line["event"] == "message")
@@ -0,0 +1,33 @@
+import json
+import time
+
+from Console import Console
+
+
+#
+#   A console handler for programs, rather than people, following a command-line session
+#   (--log-format jsonl).  Each message and each event is printed to standard output as one JSON
+#   object on a line of its own, so progress and timings can be read without parsing the text:
+#
+#       {"event": "message", "time": 5012.71, "text": "14:02:11  Combining by simple mean"}
+#       {"event": "file_read", "time": 5012.84, "path": "/flats/a.fit", "bytes": 16782400, "seconds": 0.031}
+#
+#   Every object has the event name and the time on the monotonic clock, in seconds; the other
+#   fields depend on the event.  Durations are in seconds and sizes in bytes.  The output of groups
+#   combined in worker processes is shown a group at a time, each line with the time it was made, so
+#   the times of groups combined at once interleave.
+#
+class ConsoleJsonLines(Console):
+
+    def __init__(self):
+        Console.__init__(self)
+
+    def output_message(self, message: str):
+        self.output_event({"event": "message", "time": round(time.monotonic(), 6), "text": message})
+
+    def output_event(self, record: dict):
+        print(json.dumps(record), flush=True)
+
+    def output_message_record(self, record: dict):
+        # Keep the time the message was made, perhaps in a worker process, not the time it is shown
+        self.output_event(record)
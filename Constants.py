@@ -19,6 +19,7 @@ class Constants:
     CALIBRATION_PEDESTAL = -9715  # Subtract a fixed pedestal number from all files
     CALIBRATION_FIXED_FILE = -9713  # Precalibration file path is permanently stored
     CALIBRATION_AUTO_DIRECTORY = -9709  # Auto-select best file from a given directory
+    CALIBRATION_OVERSCAN = -9707  # Subtract per-row bias measured in the camera's overscan strip
     # CALIBRATION_PROMPT = -9711  # Prompt user for precalibration file
 
     DEFAULT_CALIBRATION_PEDESTAL = 100
@@ -28,6 +29,17 @@ class Constants:
     # Weight given to exposure time over temperature when selecting a calibration file
     AUTO_CALIBRATION_EXPOSURE_WEIGHT = 3.0
 
+    # Width, in degrees, of the temperature buckets used to choose which raw bias frames
+    # are median-combined into a synthesized master bias
+    BIAS_SYNTHESIS_TEMPERATURE_BUCKET = 2.0
+
+    # Default upper limit, in megabytes, on the decoded calibration frames kept in memory by the
+    # calibration library between sessions.  The least-recently used frames are dropped beyond this.
+    CALIBRATION_LIBRARY_MEGABYTES = 1024
+
+    # Default time, in seconds, a watched group must go without a new file before it is combined
+    WATCH_QUIET_SECONDS = 60.0
+
     @classmethod
     def combine_method_string(cls, method: int) -> str:
         """
@@ -75,6 +87,8 @@ class Constants:
             return "Fixed File"
         elif value == cls.CALIBRATION_NONE:
             return "None"
+        elif value == cls.CALIBRATION_OVERSCAN:
+            return "Overscan"
         else:
             assert value == cls.CALIBRATION_PEDESTAL
             return "Pedestal"
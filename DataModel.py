@@ -29,13 +29,24 @@ class DataModel:
         self._precalibration_auto_directory: str = preferences.get_precalibration_auto_directory()
         self._auto_directory_recursive: bool = preferences.get_auto_directory_recursive()
         self._auto_directory_bias_only: bool = preferences.get_auto_directory_bias_only()
+        self._auto_directory_scale_dark: bool = preferences.get_auto_directory_scale_dark()
+        self._auto_directory_synthesize_bias: bool = preferences.get_auto_directory_synthesize_bias()
+        self._bias_cache_directory: str = preferences.get_bias_cache_directory()
+        self._overscan_rectangle: (int, int, int, int) = preferences.get_overscan_rectangle()
+        self._overscan_trim: bool = preferences.get_overscan_trim()
         self._group_by_size: bool = preferences.get_group_by_size()
         self._group_by_temperature: bool = preferences.get_group_by_temperature()
+        self._group_by_exposure: bool = preferences.get_group_by_exposure()
         self._group_by_filter: bool = preferences.get_group_by_filter()
         self._temperature_group_bandwidth: float = preferences.get_temperature_group_bandwidth()
+        self._exposure_group_bandwidth: float = preferences.get_exposure_group_bandwidth()
         self._ignore_file_type: bool = False
+        self._resume_groups: bool = False
         self._ignore_groups_fewer_than: bool = preferences.get_ignore_groups_fewer_than()
         self._minimum_group_size: int = preferences.get_minimum_group_size()
+        self._concurrent_groups: int = preferences.get_concurrent_groups()
+        self._worker_memory_megabytes: int = preferences.get_worker_memory_megabytes()
+        self._maximum_memory_megabytes: int = preferences.get_maximum_memory_megabytes()
         self._display_average_adus: bool = preferences.get_display_average_adus()
         self._display_auto_select_results: bool = preferences.get_display_auto_select_results()
 
@@ -103,6 +114,7 @@ class DataModel:
         assert (result == Constants.CALIBRATION_NONE) \
             or (result == Constants.CALIBRATION_FIXED_FILE) \
             or (result == Constants.CALIBRATION_AUTO_DIRECTORY) \
+            or (result == Constants.CALIBRATION_OVERSCAN) \
             or (result == Constants.CALIBRATION_PEDESTAL)
         return result
 
@@ -110,6 +122,7 @@ class DataModel:
         assert (value == Constants.CALIBRATION_NONE) \
                or (value == Constants.CALIBRATION_FIXED_FILE) \
                or (value == Constants.CALIBRATION_AUTO_DIRECTORY) \
+               or (value == Constants.CALIBRATION_OVERSCAN) \
                or (value == Constants.CALIBRATION_PEDESTAL)
         self._precalibration_type = value
 
@@ -140,6 +153,23 @@ class DataModel:
     def set_precalibration_auto_directory(self, path: str):
         self._precalibration_auto_directory = path
 
+    # Overscan region (x_start, x_end, y_start, y_end) used if overscan calibration is chosen
+
+    def get_overscan_rectangle(self) -> (int, int, int, int):
+        return self._overscan_rectangle
+
+    def set_overscan_rectangle(self, rectangle: (int, int, int, int)):
+        assert len(rectangle) == 4
+        self._overscan_rectangle = tuple(rectangle)
+
+    # Should the overscan columns be trimmed from the calibrated images?
+
+    def get_overscan_trim(self) -> bool:
+        return self._overscan_trim
+
+    def set_overscan_trim(self, trim: bool):
+        self._overscan_trim = trim
+
     # Are we processing multiple file sets at once using grouping?
 
     def get_group_by_size(self) -> bool:
@@ -154,6 +184,12 @@ class DataModel:
     def set_group_by_temperature(self, is_grouped: bool):
         self._group_by_temperature = is_grouped
 
+    def get_group_by_exposure(self) -> bool:
+        return self._group_by_exposure
+
+    def set_group_by_exposure(self, is_grouped: bool):
+        self._group_by_exposure = is_grouped
+
     def get_group_by_filter(self) -> bool:
         return self._group_by_filter
 
@@ -172,6 +208,30 @@ class DataModel:
     def set_auto_directory_bias_only(self, bias_only: bool):
         self._auto_directory_bias_only = bias_only
 
+    # Auto-directory calibration subtracts a bias plus a dark scaled to each file's exposure
+
+    def get_auto_directory_scale_dark(self) -> bool:
+        return self._auto_directory_scale_dark
+
+    def set_auto_directory_scale_dark(self, scale_dark: bool):
+        self._auto_directory_scale_dark = scale_dark
+
+    # Auto-directory calibration median-combines all matching bias files into a master bias
+
+    def get_auto_directory_synthesize_bias(self) -> bool:
+        return self._auto_directory_synthesize_bias
+
+    def set_auto_directory_synthesize_bias(self, synthesize: bool):
+        self._auto_directory_synthesize_bias = synthesize
+
+    # Directory where synthesized master bias files are saved for re-use (empty for none)
+
+    def get_bias_cache_directory(self) -> str:
+        return self._bias_cache_directory
+
+    def set_bias_cache_directory(self, path: str):
+        self._bias_cache_directory = path
+
     def get_display_auto_select_results(self) -> bool:
         return self._display_auto_select_results
 
@@ -189,12 +249,31 @@ class DataModel:
         assert 0.1 <= bandwidth <= 50
         self._temperature_group_bandwidth = bandwidth
 
+    # How large a gap, in seconds, between exposure times starts a different group?
+
+    def get_exposure_group_bandwidth(self) -> float:
+        bandwidth: float = self._exposure_group_bandwidth
+        assert 0.1 <= bandwidth <= 50
+        return bandwidth
+
+    def set_exposure_group_bandwidth(self, bandwidth: float):
+        assert 0.1 <= bandwidth <= 50
+        self._exposure_group_bandwidth = bandwidth
+
     def get_ignore_file_type(self) -> bool:
         return self._ignore_file_type
 
     def set_ignore_file_type(self, ignore: bool):
         self._ignore_file_type = ignore
 
+    # Skip groups that the output directory's manifest shows were already combined
+
+    def get_resume_groups(self) -> bool:
+        return self._resume_groups
+
+    def set_resume_groups(self, resume: bool):
+        self._resume_groups = resume
+
     def get_ignore_groups_fewer_than(self) -> bool:
         return self._ignore_groups_fewer_than
 
@@ -207,6 +286,34 @@ class DataModel:
     def set_minimum_group_size(self, minimum: int):
         self._minimum_group_size = minimum
 
+    # How many groups are combined at once, each in its own worker process (1 for one after
+    # the other, in this process), and the memory budget of each worker in megabytes (0 for none)
+
+    def get_concurrent_groups(self) -> int:
+        result = self._concurrent_groups
+        assert result > 0
+        return result
+
+    def set_concurrent_groups(self, number: int):
+        assert number > 0
+        self._concurrent_groups = number
+
+    def get_worker_memory_megabytes(self) -> int:
+        return self._worker_memory_megabytes
+
+    def set_worker_memory_megabytes(self, megabytes: int):
+        assert megabytes >= 0
+        self._worker_memory_megabytes = megabytes
+
+    # Ceiling on the estimated peak memory of all the groups combined at once, in megabytes (0 for none)
+
+    def get_maximum_memory_megabytes(self) -> int:
+        return self._maximum_memory_megabytes
+
+    def set_maximum_memory_megabytes(self, megabytes: int):
+        assert megabytes >= 0
+        self._maximum_memory_megabytes = megabytes
+
     def get_display_average_adus(self) -> bool:
         return self._display_average_adus
 
@@ -1,22 +1,31 @@
 #
 #   Object for combining FITS files using different algorithms
 #
+import os
+import time
 from itertools import groupby
-from typing import Callable
+from typing import Callable, Optional
 
 import numpy
-import mean_shift as ms
 
 import MasterMakerExceptions
 from Calibrator import Calibrator
 from Console import Console
+from ConsoleBuffer import ConsoleBuffer
 from Constants import Constants
 from DataModel import DataModel
 from FileDescriptor import FileDescriptor
+from FileGroup import FileGroup
+from GroupJob import GroupJob
+from GroupManifest import GroupManifest
+from GroupPlanner import GroupPlanner
+from GroupScheduler import GroupScheduler
 from ImageMath import ImageMath
 from RmFitsUtil import RmFitsUtil
 from SessionController import SessionController
 from SharedUtils import SharedUtils
+from StageProfiler import StageProfiler
+from ValueClusterer import ValueClusterer
 
 
 class FileCombiner:
@@ -79,6 +88,10 @@ class FileCombiner:
                        console: Console):
         """
         Process the given selected files in groups by size, exposure, or temperature (or any combination)
+        The groups are all planned first, then combined one at a time or, if the data model asks for
+        it, several at once in worker processes, largest first.  Each completed group is recorded in
+        a manifest in the output directory and, if the data model asks to resume, groups already
+        combined with the same files and parameters are skipped.
         Exceptions thrown:
             NoGroupOutputDirectory      Output directory does not exist and unable to create it
         :param data_model:          Data model specifying options for the current run
@@ -87,78 +100,272 @@ class FileCombiner:
         :param console:             Re-directable console output object
         """
         console.push_level()
-        temperature_bandwidth = data_model.get_temperature_group_bandwidth()
         disposition_folder = data_model.get_disposition_subfolder_name()
         substituted_folder_name = SharedUtils.substitute_date_time_filter_in_string(disposition_folder)
         console.message("Process groups into output directory: " + output_directory, +1)
         if not SharedUtils.ensure_directory_exists(output_directory):
             raise MasterMakerExceptions.NoGroupOutputDirectory(output_directory)
+
+        # Plan the groups.  The group headings are kept with the group they introduce, so they
+        # are displayed just before that group's output however the groups are run.
+        planning_console = ConsoleBuffer(console.get_message_level())
+        jobs = self.plan_groups(data_model, selected_files, planning_console)
+        trailing_lines = planning_console.take_lines()
+
+        # Hash each group's files now, as they may be moved away once combined
+        manifest = GroupManifest(output_directory)
+        parameters = GroupManifest.parameters(data_model)
+        input_set_hashes = {GroupManifest.group_key(job.get_descriptors()):
+                            GroupManifest.input_set_hash(job.get_descriptors()) for job in jobs}
+        if data_model.get_resume_groups():
+            (jobs, trailing_lines) = self.skip_completed_groups(jobs, trailing_lines, manifest,
+                                                                input_set_hashes, parameters)
+
+        def group_completed(job: GroupJob, output_file: str):
+            descriptors = job.get_descriptors()
+            manifest.record_completed(descriptors, input_set_hashes[GroupManifest.group_key(descriptors)],
+                                      parameters, output_file)
+
+        scheduler = GroupScheduler(data_model, self._session_controller, self.callback_method,
+                                   FileCombiner.combine_one_group, group_completed)
+        scheduler.run_jobs(jobs, trailing_lines, output_directory, substituted_folder_name, console)
+        console.message("Group combining complete", 0)
+        console.pop_level()
+
+    def preview_groups(self, data_model: DataModel,
+                       selected_files: [FileDescriptor],
+                       output_directory: Optional[str],
+                       console: Console):
+        """
+        Describe the groups that process_groups would combine, without reading any pixel data: the
+        same group headings, then for each group its file count, the bytes its files occupy, its
+        estimated peak memory and its projected output file, and finally totals for the whole plan
+        :param data_model:          Data model specifying options for the run being previewed
+        :param selected_files:      List of descriptions of files that would be grouped then processed
+        :param output_directory:    Directory that would receive the output files, or None if not yet
+                                    chosen.  If given, and resuming, groups already combined are noted.
+        :param console:             Re-directable console output object
+        """
+        megabyte = 1024.0 * 1024.0
+        combine_method = data_model.get_master_combine_method()
+        console.push_level()
+        console.message(f"Group plan for {len(selected_files)} files, "
+                        f"{Constants.combine_method_string(combine_method)} combination", +1)
+        planning_console = ConsoleBuffer(console.get_message_level())
+        jobs = self.plan_groups(data_model, selected_files, planning_console)
+        trailing_lines = planning_console.take_lines()
+
+        manifest = GroupManifest(output_directory) if output_directory is not None \
+            and data_model.get_resume_groups() else None
+        parameters = GroupManifest.parameters(data_model)
+        total_bytes = 0
+        peaks: [int] = []
+        skipped_count = 0
+        for job in jobs:
+            descriptors = job.get_descriptors()
+            GroupScheduler.output_lines(job.get_header_lines(), console)
+            console.push_level()
+            console.set_message_level(job.get_message_level())
+            file_bytes = sum(os.path.getsize(d.get_absolute_path()) for d in descriptors)
+            peak_bytes = job.get_estimated_peak_bytes(data_model)
+            existing_output = None if manifest is None \
+                else manifest.completed_output(descriptors, GroupManifest.input_set_hash(descriptors), parameters)
+            if existing_output is None:
+                console.message(f"{len(descriptors)} files ({file_bytes / megabyte:.1f} MB) into "
+                                f"{self.output_file_name(data_model, descriptors, combine_method)}", +1)
+                band_rows = job.get_file_group().get_band_rows(data_model)
+                in_bands = f", in bands of {band_rows} rows" if band_rows > 0 else ""
+                console.message(f"Estimated peak memory {peak_bytes / megabyte:.1f} MB{in_bands}", 0)
+                total_bytes += file_bytes
+                peaks.append(peak_bytes)
+            else:
+                console.message(f"{len(descriptors)} files, already combined into {existing_output}", +1)
+                skipped_count += 1
+            console.pop_level()
+        GroupScheduler.output_lines(trailing_lines, console)
+
+        # Totals, and what running several groups at once would need
+        planned_files = sum(len(job.get_descriptors()) for job in jobs)
+        console.message(f"{len(jobs) - skipped_count} groups to combine, {skipped_count} already combined, "
+                        f"{len(selected_files) - planned_files} files in groups too small to combine", 0)
+        if len(peaks) > 0:
+            peaks.sort(reverse=True)
+            concurrency = min(data_model.get_concurrent_groups(), len(peaks))
+            concurrent_peak = sum(peaks[:concurrency])
+            ceiling_bytes = data_model.get_maximum_memory_megabytes() * megabyte
+            if ceiling_bytes > 0:
+                concurrent_peak = min(concurrent_peak, max(ceiling_bytes, peaks[0]))
+            console.message(f"Estimated {total_bytes / megabyte:.1f} MB read; largest group peak memory "
+                            f"{peaks[0] / megabyte:.1f} MB; up to {concurrent_peak / megabyte:.1f} MB "
+                            f"with {concurrency} groups at once", 0)
+            largest = max(jobs, key=lambda j: j.get_file_group().get_stack_pixels()).get_file_group()
+            method_peaks = [f"{Constants.combine_method_string(method)} "
+                            f"{largest.get_estimated_peak_bytes_for_method(method) / megabyte:.1f} MB"
+                            for method in FileGroup.PEAK_STACK_COPIES]
+            console.message(f"Largest group peak memory by method: {', '.join(method_peaks)}", 0)
+        console.pop_level()
+
+    def plan_groups(self, data_model: DataModel,
+                    selected_files: [FileDescriptor],
+                    console: ConsoleBuffer) -> [GroupJob]:
+        """
+        Divide the given files into the groups to be combined, by size, then temperature, then exposure,
+        then filter, as requested.  Groups smaller than the minimum group size are reported and left out.
+        :param data_model:          Data model specifying options for the current run
+        :param selected_files:      List of descriptions of files to be grouped
+        :param console:             Console buffer collecting the group headings
+        :return:                    List of the groups to be combined, in processing order
+        """
+        jobs: [GroupJob] = []
         minimum_group_size = data_model.get_minimum_group_size() \
             if data_model.get_ignore_groups_fewer_than() else 0
-
-        #  Process size groups, or all sizes if not grouping
-        groups_by_size = self.get_groups_by_size(selected_files, data_model.get_group_by_size())
         group_by_size = data_model.get_group_by_size()
         group_by_temperature = data_model.get_group_by_temperature()
+        group_by_exposure = data_model.get_group_by_exposure()
         group_by_filter = data_model.get_group_by_filter()
-        for size_group in groups_by_size:
+
+        # The planner's groups are sorted by size, then temperature, then exposure, then filter, so each
+        # size group, each temperature group within it, and each exposure group within that, is a run
+        # of adjacent groups
+        file_groups = GroupPlanner.plan_groups(data_model, selected_files)
+        for (size_key, size_run) in groupby(file_groups, FileGroup.get_size_key):
+            size_run = list(size_run)
+            size_count = sum(g.get_file_count() for g in size_run)
             self.check_cancellation()
             console.push_level()
             # Message about this group only if this grouping was requested
-            if len(size_group) < minimum_group_size:
+            if size_count < minimum_group_size:
                 if group_by_size:
-                    console.message(f"Ignoring one size group: {len(size_group)} "
-                                    f"files {size_group[0].get_size_key()}", +1)
+                    console.message(f"Ignoring one size group: {size_count} files {size_key}", +1)
             else:
                 if group_by_size:
-                    console.message(f"Processing one size group: {len(size_group)} "
-                                    f"files {size_group[0].get_size_key()}", +1)
+                    console.message(f"Processing one size group: {size_count} files {size_key}", +1)
                 # Within this size group, process temperature groups, or all temperatures if not grouping
-                groups_by_temperature = \
-                    self.get_groups_by_temperature(size_group,
-                                                   data_model.get_group_by_temperature(),
-                                                   temperature_bandwidth)
-                for temperature_group in groups_by_temperature:
-                    self.check_cancellation()
+                for (_, temperature_run) in groupby(size_run, FileGroup.get_temperature_rank):
+                    temperature_run = list(temperature_run)
+                    temperature_count = sum(g.get_file_count() for g in temperature_run)
+                    mean_temperature = sum(g.get_mean_temperature() * g.get_file_count()
+                                           for g in temperature_run) / temperature_count
                     console.push_level()
-                    (_, mean_temperature) = ImageMath.mean_exposure_and_temperature(
-                        temperature_group)
-                    if len(temperature_group) < minimum_group_size:
+                    if temperature_count < minimum_group_size:
                         if group_by_temperature:
-                            console.message(f"Ignoring one temperature group: {len(temperature_group)} "
+                            console.message(f"Ignoring one temperature group: {temperature_count} "
                                             f"files with mean temperature {mean_temperature:.1f}", +1)
                     else:
                         if group_by_temperature:
-                            console.message(f"Processing one temperature group: {len(temperature_group)} "
+                            console.message(f"Processing one temperature group: {temperature_count} "
                                             f"files with mean temperature {mean_temperature:.1f}", +1)
-                        # Within this temperature group, process filter groups, or all filters if not grouping
-                        groups_by_filter = \
-                            self.get_groups_by_filter(temperature_group,
-                                                      data_model.get_group_by_filter())
-                        for filter_group in groups_by_filter:
-                            self.check_cancellation()
+                        # Within this temperature group, process exposure groups, or all exposures if not grouping
+                        for (_, exposure_run) in groupby(temperature_run, FileGroup.get_exposure_rank):
+                            exposure_run = list(exposure_run)
+                            exposure_count = sum(g.get_file_count() for g in exposure_run)
+                            mean_exposure = sum(g.get_mean_exposure() * g.get_file_count()
+                                                for g in exposure_run) / exposure_count
                             console.push_level()
-                            filter_name = filter_group[0].get_filter_name()
-                            if len(filter_group) < minimum_group_size:
-                                if group_by_filter:
-                                    console.message(f"Ignoring one filter group: {len(filter_group)} "
-                                                    f"files with {filter_name} filter ", +1)
+                            if exposure_count < minimum_group_size:
+                                if group_by_exposure:
+                                    console.message(f"Ignoring one exposure group: {exposure_count} "
+                                                    f"files with mean exposure {mean_exposure:.2f}", +1)
                             else:
-                                if group_by_filter:
-                                    console.message(f"Processing one filter group: {len(filter_group)} "
-                                                    f"files with {filter_name} filter ", +1)
-                                self.process_one_group(data_model, filter_group,
-                                                       output_directory,
-                                                       data_model.get_master_combine_method(),
-                                                       substituted_folder_name,
-                                                       console)
+                                if group_by_exposure:
+                                    console.message(f"Processing one exposure group: {exposure_count} "
+                                                    f"files with mean exposure {mean_exposure:.2f}", +1)
+                                # Within this exposure group, process filter groups, or all filters if not grouping
+                                for filter_group in exposure_run:
+                                    self.plan_filter_group(filter_group, minimum_group_size, group_by_filter,
+                                                           jobs, console)
                             console.pop_level()
-                        self.check_cancellation()
                     console.pop_level()
             console.pop_level()
-        console.message("Group combining complete", 0)
+        return jobs
+
+    @staticmethod
+    def plan_filter_group(filter_group: FileGroup,
+                          minimum_group_size: int,
+                          group_by_filter: bool,
+                          jobs: [GroupJob],
+                          console: ConsoleBuffer):
+        """
+        Add one filter group to the planned groups, unless it is smaller than the minimum group size
+        :param filter_group:        Group of files with one size, temperature, exposure and filter
+        :param minimum_group_size:  Smallest group to be combined (0 for all)
+        :param group_by_filter:     Is grouping by filter in use, so the group is reported by filter?
+        :param jobs:                List of planned groups, to which the group is added
+        :param console:             Console buffer collecting the group headings
+        """
+        console.push_level()
+        filter_name = filter_group.get_filter_name()
+        if filter_group.get_file_count() < minimum_group_size:
+            if group_by_filter:
+                console.message(f"Ignoring one filter group: {filter_group.get_file_count()} "
+                                f"files with {filter_name} filter ", +1)
+        else:
+            if group_by_filter:
+                console.message(f"Processing one filter group: {filter_group.get_file_count()} "
+                                f"files with {filter_name} filter ", +1)
+            jobs.append(GroupJob(filter_group, console.take_lines(), console.get_message_level()))
         console.pop_level()
 
+    @staticmethod
+    def skip_completed_groups(jobs: [GroupJob],
+                              trailing_lines: [dict],
+                              manifest: GroupManifest,
+                              input_set_hashes: {str: str},
+                              parameters: dict) -> ([GroupJob], [dict]):
+        """
+        Remove the groups that the manifest shows were already combined, from the same files with the
+        same parameters, into an output file that still exists.  A skipped group's headings, and a
+        note that it was skipped, are carried into the next remaining group's headings, or into the
+        trailing lines if no group remains after it, so the console output keeps the plan's order.
+        :param jobs:                Planned groups, in plan order
+        :param trailing_lines:      Planning lines that follow the last group
+        :param manifest:            Manifest of groups completed in earlier sessions
+        :param input_set_hashes:    Hash of each group's files, by group key
+        :param parameters:          Parameters of this session, as recorded in the manifest
+        :return:                    Tuple of the groups still to be combined, and the new trailing lines
+        """
+        remaining: [GroupJob] = []
+        carried_lines: [dict] = []
+        for job in jobs:
+            descriptors = job.get_descriptors()
+            existing_output = manifest.completed_output(descriptors,
+                                                        input_set_hashes[GroupManifest.group_key(descriptors)],
+                                                        parameters)
+            if existing_output is None:
+                job.set_header_lines(carried_lines + job.get_header_lines())
+                carried_lines = []
+                remaining.append(job)
+            else:
+                note_console = ConsoleBuffer(job.get_message_level())
+                note_console.message(f"Skipping group of {len(descriptors)} files, already combined into "
+                                     f"{existing_output}", +1)
+                carried_lines += job.get_header_lines() + note_console.take_lines()
+        return remaining, carried_lines + trailing_lines
+
+    @classmethod
+    def combine_one_group(cls, session_controller: SessionController,
+                          file_moved_callback: Callable[[str], None],
+                          data_model: DataModel,
+                          descriptor_list: [FileDescriptor],
+                          output_directory: str,
+                          disposition_folder_name: str,
+                          console: Console) -> str:
+        """
+        Combine one planned group with a combiner of its own.  This is the group processor given to
+        the group scheduler, which calls it in this process or in a worker process.
+        :param session_controller:          Controller used to cancel the session
+        :param file_moved_callback:         Callback method to inform that we have moved a processed file
+        :param data_model:                  Data model giving options for current run
+        :param descriptor_list:             List of all the files in one group, for processing
+        :param output_directory:            Path to directory to receive the output file
+        :param disposition_folder_name:     If files to be moved after processing, name of receiving folder
+        :param console:                     Re-directable console output object
+        :return:                            Path of the output file
+        """
+        file_combiner = cls(session_controller, file_moved_callback)
+        return file_combiner.process_one_group(data_model, descriptor_list, output_directory,
+                                               data_model.get_master_combine_method(),
+                                               disposition_folder_name, console)
 
     def process_one_group(self,
                           data_model: DataModel,
@@ -166,7 +373,7 @@ class FileCombiner:
                           output_directory: str,
                           combine_method: int,
                           disposition_folder_name,
-                          console: Console):
+                          console: Console) -> str:
         """
         Process one group of files, output to the given directory
         Exceptions thrown:
@@ -179,6 +386,7 @@ class FileCombiner:
         :param combine_method:              Code saying how these files should be combined
         :param disposition_folder_name:     If files to be moved after processing, name of receiving folder
         :param console:                     Re-directable console output object
+        :return:                            Path of the output file
         """
         assert len(descriptor_list) > 0
         sample_file: FileDescriptor = descriptor_list[0]
@@ -186,9 +394,7 @@ class FileCombiner:
         self.describe_group(data_model, len(descriptor_list), sample_file, console)
 
         # Make up a file name for this group's output, into the given directory
-        file_name = SharedUtils.get_file_name_portion(combine_method, sample_file,
-                                                      data_model.get_sigma_clip_threshold(),
-                                                      data_model.get_min_max_number_clipped_per_end())
+        file_name = self.output_file_name(data_model, descriptor_list, combine_method)
         output_file = f"{output_directory}/{file_name}"
 
         # Confirm that these are all flat frames, and can be combined (same binning and dimensions)
@@ -202,7 +408,7 @@ class FileCombiner:
                 filter_name = SharedUtils.most_common_filter_name(descriptor_list)
 
                 # Do the combination
-                self.combine_files(descriptor_list, data_model, filter_name, output_file, console)
+                output_file = self.combine_files(descriptor_list, data_model, filter_name, output_file, console)
                 self.check_cancellation()
                 # Files are combined.  Put away the inputs?
                 # Return list of any that were moved, in case the UI needs to be adjusted
@@ -216,6 +422,21 @@ class FileCombiner:
             raise MasterMakerExceptions.IncompatibleSizes
 
         console.pop_level()
+        return output_file
+
+    @staticmethod
+    def output_file_name(data_model: DataModel, descriptor_list: [FileDescriptor], combine_method: int) -> str:
+        """
+        Make up the name of the output file for one group.  Any date and time in it are the current ones.
+        :param data_model:          Data model giving options for current run
+        :param descriptor_list:     List of all the files in the group
+        :param combine_method:      Code saying how these files are combined
+        :return:                    File name, without directory
+        """
+        return SharedUtils.get_file_name_portion(combine_method, descriptor_list[0],
+                                                 data_model.get_sigma_clip_threshold(),
+                                                 data_model.get_min_max_number_clipped_per_end(),
+                                                 data_model.get_group_by_exposure())
 
     def handle_input_files_disposition(self,
                                        disposition_type: int,
@@ -239,7 +460,9 @@ class FileCombiner:
             console.message("Moving processed files to " + sub_folder_name, 0)
             # User wants us to move the input files into a sub-folder
             for descriptor in descriptors:
-                if SharedUtils.dispose_one_file_to_sub_folder(descriptor, sub_folder_name):
+                with StageProfiler.stage("move"):
+                    moved = SharedUtils.dispose_one_file_to_sub_folder(descriptor, sub_folder_name)
+                if moved:
                     # Successfully moved the file;  tell the user interface
                     self.callback_method(descriptor.get_absolute_path())
 
@@ -334,87 +557,6 @@ class FileCombiner:
 
         return True
 
-    @staticmethod
-    def get_groups_by_size(selected_files: [FileDescriptor],
-                           is_grouped: bool) -> [[FileDescriptor]]:
-        """
-        Given list of file descriptors, return a list of lists, where each outer list is all the
-        file descriptors with the same size (dimensions and binning).  If "is_grouped" is False,
-        just return all the files in one group.
-
-        :param selected_files:      List of files to be grouped
-        :param is_grouped:          Flag whether size grouping is to be performed
-        :return:                    List of lists - one outer list per size group
-        """
-        if is_grouped:
-            descriptors_sorted = sorted(selected_files, key=FileDescriptor.get_size_key)
-            descriptors_grouped = groupby(descriptors_sorted, FileDescriptor.get_size_key)
-            result: [[FileDescriptor]] = []
-            for key, sub_group in descriptors_grouped:
-                sub_list = list(sub_group)
-                result.append(sub_list)
-            return result
-        else:
-            return [selected_files]   # One group with all the files
-
-
-    @staticmethod
-    def get_groups_by_filter(selected_files: [FileDescriptor],
-                             is_grouped: bool) -> [[FileDescriptor]]:
-        """
-        Given list of file descriptors, return a list of lists, where each outer list is all the
-        file descriptors with the same filter name (case insensitive).  If "is_grouped" is False,
-        just return all the files in one group.
-
-        :param selected_files:      List of files to be grouped
-        :param is_grouped:          Flag whether size grouping is to be performed
-        :return:                    List of lists - one outer list per filter group
-        """
-        if is_grouped:
-            descriptors_sorted = sorted(selected_files, key=FileDescriptor.get_filter_name_lower)
-            descriptors_grouped = groupby(descriptors_sorted, FileDescriptor.get_filter_name_lower)
-            result: [[FileDescriptor]] = []
-            for key, sub_group in descriptors_grouped:
-                sub_list = list(sub_group)
-                result.append(sub_list)
-            return result
-        else:
-            return [selected_files]   # One group with all the files
-
-    def get_groups_by_temperature(self,
-                                  selected_files: [FileDescriptor],
-                                  is_grouped: bool,
-                                  bandwidth: float) -> [[FileDescriptor]]:
-        """
-        Given list of file descriptors, return a list of lists, where each outer list is all the
-        file descriptors with the same temperature within a given tolerance
-        Note that, because of the "tolerance" comparison, this is a clustering analysis, not
-        a simple python "groupby", which assumes the values are exact.
-
-        :param selected_files:      List of files to be grouped
-        :param is_grouped:          Flag whether size grouping is to be performed
-        :param bandwidth:           Bandwidth of sensitivity of clustering algorithm
-        :return:                    List of lists - one outer list per temperature group
-        """
-        # For this simple 1-dimensional clustering we can use the MeanShift function from
-        # the machine learning package, sklearn
-
-        if is_grouped:
-            # We'll get the indices of the temperature clusters, then use those indices
-            # on the file descriptors
-            temperatures: [float] = [file.get_temperature() for file in selected_files]
-            result_array: [[FileDescriptor]] = self.cluster_descriptors_by_values(bandwidth,
-                                                                                  temperatures,
-                                                                                  selected_files)
-
-            # The groups array is in arbitrary order - determined by the clustering algorithm
-            # We'd like to have it in a predictable order.  Sort by first temperature in each group
-            result_array.sort(key=lambda g: g[0].get_temperature())
-            return result_array
-
-        else:
-            return [selected_files]   # One group with all the files
-
     @staticmethod
     def cluster_descriptors_by_values(bandwidth: float,
                                       cluster_values: [float],
@@ -428,10 +570,9 @@ class FileCombiner:
         :return:                Clusters as list of lists - one outer list per cluster-value group
         """
         result_array: [[FileDescriptor]] = []
-        data_to_cluster = numpy.array(cluster_values).reshape(-1, 1)
-        mean_shifter = ms.MeanShift()
-        mean_shift_result = mean_shifter.cluster(data_to_cluster, kernel_bandwidth=bandwidth)
-        arbitrary_cluster_labels = mean_shift_result.cluster_ids
+        # One-dimensional mean shift, giving the same clusters as mean_shift.MeanShift but in
+        # milliseconds rather than time growing with the square of the number of files
+        arbitrary_cluster_labels = ValueClusterer.cluster(cluster_values, bandwidth)
         # cluster_labels is an array of integers, with each "cluster" having the same integer label
         unique_labels = numpy.unique(arbitrary_cluster_labels)
         # So if we gather the unique label values, that is gathering the clusters
@@ -476,7 +617,7 @@ class FileCombiner:
                       data_model: DataModel,
                       filter_name: str,
                       output_path: str,
-                      console: Console):
+                      console: Console) -> str:
         """
         Combine the given files, output to the given output file using the combination
         method defined in the data model.
@@ -486,11 +627,15 @@ class FileCombiner:
         :param filter_name:     Human-readable filter name (for output file name and FITS comment)
         :param output_path:     Path for output fiel to be created
         :param console:         Redirectable console output object
+        :return:                Path of the output file, with any date, time and filter substituted
         """
         console.push_level()    # Stack console indentation level to easily restore when done
         substituted_file_name = SharedUtils.substitute_date_time_filter_in_string(output_path)
         file_names = [d.get_absolute_path() for d in input_files]
         combine_method = data_model.get_master_combine_method()
+        start_time = time.monotonic()
+        console.event("group_start", files=len(file_names), bytes=sum(os.path.getsize(f) for f in file_names),
+                      method=Constants.combine_method_string(combine_method), output=substituted_file_name)
         # Get info about any precalibration that is to be done
         calibrator = Calibrator(data_model)
         calibration_tag = calibrator.fits_comment_tag()
@@ -498,50 +643,56 @@ class FileCombiner:
         binning: int = input_files[0].get_binning()
         (mean_exposure, mean_temperature) = ImageMath.mean_exposure_and_temperature(input_files)
         if combine_method == Constants.COMBINE_MEAN:
-            mean_data = ImageMath.combine_mean(file_names, calibrator, console, self._session_controller)
-            self.check_cancellation()
-            RmFitsUtil.create_combined_fits_file(substituted_file_name, mean_data,
-                                                 FileDescriptor.FILE_TYPE_FLAT,
-                                                 "Flat Frame",
-                                                 mean_exposure, mean_temperature, filter_name, binning,
-                                                 f"Master Flat MEAN combined {calibration_tag}")
+            parameter = 0
+            comment = f"Master Flat MEAN combined {calibration_tag}"
         elif combine_method == Constants.COMBINE_MEDIAN:
-            median_data = ImageMath.combine_median(file_names, calibrator, console, self._session_controller)
-            self.check_cancellation()
-            RmFitsUtil.create_combined_fits_file(substituted_file_name, median_data,
-                                                 FileDescriptor.FILE_TYPE_FLAT,
-                                                 "Flat Frame",
-                                                 mean_exposure, mean_temperature, filter_name, binning,
-                                                 f"Master Flat MEDIAN combined {calibration_tag}")
+            parameter = 0
+            comment = f"Master Flat MEDIAN combined {calibration_tag}"
         elif combine_method == Constants.COMBINE_MINMAX:
-            number_dropped_points = data_model.get_min_max_number_clipped_per_end()
-            min_max_clipped_mean = ImageMath.combine_min_max_clip(file_names, number_dropped_points,
-                                                                  calibrator, console,
-                                                                  self._session_controller)
-            self.check_cancellation()
-            assert min_max_clipped_mean is not None
-            RmFitsUtil.create_combined_fits_file(substituted_file_name, min_max_clipped_mean,
-                                                 FileDescriptor.FILE_TYPE_FLAT,
-                                                 "Flat Frame",
-                                                 mean_exposure, mean_temperature, filter_name, binning,
-                                                 f"Master Flat Min/Max Clipped "
-                                                 f"(drop {number_dropped_points}) Mean combined"
-                                                 f" {calibration_tag}")
+            parameter = data_model.get_min_max_number_clipped_per_end()
+            comment = f"Master Flat Min/Max Clipped (drop {parameter}) Mean combined {calibration_tag}"
         else:
             assert combine_method == Constants.COMBINE_SIGMA_CLIP
-            sigma_threshold = data_model.get_sigma_clip_threshold()
-            sigma_clipped_mean = ImageMath.combine_sigma_clip(file_names, sigma_threshold,
-                                                              calibrator, console, self._session_controller)
-            self.check_cancellation()
-            assert sigma_clipped_mean is not None
-            RmFitsUtil.create_combined_fits_file(substituted_file_name, sigma_clipped_mean,
-                                                 FileDescriptor.FILE_TYPE_FLAT,
-                                                 "Flat Frame",
-                                                 mean_exposure, mean_temperature, filter_name, binning,
-                                                 f"Master Flat Sigma Clipped "
-                                                 f"(threshold {sigma_threshold}) Mean combined"
-                                                 f" {calibration_tag}")
+            parameter = data_model.get_sigma_clip_threshold()
+            comment = f"Master Flat Sigma Clipped (threshold {parameter}) Mean combined {calibration_tag}"
+        # A group too big for the memory budget is combined a band of rows at a time
+        file_group = FileGroup(input_files, "", 0, 0, "")
+        band_rows = file_group.get_band_rows(data_model)
+        if band_rows > 0:
+            megabyte = 1024 * 1024
+            whole_peak = file_group.get_estimated_peak_bytes_for_method(combine_method)
+            console.message(f"Estimated peak memory {whole_peak / megabyte:.1f} MB is over the "
+                            f"{FileGroup.get_memory_budget_bytes(data_model) / megabyte:.0f} MB budget; "
+                            f"{file_group.get_estimated_peak_bytes(data_model) / megabyte:.1f} MB "
+                            f"in bands of {band_rows} rows", 0)
+            combined_data = ImageMath.combine_in_bands(file_names, combine_method, parameter, band_rows,
+                                                       calibrator, console, self._session_controller)
+        elif combine_method == Constants.COMBINE_MEAN:
+            combined_data = ImageMath.combine_mean(file_names, calibrator, console, self._session_controller)
+        elif combine_method == Constants.COMBINE_MEDIAN:
+            combined_data = ImageMath.combine_median(file_names, calibrator, console, self._session_controller)
+        elif combine_method == Constants.COMBINE_MINMAX:
+            combined_data = ImageMath.combine_min_max_clip(file_names, parameter,
+                                                           calibrator, console,
+                                                           self._session_controller)
+        else:
+            combined_data = ImageMath.combine_sigma_clip(file_names, parameter,
+                                                         calibrator, console, self._session_controller)
+        self.check_cancellation()
+        assert combined_data is not None
+        write_start_time = time.monotonic()
+        RmFitsUtil.create_combined_fits_file(substituted_file_name, combined_data,
+                                             FileDescriptor.FILE_TYPE_FLAT,
+                                             "Flat Frame",
+                                             mean_exposure, mean_temperature, filter_name, binning,
+                                             comment)
+        end_time = time.monotonic()
+        console.event("output_written", path=substituted_file_name, bytes=os.path.getsize(substituted_file_name),
+                      seconds=round(end_time - write_start_time, 6))
+        console.event("group_end", files=len(file_names), output=substituted_file_name,
+                      seconds=round(end_time - start_time, 6))
         console.pop_level()
+        return substituted_file_name
 
     @staticmethod
     def describe_group(data_model: DataModel,
@@ -564,6 +715,8 @@ class FileCombiner:
             message_parts.append(f"with {sample_file.get_filter_name()} filter")
         if data_model.get_group_by_temperature():
             message_parts.append(f"at {temperature} degrees")
+        if data_model.get_group_by_exposure():
+            message_parts.append(f"exposed {sample_file.get_exposure()} seconds")
         processing_message = ", ".join(message_parts)
         console.message(f"Processing {number_files} files {processing_message}.", +1)
 
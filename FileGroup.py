@@ -0,0 +1,181 @@
+#
+#   One group of files found by the group planner: the files sharing a size, temperature cluster,
+#   exposure cluster and filter (for whichever of those groupings are in use), the keys that place the group in the
+#   plan, and statistics computed once for the reporting and scheduling code to share.
+#
+#   The group's cost is estimated from what the descriptors already say - number of frames and their
+#   dimensions - and the combination method, so the scheduler can start the biggest groups first
+#   and keep the combined peak memory of the groups running at once under a ceiling.  A group that
+#   would need more than the memory budget by itself is combined a band of rows at a time, with the
+#   band height chosen so its estimated peak fits the budget.
+#
+from Constants import Constants
+from DataModel import DataModel
+from FileDescriptor import FileDescriptor
+from ImageMath import ImageMath
+
+
+class FileGroup:
+
+    # Bytes per pixel of the calibrated image stack the combination methods work on
+    STACK_BYTES_PER_PIXEL = 8
+
+    # Peak memory of each combination method, in copies of the image stack held at once: the files
+    # as read plus the calibrated stack, and the method's own temporaries (the sigma clip holds
+    # deviations, z-scores and a masked copy).
+    PEAK_STACK_COPIES = {Constants.COMBINE_MEAN: 2,
+                         Constants.COMBINE_MEDIAN: 3,
+                         Constants.COMBINE_MINMAX: 3,
+                         Constants.COMBINE_SIGMA_CLIP: 5}
+
+    # Time per pixel of each combination method, relative to reading and calibrating the pixel.
+    # Min-max clipping repeats its work for each value clipped per end.
+    READ_WORK = 2.0
+    METHOD_WORK = {Constants.COMBINE_MEAN: 1.0,
+                   Constants.COMBINE_MEDIAN: 20.0,
+                   Constants.COMBINE_MINMAX: 20.0,
+                   Constants.COMBINE_SIGMA_CLIP: 17.0}
+
+    def __init__(self, descriptors: [FileDescriptor], size_key: str, temperature_rank: int,
+                 exposure_rank: int, filter_key: str):
+        """
+        Initialize this group and compute its statistics
+        :param descriptors:         Files in the group, in their original order
+        :param size_key:            Size key of the files, or "" if not grouping by size
+        :param temperature_rank:    Position of the group's temperature cluster among the clusters of
+                                    its size, coolest first, or 0 if not grouping by temperature
+        :param exposure_rank:       Position of the group's exposure cluster among the clusters of its
+                                    size and temperature, shortest first, or 0 if not grouping by exposure
+        :param filter_key:          Lower-case filter name of the files, or "" if not grouping by filter
+        """
+        assert len(descriptors) > 0
+        self._descriptors = descriptors
+        self._size_key = size_key
+        self._temperature_rank = temperature_rank
+        self._exposure_rank = exposure_rank
+        self._filter_key = filter_key
+        (self._mean_exposure, self._mean_temperature) = ImageMath.mean_exposure_and_temperature(descriptors)
+
+    def get_descriptors(self) -> [FileDescriptor]:
+        return self._descriptors
+
+    def get_file_count(self) -> int:
+        return len(self._descriptors)
+
+    def get_size_key(self) -> str:
+        return self._size_key
+
+    def get_temperature_rank(self) -> int:
+        return self._temperature_rank
+
+    def get_exposure_rank(self) -> int:
+        return self._exposure_rank
+
+    def get_filter_key(self) -> str:
+        return self._filter_key
+
+    def get_filter_name(self) -> str:
+        return self._descriptors[0].get_filter_name()
+
+    def get_mean_exposure(self) -> float:
+        return self._mean_exposure
+
+    def get_mean_temperature(self) -> float:
+        return self._mean_temperature
+
+    def get_stack_pixels(self) -> int:
+        """
+        Get the number of pixels in the stack of all this group's images
+        :return:    Number of frames times the pixels in each
+        """
+        sample = self._descriptors[0]
+        return len(self._descriptors) * sample.get_x_dimension() * sample.get_y_dimension()
+
+    def get_estimated_peak_bytes(self, data_model: DataModel) -> int:
+        """
+        Estimate the most memory used at once while combining this group, in bands if it will be
+        :param data_model:  Data model giving the combination method and memory budget
+        :return:            Estimated peak memory in bytes
+        """
+        combine_method = data_model.get_master_combine_method()
+        band_rows = self.get_band_rows(data_model)
+        if band_rows == 0:
+            return self.get_estimated_peak_bytes_for_method(combine_method)
+        return band_rows * self.get_row_peak_bytes(combine_method) + self.get_image_bytes()
+
+    def get_image_bytes(self) -> int:
+        """
+        Get the size of one image of the group, as the combined image is held while bands are combined
+        :return:    Bytes in one image
+        """
+        sample = self._descriptors[0]
+        return sample.get_x_dimension() * sample.get_y_dimension() * self.STACK_BYTES_PER_PIXEL
+
+    def get_row_peak_bytes(self, combine_method: int) -> int:
+        """
+        Estimate the memory needed for each row of a band while combining a band at a time
+        :param combine_method:  Code of the combination method
+        :return:                Estimated peak memory per row of the band, in bytes
+        """
+        return len(self._descriptors) * self._descriptors[0].get_x_dimension() \
+            * self.STACK_BYTES_PER_PIXEL * self.PEAK_STACK_COPIES[combine_method]
+
+    @staticmethod
+    def get_memory_budget_bytes(data_model: DataModel) -> int:
+        """
+        Get the memory one group may use: the smaller of the worker memory budget and the
+        ceiling on all the groups at once, whichever of them are set
+        :param data_model:  Data model giving the memory settings
+        :return:            Memory budget in bytes, or 0 if there is none
+        """
+        limits = [megabytes for megabytes in (data_model.get_worker_memory_megabytes(),
+                                              data_model.get_maximum_memory_megabytes()) if megabytes > 0]
+        return min(limits) * 1024 * 1024 if len(limits) > 0 else 0
+
+    def may_combine_in_bands(self, data_model: DataModel) -> bool:
+        """
+        Determine if this group can be combined a band of rows at a time.  Overscan calibration can
+        only calibrate a band by itself if the overscan rectangle covers every row, since rows outside it
+        use the estimate of the nearest rectangle row.
+        :param data_model:  Data model giving the calibration
+        :return:            True if bands can be used
+        """
+        if data_model.get_precalibration_type() != Constants.CALIBRATION_OVERSCAN:
+            return True
+        (_, _, y_start, y_end) = data_model.get_overscan_rectangle()
+        return y_start == 0 and y_end == self._descriptors[0].get_y_dimension()
+
+    def get_band_rows(self, data_model: DataModel) -> int:
+        """
+        Choose whether this group is combined whole or a band of rows at a time, and the band height.
+        Bands are used only when the whole group's estimated peak memory is over the memory budget,
+        and are as tall as fits the budget, though never less than one row.
+        :param data_model:  Data model giving the combination method, calibration and memory budget
+        :return:            Number of rows in each band, or 0 to combine the whole images at once
+        """
+        budget_bytes = self.get_memory_budget_bytes(data_model)
+        combine_method = data_model.get_master_combine_method()
+        if budget_bytes == 0 or self.get_estimated_peak_bytes_for_method(combine_method) <= budget_bytes \
+                or not self.may_combine_in_bands(data_model):
+            return 0
+        return max(1, (budget_bytes - self.get_image_bytes()) // self.get_row_peak_bytes(combine_method))
+
+    def get_estimated_peak_bytes_for_method(self, combine_method: int) -> int:
+        """
+        Estimate the most memory used at once while combining this group with a given method
+        :param combine_method:  Code of the combination method
+        :return:                Estimated peak memory in bytes
+        """
+        return self.get_stack_pixels() * self.STACK_BYTES_PER_PIXEL * self.PEAK_STACK_COPIES[combine_method]
+
+    def get_estimated_work(self, data_model: DataModel) -> float:
+        """
+        Estimate the time needed to combine this group, in arbitrary units, for comparison with others
+        :param data_model:  Data model giving the combination method and its parameters
+        :return:            Estimated relative cost
+        """
+        combine_method = data_model.get_master_combine_method()
+        method_work = self.METHOD_WORK[combine_method]
+        if combine_method == Constants.COMBINE_MINMAX:
+            method_work *= data_model.get_min_max_number_clipped_per_end()
+        return self.get_stack_pixels() * (self.READ_WORK + method_work)
@@ -1,7 +1,9 @@
 from PyQt5.QtCore import QAbstractTableModel, QModelIndex, Qt, QVariant
 from PyQt5.QtWidgets import QTableView
 
+from DataModel import DataModel
 from FileDescriptor import FileDescriptor
+from GroupIndex import GroupIndex
 
 
 #   Model for the file table shown on the main UI.  The table consists of one row per file
@@ -16,10 +18,14 @@ from FileDescriptor import FileDescriptor
 #       4:  Binning         The binning value (1x1, 2x2, etc., or Unknown)
 #       5:  Filter          Name of filter if light or flat frame
 #       6:  Exposure        Exposure time of frame in seconds
+#       7:  Group           Number of the group the file would be combined in, and the group's size
+#       8:  Avg ADUs        Average pixel value, if that option is on
+#   The groups are kept in a group index, updated as files are added and removed.
 
 
 class FitsFileTableModel(QAbstractTableModel):
-    headings = ["Name", "Type", "Filter", "Dimensions", "Binning", "Exp.", "Temp.", "Avg ADUs"]
+    GROUP_COLUMN = 7
+    headings = ["Name", "Type", "Filter", "Dimensions", "Binning", "Exp.", "Temp.", "Group", "Avg ADUs"]
 
     def __init__(self, table: QTableView, ignore_file_type: bool, display_average_adus: bool):
         """
@@ -33,6 +39,7 @@ class FitsFileTableModel(QAbstractTableModel):
         self._ignore_file_type = ignore_file_type
         self._table = table
         self._display_average_adus = display_average_adus
+        self._group_index = GroupIndex()
 
     def set_ignore_file_type(self, ignore: bool):
         self._ignore_file_type = ignore
@@ -43,8 +50,44 @@ class FitsFileTableModel(QAbstractTableModel):
     def set_file_descriptors(self, file_descriptors: [FileDescriptor]):
         self.beginResetModel()
         self._files_list = file_descriptors
+        self._group_index.clear()
+        self._group_index.add_descriptors(file_descriptors)
         self.endResetModel()
 
+    def add_file_descriptors(self, file_descriptors: [FileDescriptor]):
+        """
+        Add the given files to the end of the table, skipping any whose path is already in it
+        :param file_descriptors:    Descriptors of the files to be added
+        """
+        known_paths = set(d.get_absolute_path() for d in self._files_list)
+        new_descriptors = [d for d in file_descriptors if d.get_absolute_path() not in known_paths]
+        if len(new_descriptors) > 0:
+            first_row = len(self._files_list)
+            self.beginInsertRows(QModelIndex(), first_row, first_row + len(new_descriptors) - 1)
+            self._files_list = self._files_list + new_descriptors
+            self._group_index.add_descriptors(new_descriptors)
+            self.endInsertRows()
+            self.groups_changed()
+
+    def set_grouping(self, data_model: DataModel):
+        """
+        Take note of the grouping options, re-grouping the files in the table if they have changed
+        :param data_model:  Data model giving the grouping options
+        """
+        self._group_index.set_grouping(data_model)
+        self.groups_changed()
+
+    def get_group_count(self) -> int:
+        return self._group_index.get_group_count()
+
+    def groups_changed(self):
+        """
+        Tell the table view that the group column may have changed in any row
+        """
+        if len(self._files_list) > 0:
+            self.dataChanged.emit(self.createIndex(0, self.GROUP_COLUMN),
+                                  self.createIndex(len(self._files_list) - 1, self.GROUP_COLUMN))
+
     # noinspection PyMethodOverriding
     def rowCount(self, parent: QModelIndex) -> int:
         """
@@ -93,6 +136,8 @@ class FitsFileTableModel(QAbstractTableModel):
             elif column_index == 6:
                 result = str(descriptor.get_temperature())
             elif column_index == 7:
+                result = self.group_description(descriptor)
+            elif column_index == 8:
                 result = f"{descriptor.get_average_adus():,}"
             else:
                 result = f"<{row_index},{column_index}>"
@@ -102,6 +147,17 @@ class FitsFileTableModel(QAbstractTableModel):
             result = QVariant()
         return result
 
+    def group_description(self, descriptor: FileDescriptor) -> str:
+        """
+        Describe the group a file is in, for the group column
+        :param descriptor:  File in the table
+        :return:            Group number and number of files in the group, or empty if not grouping
+        """
+        if not self._group_index.is_grouping():
+            return ""
+        path = descriptor.get_absolute_path()
+        return f"{self._group_index.get_group_number(path)}: {self._group_index.get_group_file_count(path)} files"
+
     # noinspection PyMethodOverriding
     def headerData(self, item_number, orientation, role):
         """
@@ -161,6 +217,10 @@ class FitsFileTableModel(QAbstractTableModel):
                                       key=FileDescriptor.get_temperature,
                                       reverse=reverse_flag)
         elif column_index == 7:
+            self._files_list = sorted(self._files_list,
+                                      key=lambda d: self._group_index.get_group_number(d.get_absolute_path()) or 0,
+                                      reverse=reverse_flag)
+        elif column_index == 8:
             self._files_list = sorted(self._files_list,
                                       key=FileDescriptor.get_average_adus,
                                       reverse=reverse_flag)
@@ -191,6 +251,7 @@ class FitsFileTableModel(QAbstractTableModel):
         """
         self.beginResetModel()
         self._files_list = []
+        self._group_index.clear()
         self.endResetModel()
 
     def remove_files(self, descriptors: [FileDescriptor]):
@@ -207,9 +268,11 @@ class FitsFileTableModel(QAbstractTableModel):
                 if self._files_list[row_index].get_name() == name_to_remove:
                     model_index = self.createIndex(row_index, 0)
                     self.beginRemoveRows(model_index.parent(), row_index, row_index)
+                    self._group_index.remove_path(self._files_list[row_index].get_absolute_path())
                     del self._files_list[row_index]
                     self.endRemoveRows()
                     break
+        self.groups_changed()
 
     def remove_file_path(self, path_to_remove: str):
         """
@@ -224,7 +287,9 @@ class FitsFileTableModel(QAbstractTableModel):
                 model_index = self.createIndex(row_index, 0)
                 self.beginRemoveRows(model_index.parent(), row_index, row_index)
                 del self._files_list[row_index]
+                self._group_index.remove_path(path_to_remove)
                 self.endRemoveRows()
+                self.groups_changed()
                 break
 
     def adu_display_changed(self, display: bool):
@@ -0,0 +1,211 @@
+#
+#   Watch-folder mode (--watch): monitors a capture directory and combines each group of flats as
+#   soon as it is complete, so the masters are ready minutes after the last flat is taken.
+#
+#   The directory is polled.  A file is read only once it has kept the same size and modification
+#   time for a whole poll, so files still being written are left alone, and only new files are read.
+#   The files read are kept in a group index, which re-groups only the sizes that gained files.
+#   A group is combined once it has at least the minimum group size (if that option is in use) and
+#   no file has joined it for the quiet time.  Its files then leave the index; any file arriving later
+#   with the same characteristics starts a new group.
+#
+#   Watching continues until interrupted, or until the session controller is cancelled (as the
+#   combine server does).  Groups not yet combined when watching stops are listed.
+#
+import os
+import time
+
+import MasterMakerExceptions
+from Console import Console
+from DataModel import DataModel
+from FileCombiner import FileCombiner
+from FileDescriptor import FileDescriptor
+from GroupIndex import GroupIndex
+from RmFitsUtil import RmFitsUtil
+from SessionController import SessionController
+from SharedUtils import SharedUtils
+
+
+class FolderWatcher:
+
+    # Seconds between looks at the directory; a file must be unchanged for this long to be read
+    POLL_SECONDS = 2.0
+
+    # Why a group was not combined, for each of the program's exceptions that combining one group can raise.
+    # Any of these stops only that group; watching carries on with the others.
+    GROUP_FAILURES = {
+        MasterMakerExceptions.NotAllFlatFrames: "not all flat frames",
+        MasterMakerExceptions.IncompatibleSizes: "sizes or binning differ",
+        MasterMakerExceptions.NoSuitableAutoBias: "no bias or dark file of its size in the calibration directory",
+        MasterMakerExceptions.NoSuitableAutoDark: "no dark file of its size, with a non-zero exposure, "
+                                                  "in the calibration directory",
+        MasterMakerExceptions.NoAutoCalibrationDirectory: "calibration directory not found",
+        MasterMakerExceptions.AutoCalibrationDirectoryEmpty: "no calibration files in the calibration directory",
+        MasterMakerExceptions.AutoCalibrationNoBiasFiles: "no bias files in the calibration directory",
+        MasterMakerExceptions.InvalidOverscanRegion: "the overscan region is empty or outside the images",
+        MasterMakerExceptions.NoGroupOutputDirectory: "output directory missing",
+    }
+
+    def __init__(self, data_model: DataModel,
+                 directory: str,
+                 output_directory: str,
+                 quiet_seconds: float,
+                 session_controller: SessionController,
+                 console: Console):
+        """
+        Initialize the watcher
+        :param data_model:          Data model giving the grouping and combination options
+        :param directory:           Directory to be watched for new files
+        :param output_directory:    Directory to receive the combined groups
+        :param quiet_seconds:       Time a group must go without new files before it is combined
+        :param session_controller:  Controller used to stop watching, and to cancel a combination
+        :param console:             Re-directable console output object
+        """
+        self._data_model = data_model
+        self._directory = directory
+        self._output_directory = output_directory
+        self._quiet_seconds = quiet_seconds
+        self._session_controller = session_controller
+        self._console = console
+        self._minimum_group_size = data_model.get_minimum_group_size() \
+            if data_model.get_ignore_groups_fewer_than() else 1
+        self._group_index = GroupIndex()
+        self._group_index.set_grouping(data_model)
+        # Path to (modification time, size) of files seen but not yet read, as last seen
+        self._unsettled: {str: (int, int)} = {}
+        # Paths already read, skipped or combined, which are not looked at again
+        self._finished_paths: set = set()
+        # Time (on the monotonic clock) each file in the index was added to it
+        self._added_times: {str: float} = {}
+
+    def watch(self):
+        """
+        Watch the directory, combining groups as they become complete, until interrupted or cancelled
+        """
+        self._console.message(f"Watching {self._directory}: combining groups of at least "
+                              f"{self._minimum_group_size} files once no file has joined them for "
+                              f"{self._quiet_seconds:g} seconds", 0)
+        if not SharedUtils.ensure_directory_exists(self._output_directory):
+            raise MasterMakerExceptions.NoGroupOutputDirectory(self._output_directory)
+        try:
+            while not self._session_controller.thread_cancelled():
+                self.add_settled_files(self.poll_directory())
+                self.combine_quiet_groups()
+                time.sleep(self.POLL_SECONDS)
+        except (KeyboardInterrupt, MasterMakerExceptions.SessionCancelled):
+            pass
+        self._console.message("Watching stopped", 0)
+        self._console.push_level()
+        for group in self._group_index.get_groups():
+            self._console.message(f"Not combined: group of {len(group)} files", +1)
+        self._console.pop_level()
+
+    def poll_directory(self) -> [str]:
+        """
+        Look at the directory, noting new files, and find those that have not changed since the last look
+        :return:    Paths of the files that have settled, ready to be read
+        """
+        settled: [str] = []
+        still_unsettled: {str: (int, int)} = {}
+        for path in SharedUtils.files_in_directory(self._directory, False):
+            if path in self._finished_paths:
+                continue
+            try:
+                status = os.stat(path)
+            except OSError:
+                # Vanished since it was listed
+                continue
+            signature = (status.st_mtime_ns, status.st_size)
+            if self._unsettled.get(path) == signature and status.st_size > 0:
+                settled.append(path)
+            else:
+                still_unsettled[path] = signature
+        self._unsettled = still_unsettled
+        return settled
+
+    def add_settled_files(self, paths: [str]):
+        """
+        Read the headers of files that have settled, and add the flat frames to the group index
+        :param paths:   Paths of the settled files
+        """
+        added: [FileDescriptor] = []
+        for path in paths:
+            try:
+                descriptor = RmFitsUtil.make_file_descriptor(path)
+            except Exception:
+                # Not readable as FITS yet, perhaps still being written by a slow writer: look again
+                continue
+            self._finished_paths.add(path)
+            if self._data_model.get_ignore_file_type() \
+                    or descriptor.get_type() == FileDescriptor.FILE_TYPE_FLAT:
+                added.append(descriptor)
+                self._added_times[path] = time.monotonic()
+            else:
+                self._console.message(f"Ignoring {descriptor.get_name()}: not a flat frame", 0)
+        if len(added) > 0:
+            self._group_index.add_descriptors(added)
+            for descriptor in added:
+                path = descriptor.get_absolute_path()
+                self._console.message(f"Added {descriptor.get_name()} to group "
+                                      f"{self._group_index.get_group_number(path)} "
+                                      f"({self._group_index.get_group_file_count(path)} files)", 0)
+
+    def combine_quiet_groups(self):
+        """
+        Combine each group that is large enough and has gone the quiet time without a new file
+        """
+        now = time.monotonic()
+        for group in self._group_index.get_groups():
+            paths = [d.get_absolute_path() for d in group]
+            latest_added = max(self._added_times[path] for path in paths)
+            if len(group) >= self._minimum_group_size and now - latest_added >= self._quiet_seconds:
+                self.combine_group(group)
+                for path in paths:
+                    self._group_index.remove_path(path)
+                    del self._added_times[path]
+
+    def combine_group(self, descriptors: [FileDescriptor]):
+        """
+        Combine one group into the output directory.  A group that can't be combined is reported,
+        and its files are not tried again; only cancellation or an interruption stops the watching.
+        :param descriptors:     Files in the group
+        """
+        disposition_folder = SharedUtils.substitute_date_time_filter_in_string(
+            self._data_model.get_disposition_subfolder_name())
+        file_combiner = FileCombiner(self._session_controller, self.file_moved_callback)
+        message_level = self._console.get_message_level()
+        stack_size = self._console.get_stack_size()
+        try:
+            output_file = file_combiner.process_one_group(self._data_model, descriptors, self._output_directory,
+                                                          self._data_model.get_master_combine_method(),
+                                                          disposition_folder, self._console)
+            self._console.message(f"Combined {len(descriptors)} files into {output_file}", 0)
+            return
+        except MasterMakerExceptions.SessionCancelled:
+            raise
+        except tuple(self.GROUP_FAILURES) as exception:
+            reason = self.GROUP_FAILURES[type(exception)]
+        except FileNotFoundError as exception:
+            reason = f"file {exception.filename} not found"
+        except PermissionError as exception:
+            reason = f"file {exception.filename} cannot be written or replaced"
+        except OSError as exception:
+            reason = f"{exception.strerror}: {exception.filename}"
+        # The combination stopped part-way, so put the console's indentation back to where it started
+        while self._console.get_stack_size() > stack_size:
+            self._console.pop_level()
+        self._console.set_message_level(message_level)
+        self.report_not_combined(descriptors, reason)
+
+    def report_not_combined(self, descriptors: [FileDescriptor], reason: str):
+        """
+        Report a group that could not be combined, as an error event as well as a message
+        :param descriptors:     Files in the group
+        :param reason:          Why the group was not combined
+        """
+        self._console.message(f"Group of {len(descriptors)} files not combined: {reason}", 0)
+        self._console.event("error", title="Group not combined", detail=reason, files=len(descriptors))
+
+    def file_moved_callback(self, file_name_moved: str):
+        # Moved files are already finished with, and need no further attention
+        pass
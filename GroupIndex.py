@@ -0,0 +1,159 @@
+#
+#   Index of the groups that the files in the main window's table fall into, kept up to date as
+#   files are added and removed, so the table can show each file's group and the group's size live.
+#
+#   The groups are the group planner's: files sharing a size, temperature cluster, exposure cluster
+#   and filter, for whichever groupings are in use.  Size and filter depend only on the file itself,
+#   but the clusters depend on the other files of the same size, since temperatures (and exposures
+#   within a temperature) are clustered separately for each size.  So, when files are added or
+#   removed, only the sizes they belong to are marked as changed, and the next time the index is
+#   consulted only those sizes are clustered again; the groups of every other size are kept as they
+#   were.  Changing the grouping options changes every group, so that re-groups all the files.
+#
+from typing import Optional
+
+from DataModel import DataModel
+from FileDescriptor import FileDescriptor
+from GroupPlanner import GroupPlanner
+
+
+class GroupIndex:
+
+    def __init__(self):
+        """
+        Initialize an empty index, with no grouping in use
+        """
+        self._grouping: tuple = (False, False, 1.0, False, 1.0, False)
+        self._descriptors_by_size: {str: {str: FileDescriptor}} = {}
+        self._dirty_sizes: set = set()
+        self._grouped_paths_by_size: {str: [str]} = {}
+        self._key_by_path: {str: tuple} = {}
+        self._count_by_key: {tuple: int} = {}
+        self._number_by_key: {tuple: int} = {}
+
+    def set_grouping(self, data_model: DataModel):
+        """
+        Take the grouping options from the given data model, re-grouping all the files if they changed
+        :param data_model:  Data model giving the groupings in use and their bandwidths
+        """
+        grouping = (data_model.get_group_by_size(),
+                    data_model.get_group_by_temperature(), data_model.get_temperature_group_bandwidth(),
+                    data_model.get_group_by_exposure(), data_model.get_exposure_group_bandwidth(),
+                    data_model.get_group_by_filter())
+        if grouping != self._grouping:
+            descriptors = [d for by_path in self._descriptors_by_size.values() for d in by_path.values()]
+            self.clear()
+            self._grouping = grouping
+            self.add_descriptors(descriptors)
+
+    def is_grouping(self) -> bool:
+        (by_size, by_temperature, _, by_exposure, _, by_filter) = self._grouping
+        return by_size or by_temperature or by_exposure or by_filter
+
+    def clear(self):
+        """
+        Remove all files from the index
+        """
+        self._descriptors_by_size = {}
+        self._dirty_sizes = set()
+        self._grouped_paths_by_size = {}
+        self._key_by_path = {}
+        self._count_by_key = {}
+        self._number_by_key = {}
+
+    def add_descriptors(self, descriptors: [FileDescriptor]):
+        """
+        Add the given files to the index
+        :param descriptors:     Files to be added
+        """
+        for descriptor in descriptors:
+            size_key = self.size_key(descriptor)
+            self._descriptors_by_size.setdefault(size_key, {})[descriptor.get_absolute_path()] = descriptor
+            self._dirty_sizes.add(size_key)
+
+    def remove_path(self, path: str):
+        """
+        Remove the file with the given path from the index, if it is there
+        :param path:    Absolute path of the file to be removed
+        """
+        for (size_key, by_path) in self._descriptors_by_size.items():
+            if path in by_path:
+                del by_path[path]
+                self._dirty_sizes.add(size_key)
+                break
+
+    def get_group_number(self, path: str) -> Optional[int]:
+        """
+        Get the number of the group the given file is in, counting from 1 in plan order
+        :param path:    Absolute path of a file in the index
+        :return:        Group number, or None if the file is not in the index
+        """
+        self.update_groups()
+        key = self._key_by_path.get(path)
+        return None if key is None else self._number_by_key[key]
+
+    def get_group_file_count(self, path: str) -> int:
+        """
+        Get the number of files in the group the given file is in
+        :param path:    Absolute path of a file in the index
+        :return:        Number of files in its group, or 0 if the file is not in the index
+        """
+        self.update_groups()
+        key = self._key_by_path.get(path)
+        return 0 if key is None else self._count_by_key[key]
+
+    def get_group_count(self) -> int:
+        """
+        Get the number of groups the files in the index fall into
+        :return:    Number of groups
+        """
+        self.update_groups()
+        return len(self._count_by_key)
+
+    def get_groups(self) -> [[FileDescriptor]]:
+        """
+        Get the files of each group, in order of group number
+        :return:    List with the list of files in each group
+        """
+        self.update_groups()
+        groups: {tuple: [FileDescriptor]} = {key: [] for key in sorted(self._count_by_key)}
+        for by_path in self._descriptors_by_size.values():
+            for (path, descriptor) in by_path.items():
+                groups[self._key_by_path[path]].append(descriptor)
+        return list(groups.values())
+
+    def size_key(self, descriptor: FileDescriptor) -> str:
+        return descriptor.get_size_key() if self._grouping[0] else ""
+
+    def update_groups(self):
+        """
+        Re-group the files of the sizes to which files have been added, or from which files have been
+        removed, since the groups were last brought up to date
+        """
+        if len(self._dirty_sizes) == 0:
+            return
+        (_, by_temperature, temperature_bandwidth, by_exposure, exposure_bandwidth, by_filter) = self._grouping
+        for size_key in self._dirty_sizes:
+            # Forget this size's groups
+            for path in self._grouped_paths_by_size.pop(size_key, []):
+                self._count_by_key.pop(self._key_by_path.pop(path), None)
+            by_path = self._descriptors_by_size.get(size_key, {})
+            if len(by_path) == 0:
+                self._descriptors_by_size.pop(size_key, None)
+                continue
+            # And group its files again
+            self._grouped_paths_by_size[size_key] = list(by_path)
+            descriptors = list(by_path.values())
+            size_keys = [size_key] * len(descriptors)
+            temperature_ranks = GroupPlanner.temperature_ranks(descriptors, size_keys, temperature_bandwidth) \
+                if by_temperature else [0] * len(descriptors)
+            exposure_ranks = GroupPlanner.exposure_ranks(descriptors, list(zip(size_keys, temperature_ranks)),
+                                                         exposure_bandwidth) \
+                if by_exposure else [0] * len(descriptors)
+            for (descriptor, temperature_rank, exposure_rank) in zip(descriptors, temperature_ranks, exposure_ranks):
+                key = (size_key, temperature_rank, exposure_rank,
+                       descriptor.get_filter_name_lower() if by_filter else "")
+                self._key_by_path[descriptor.get_absolute_path()] = key
+                self._count_by_key[key] = self._count_by_key.get(key, 0) + 1
+        self._dirty_sizes = set()
+        self._number_by_key = {key: number for (number, key) in enumerate(sorted(self._count_by_key), start=1)}
@@ -0,0 +1,44 @@
+#
+#   One group of files to be combined into one master flat, as planned by the group processing:
+#   the group, the console lines that introduce it (the size, temperature and filter group
+#   headings that precede it), and the console indentation level the group's own messages
+#   start at.  Group jobs are sent to worker processes, so they hold only plain data.
+#
+from DataModel import DataModel
+from FileDescriptor import FileDescriptor
+from FileGroup import FileGroup
+
+
+class GroupJob:
+
+    def __init__(self, file_group: FileGroup, header_lines: [dict], message_level: int):
+        """
+        Initialize this group job
+        :param file_group:      Group of files to be combined
+        :param header_lines:    Message records (as kept by a ConsoleBuffer) to display before the group's own output
+        :param message_level:   Console indentation level for the group's own output
+        """
+        self._file_group = file_group
+        self._header_lines = header_lines
+        self._message_level = message_level
+
+    def get_file_group(self) -> FileGroup:
+        return self._file_group
+
+    def get_descriptors(self) -> [FileDescriptor]:
+        return self._file_group.get_descriptors()
+
+    def get_header_lines(self) -> [dict]:
+        return self._header_lines
+
+    def set_header_lines(self, header_lines: [dict]):
+        self._header_lines = header_lines
+
+    def get_message_level(self) -> int:
+        return self._message_level
+
+    def get_estimated_peak_bytes(self, data_model: DataModel) -> int:
+        return self._file_group.get_estimated_peak_bytes(data_model)
+
+    def get_estimated_work(self, data_model: DataModel) -> float:
+        return self._file_group.get_estimated_work(data_model)
@@ -0,0 +1,137 @@
+#
+#   Record of the groups of a grouped combination session that have been completed, kept as a
+#   JSON file in the output directory.  For each group it records a hash of the input set (the
+#   files' paths, sizes and modification times), the parameters that affect the result, and the
+#   output file.  A resumed session skips any group whose input set and parameters match a
+#   recorded group whose output file still exists, so a long run that was cancelled or crashed
+#   part-way need not combine its finished groups again.
+#
+#   Groups are recorded as they complete, and the file is replaced as a whole each time, so a crash
+#   leaves the previous complete version.  An unreadable or unrecognized manifest is treated as empty.
+#
+import hashlib
+import json
+import os
+from typing import Optional
+
+from Constants import Constants
+from DataModel import DataModel
+from FileDescriptor import FileDescriptor
+
+
+class GroupManifest:
+
+    MANIFEST_FILE_NAME = "MasterFlatMaker-manifest.json"
+    MANIFEST_VERSION = 1
+
+    def __init__(self, output_directory: str):
+        """
+        Initialize this object, loading any existing manifest from the output directory
+        :param output_directory:    Directory receiving the grouped output files
+        """
+        self._path = os.path.join(output_directory, self.MANIFEST_FILE_NAME)
+        self._groups: {str: dict} = {}
+        try:
+            with open(self._path, "r") as manifest_file:
+                contents = json.load(manifest_file)
+            if contents.get("version") == self.MANIFEST_VERSION:
+                self._groups = contents["groups"]
+        except (OSError, ValueError, KeyError, AttributeError):
+            pass
+
+    def completed_output(self, descriptors: [FileDescriptor], input_set_hash: str,
+                         parameters: dict) -> Optional[str]:
+        """
+        Find the output of an earlier combination of exactly this group with the same parameters
+        :param descriptors:     Files in the group
+        :param input_set_hash:  Hash of the group's files, from input_set_hash()
+        :param parameters:      Parameters of this session, from parameters()
+        :return:                Path of the existing output file, or None if the group must be combined
+        """
+        entry = self._groups.get(self.group_key(descriptors))
+        if entry is None \
+                or entry.get("input_set_hash") != input_set_hash \
+                or entry.get("parameters") != parameters:
+            return None
+        output_file = entry.get("output_file")
+        return output_file if output_file is not None and os.path.isfile(output_file) else None
+
+    def record_completed(self, descriptors: [FileDescriptor], input_set_hash: str,
+                         parameters: dict, output_file: str):
+        """
+        Record that a group has been combined, and save the manifest.  The input set hash is taken
+        before the group is combined, as its files may be moved away afterward.
+        :param descriptors:     Files in the group
+        :param input_set_hash:  Hash of the group's files, from input_set_hash()
+        :param parameters:      Parameters of this session, from parameters()
+        :param output_file:     Path of the combined output file
+        """
+        self._groups[self.group_key(descriptors)] = {"input_set_hash": input_set_hash,
+                                                     "parameters": parameters,
+                                                     "output_file": os.path.abspath(output_file)}
+        self.save()
+
+    def save(self):
+        """
+        Write the manifest, replacing the previous version only once the new one is complete
+        """
+        temporary_path = self._path + ".tmp"
+        with open(temporary_path, "w") as manifest_file:
+            json.dump({"version": self.MANIFEST_VERSION, "groups": self._groups}, manifest_file, indent=1)
+        os.replace(temporary_path, self._path)
+
+    @staticmethod
+    def group_key(descriptors: [FileDescriptor]) -> str:
+        """
+        Identify a group by the set of its file paths, whatever order they were given in
+        :param descriptors:     Files in the group
+        :return:                Hex digest identifying the group
+        """
+        paths = sorted(os.path.abspath(d.get_absolute_path()) for d in descriptors)
+        return hashlib.sha256("\n".join(paths).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def input_set_hash(descriptors: [FileDescriptor]) -> str:
+        """
+        Hash the group's files' paths, sizes and modification times, which change if any file is replaced
+        :param descriptors:     Files in the group
+        :return:                Hex digest of the input set
+        """
+        digest = hashlib.sha256()
+        for path in sorted(os.path.abspath(d.get_absolute_path()) for d in descriptors):
+            status = os.stat(path)
+            digest.update(f"{path}\t{status.st_size}\t{status.st_mtime_ns}\n".encode("utf-8"))
+        return digest.hexdigest()
+
+    @staticmethod
+    def parameters(data_model: DataModel) -> dict:
+        """
+        Get the session parameters that affect a group's combined output: the combination method
+        and its settings, and the precalibration type and its settings
+        :param data_model:      Data model giving the parameters of this session
+        :return:                Dictionary of the parameters, suitable for JSON
+        """
+        combine_method = data_model.get_master_combine_method()
+        result = {"combine_method": combine_method,
+                  "ignore_file_type": data_model.get_ignore_file_type()}
+        if combine_method == Constants.COMBINE_SIGMA_CLIP:
+            result["sigma_clip_threshold"] = data_model.get_sigma_clip_threshold()
+        elif combine_method == Constants.COMBINE_MINMAX:
+            result["min_max_number_clipped_per_end"] = data_model.get_min_max_number_clipped_per_end()
+
+        calibration_type = data_model.get_precalibration_type()
+        result["precalibration_type"] = calibration_type
+        if calibration_type == Constants.CALIBRATION_PEDESTAL:
+            result["precalibration_pedestal"] = data_model.get_precalibration_pedestal()
+        elif calibration_type == Constants.CALIBRATION_FIXED_FILE:
+            result["precalibration_fixed_path"] = data_model.get_precalibration_fixed_path()
+        elif calibration_type == Constants.CALIBRATION_AUTO_DIRECTORY:
+            result["precalibration_auto_directory"] = data_model.get_precalibration_auto_directory()
+            result["auto_directory_recursive"] = data_model.get_auto_directory_recursive()
+            result["auto_directory_bias_only"] = data_model.get_auto_directory_bias_only()
+            result["auto_directory_scale_dark"] = data_model.get_auto_directory_scale_dark()
+            result["auto_directory_synthesize_bias"] = data_model.get_auto_directory_synthesize_bias()
+        elif calibration_type == Constants.CALIBRATION_OVERSCAN:
+            result["overscan_rectangle"] = list(data_model.get_overscan_rectangle())
+            result["overscan_trim"] = data_model.get_overscan_trim()
+        return result
@@ -0,0 +1,92 @@
+#
+#   Divides the files of a grouped combination session into the groups to be combined, in one pass.
+#   Each file gets a composite key - its size key, the rank of its temperature cluster, the rank of
+#   its exposure cluster and its lower-case filter name, each only if that grouping is in use - and
+#   the files sharing a key form a group.  Temperatures are clustered once per size (or once for all
+#   the files if not grouping by size), as the nested size, temperature and filter passes did, so the
+#   groups are the same; exposure times are clustered once per size and temperature, with the sorted-gap
+#   clusterer.  The files in each group keep their original order.
+#
+#   The groups come back as a flat list sorted by key: sizes in size-key order, then temperature
+#   clusters coolest first (by the temperature of each cluster's first file), then exposure clusters
+#   shortest first, then filters in name order.  So the groups of one size, of one temperature within
+#   it, and of one exposure within that, are adjacent.
+#
+import numpy
+
+from DataModel import DataModel
+from FileDescriptor import FileDescriptor
+from FileGroup import FileGroup
+from ValueClusterer import ValueClusterer
+
+
+class GroupPlanner:
+
+    @classmethod
+    def plan_groups(cls, data_model: DataModel, descriptors: [FileDescriptor]) -> [FileGroup]:
+        """
+        Group the given files by the groupings selected in the data model
+        :param data_model:      Data model giving the groupings and the temperature and exposure bandwidths
+        :param descriptors:     Files to be grouped
+        :return:                List of the groups, sorted by size, temperature, exposure and filter
+        """
+        size_keys = [d.get_size_key() if data_model.get_group_by_size() else "" for d in descriptors]
+        filter_keys = [d.get_filter_name_lower() if data_model.get_group_by_filter() else "" for d in descriptors]
+        if data_model.get_group_by_temperature():
+            temperature_ranks = cls.temperature_ranks(descriptors, size_keys,
+                                                      data_model.get_temperature_group_bandwidth())
+        else:
+            temperature_ranks = [0] * len(descriptors)
+        if data_model.get_group_by_exposure():
+            exposure_ranks = cls.exposure_ranks(descriptors, list(zip(size_keys, temperature_ranks)),
+                                                data_model.get_exposure_group_bandwidth())
+        else:
+            exposure_ranks = [0] * len(descriptors)
+
+        members: {(str, int, int, str): [FileDescriptor]} = {}
+        for (descriptor, key) in zip(descriptors, zip(size_keys, temperature_ranks, exposure_ranks, filter_keys)):
+            members.setdefault(key, []).append(descriptor)
+        return [FileGroup(members[key], *key) for key in sorted(members)]
+
+    @classmethod
+    def temperature_ranks(cls, descriptors: [FileDescriptor], size_keys: [str], bandwidth: float) -> [int]:
+        """
+        Cluster the files' temperatures separately for each size, and give each file the rank of its
+        cluster among the clusters of its size, ordered by the temperature of each cluster's first file
+        :param descriptors:     Files to be grouped
+        :param size_keys:       Size key of each file ("" for all if not grouping by size)
+        :param bandwidth:       Bandwidth of the temperature clustering
+        :return:                Temperature cluster rank of each file
+        """
+        indices_by_size: {str: [int]} = {}
+        for (index, size_key) in enumerate(size_keys):
+            indices_by_size.setdefault(size_key, []).append(index)
+        ranks = numpy.zeros(len(descriptors), dtype=int)
+        for indices in indices_by_size.values():
+            temperatures = numpy.array([descriptors[i].get_temperature() for i in indices])
+            labels = ValueClusterer.cluster(temperatures, bandwidth)
+            # Cluster ids are numbered by first appearance, so this finds each cluster's first file
+            (_, first_members) = numpy.unique(labels, return_index=True)
+            label_ranks = numpy.empty(len(first_members), dtype=int)
+            label_ranks[numpy.argsort(temperatures[first_members], kind="stable")] = numpy.arange(len(first_members))
+            ranks[indices] = label_ranks[labels]
+        return ranks.tolist()
+
+    @classmethod
+    def exposure_ranks(cls, descriptors: [FileDescriptor], bucket_keys: [(str, int)], maximum_gap: float) -> [int]:
+        """
+        Cluster the files' exposure times separately for each size and temperature, and give each file
+        the rank of its cluster among the clusters of its size and temperature, shortest first
+        :param descriptors:     Files to be grouped
+        :param bucket_keys:     Size key and temperature rank of each file
+        :param maximum_gap:     Largest gap, in seconds, between neighbouring exposure times in one group
+        :return:                Exposure cluster rank of each file
+        """
+        indices_by_bucket: {(str, int): [int]} = {}
+        for (index, bucket_key) in enumerate(bucket_keys):
+            indices_by_bucket.setdefault(bucket_key, []).append(index)
+        ranks = numpy.zeros(len(descriptors), dtype=int)
+        for indices in indices_by_bucket.values():
+            exposures = [descriptors[i].get_exposure() for i in indices]
+            ranks[indices] = ValueClusterer.cluster_by_gaps(exposures, maximum_gap)
+        return ranks.tolist()
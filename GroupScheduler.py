@@ -0,0 +1,301 @@
+#
+#   Runs the planned groups of a grouped combination session.  Groups are independent - different
+#   input files and different output files - so, if the data model asks for more than one group at
+#   a time, they are combined in a pool of worker processes.  Otherwise they are combined one after
+#   the other in this process, exactly as before.
+#
+#   With worker processes:
+#       -   The groups estimated to take longest are started first, so a long group isn't left to
+#           run on its own at the end of an overnight batch
+#       -   If there is a memory ceiling, groups are packed so the estimated peak memory of the groups
+#           running at once stays under it: when the next-largest group doesn't fit, a smaller one
+#           that does is started instead.  A group that exceeds the ceiling by itself runs alone.
+#       -   The group headings of the whole plan are displayed first, since the groups no longer run
+#           in plan order.  Each worker writes its console output to a buffer, and the main process
+#           displays each group's lines when it is done, in the order the groups were started, so
+#           output is never interleaved
+#       -   Cancelling the session sets an Event shared with every worker, which they see at their
+#           next cancellation check; groups not yet started are not started
+#       -   Each worker has a memory budget.  The calibration frames it keeps are limited to the budget,
+#           and a group whose estimated peak memory exceeds the budget is combined with no other group
+#           running alongside it
+#       -   Files moved after processing, and each group's completion, are reported to the callbacks
+#           by the main process, and an exception in a group is re-raised in the main process once
+#           the groups started before it have been displayed
+#   Workers are started with the "spawn" method on every platform, as the main process may be
+#   running Qt threads, which are not safe to fork.
+#
+import multiprocessing
+import pickle
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED, Future
+from typing import Callable, Optional
+
+import MasterMakerExceptions
+from CalibrationLibrary import CalibrationLibrary
+from Console import Console
+from ConsoleBuffer import ConsoleBuffer
+from DataModel import DataModel
+from GroupJob import GroupJob
+from ProcessSessionController import ProcessSessionController
+from SessionController import SessionController
+from StageProfiler import StageProfiler
+
+
+class GroupScheduler:
+
+    # How often, in seconds, the main process checks for cancellation while workers are running
+    CANCELLATION_POLL_SECONDS = 0.25
+
+    # Cancellation event shared with the main process; set in each worker process when it starts
+    _worker_cancel_event = None
+
+    def __init__(self, data_model: DataModel,
+                 session_controller: SessionController,
+                 file_moved_callback: Callable[[str], None],
+                 group_processor: Callable,
+                 group_completed_callback: Callable[[GroupJob, str], None]):
+        """
+        Initialize this object
+        :param data_model:              Data model giving the options for this session
+        :param session_controller:      Controller the parent uses to cancel this session
+        :param file_moved_callback:     Callback method to inform that we have moved a processed file
+        :param group_processor:         Function combining one group.  Called with a session controller,
+                                        file-moved callback, data model, list of files, output directory,
+                                        disposition folder name and console, and returns the path of
+                                        the output file.  Must be a module-level function or class
+                                        method, so it can be sent to worker processes.
+        :param group_completed_callback:    Callback method to inform that a group has been combined,
+                                            given the group and its output file.  Always called in
+                                            this process.
+        """
+        self._data_model = data_model
+        self._session_controller = session_controller
+        self._file_moved_callback = file_moved_callback
+        self._group_processor = group_processor
+        self._group_completed_callback = group_completed_callback
+
+    def run_jobs(self, jobs: [GroupJob],
+                 trailing_lines: [dict],
+                 output_directory: str,
+                 disposition_folder_name: str,
+                 console: Console):
+        """
+        Combine all the planned groups, displaying their console output
+        :param jobs:                        Planned groups, in plan order
+        :param trailing_lines:              Planning lines that follow the last group (groups ignored
+                                            after it), displayed after the groups' headings
+        :param output_directory:            Path to directory to receive the output files
+        :param disposition_folder_name:     If files to be moved after processing, name of receiving folder
+        :param console:                     Re-directable console output object
+        """
+        concurrency = min(self._data_model.get_concurrent_groups(), len(jobs))
+        if concurrency <= 1:
+            self.run_jobs_serially(jobs, output_directory, disposition_folder_name, console)
+            self.output_lines(trailing_lines, console)
+        else:
+            for job in jobs:
+                self.output_lines(job.get_header_lines(), console)
+            self.output_lines(trailing_lines, console)
+            self.run_jobs_in_pool(jobs, concurrency, output_directory, disposition_folder_name, console)
+
+    def run_jobs_serially(self, jobs: [GroupJob],
+                          output_directory: str,
+                          disposition_folder_name: str,
+                          console: Console):
+        """
+        Combine the planned groups one after the other in this process, output going straight to the console
+        :param jobs:                        Planned groups
+        :param output_directory:            Path to directory to receive the output files
+        :param disposition_folder_name:     If files to be moved after processing, name of receiving folder
+        :param console:                     Re-directable console output object
+        """
+        for job in jobs:
+            self.check_cancellation()
+            self.output_lines(job.get_header_lines(), console)
+            console.push_level()
+            console.set_message_level(job.get_message_level())
+            output_file = self._group_processor(self._session_controller, self._file_moved_callback,
+                                                self._data_model, job.get_descriptors(), output_directory,
+                                                disposition_folder_name, console)
+            console.pop_level()
+            self._group_completed_callback(job, output_file)
+
+    def run_jobs_in_pool(self, jobs: [GroupJob],
+                         concurrency: int,
+                         output_directory: str,
+                         disposition_folder_name: str,
+                         console: Console):
+        """
+        Combine the planned groups in a pool of worker processes, largest first
+        Exceptions thrown:
+            SessionCancelled        The session was cancelled while groups were being combined
+            (any other)             The first exception raised by a group, in the order they were started
+        :param jobs:                        Planned groups
+        :param concurrency:                 Number of worker processes
+        :param output_directory:            Path to directory to receive the output files
+        :param disposition_folder_name:     If files to be moved after processing, name of receiving folder
+        :param console:                     Re-directable console output object
+        """
+        context = multiprocessing.get_context("spawn")
+        cancel_event = context.Event()
+        executor = ProcessPoolExecutor(max_workers=concurrency, mp_context=context,
+                                       initializer=GroupScheduler.initialize_worker,
+                                       initargs=(cancel_event, self._data_model.get_worker_memory_megabytes(),
+                                                 StageProfiler.is_enabled()))
+        waiting: [GroupJob] = sorted(jobs, key=lambda j: j.get_estimated_work(self._data_model), reverse=True)
+        running: {Future: GroupJob} = {}
+        started: [GroupJob] = []
+        results: {int: ([dict], [str], Optional[Exception], Optional[str], dict)} = {}
+        next_to_display = 0
+        try:
+            while next_to_display < len(jobs):
+                self.check_cancellation()
+                while len(running) < concurrency:
+                    job = self.next_job_to_start(waiting, list(running.values()))
+                    if job is None:
+                        break
+                    waiting.remove(job)
+                    future = executor.submit(GroupScheduler.run_job_in_worker, self._group_processor,
+                                             self._data_model, job, output_directory, disposition_folder_name)
+                    running[future] = job
+                    started.append(job)
+                (done, _) = wait(running.keys(), timeout=self.CANCELLATION_POLL_SECONDS,
+                                 return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[started.index(running.pop(future))] = future.result()
+                # Display the finished groups that are next in the order they were started
+                while next_to_display in results:
+                    (lines, moved_paths, exception, output_file, stage_totals) = results.pop(next_to_display)
+                    StageProfiler.add_totals(stage_totals)
+                    self.output_lines(lines, console)
+                    for path in moved_paths:
+                        self._file_moved_callback(path)
+                    if exception is not None:
+                        raise exception
+                    self._group_completed_callback(started[next_to_display], output_file)
+                    next_to_display += 1
+        finally:
+            # Stop any workers still running after an error or cancellation.  Harmless if all are done.
+            # Groups submitted but not yet started are cancelled one by one (shutdown's cancel_futures
+            # argument would do it, but needs Python 3.9)
+            cancel_event.set()
+            for future in running.keys():
+                future.cancel()
+            executor.shutdown(wait=True)
+
+    def next_job_to_start(self, waiting: [GroupJob], running: [GroupJob]) -> Optional[GroupJob]:
+        """
+        Choose the next group to start: the largest waiting group that can run alongside those already
+        running.  A group that must run alone is never passed over, so the running groups drain for it.
+        :param waiting:     Groups not yet started, largest first
+        :param running:     Groups currently being combined
+        :return:            Group to start now, or None if none can start yet
+        """
+        for job in waiting:
+            if self.may_start(job, running):
+                return job
+            if self.must_run_alone(job):
+                return None
+        return None
+
+    def may_start(self, job: GroupJob, running: [GroupJob]) -> bool:
+        """
+        Determine if a group can be started alongside the groups already running
+        :param job:         Group that might be started
+        :param running:     Groups currently being combined
+        :return:            True if the group can be started now
+        """
+        if len(running) == 0:
+            return True
+        if self.must_run_alone(job) or any(self.must_run_alone(other) for other in running):
+            return False
+        ceiling_bytes = self._data_model.get_maximum_memory_megabytes() * 1024 * 1024
+        if ceiling_bytes > 0:
+            running_bytes = sum(other.get_estimated_peak_bytes(self._data_model) for other in running)
+            return running_bytes + job.get_estimated_peak_bytes(self._data_model) <= ceiling_bytes
+        return True
+
+    def must_run_alone(self, job: GroupJob) -> bool:
+        """
+        Determine if a group's estimated peak memory is over the per-worker budget or the overall
+        ceiling, so it must be combined with no other group running
+        :param job:     Group to be checked
+        :return:        True if the group must run by itself
+        """
+        peak_bytes = job.get_estimated_peak_bytes(self._data_model)
+        for limit_megabytes in (self._data_model.get_worker_memory_megabytes(),
+                                self._data_model.get_maximum_memory_megabytes()):
+            if 0 < limit_megabytes * 1024 * 1024 < peak_bytes:
+                return True
+        return False
+
+    @classmethod
+    def initialize_worker(cls, cancel_event, memory_megabytes: int, profiling: bool):
+        """
+        Set up a newly-started worker process
+        :param cancel_event:        Event set by the main process to cancel the session
+        :param memory_megabytes:    Memory budget of the worker, in megabytes, or 0 for no budget
+        :param profiling:           Record the time and memory of each stage, for the main process to report
+        """
+        cls._worker_cancel_event = cancel_event
+        if memory_megabytes > 0:
+            CalibrationLibrary.set_maximum_megabytes(memory_megabytes)
+        if profiling:
+            StageProfiler.start()
+
+    @classmethod
+    def run_job_in_worker(cls, group_processor: Callable,
+                          data_model: DataModel,
+                          job: GroupJob,
+                          output_directory: str,
+                          disposition_folder_name: str
+                          ) -> ([dict], [str], Optional[Exception], Optional[str], dict):
+        """
+        Combine one group in a worker process
+        :param group_processor:             Function combining one group
+        :param data_model:                  Data model giving the options for this session
+        :param job:                         Group to be combined
+        :param output_directory:            Path to directory to receive the output file
+        :param disposition_folder_name:     If files to be moved after processing, name of receiving folder
+        :return:                            Tuple of the group's console lines and events, the paths of the
+                                            files moved after processing, the exception that stopped the
+                                            group, if any, the path of the output file if the group was
+                                            combined, and the group's stage measurements if profiling
+        """
+        console = ConsoleBuffer(job.get_message_level())
+        moved_paths: [str] = []
+        exception: Optional[Exception] = None
+        output_file: Optional[str] = None
+        try:
+            output_file = group_processor(ProcessSessionController(cls._worker_cancel_event), moved_paths.append,
+                            data_model, job.get_descriptors(), output_directory, disposition_folder_name,
+                            console)
+        except Exception as raised:
+            exception = raised
+            try:
+                pickle.dumps(exception)
+            except Exception:
+                # The exception can't be sent back; send its description instead
+                exception = RuntimeError(f"{type(raised).__name__}: {raised}")
+        return console.take_lines(), moved_paths, exception, output_file, StageProfiler.take_totals()
+
+    @staticmethod
+    def output_lines(lines: [dict], console: Console):
+        """
+        Display console lines already formatted by another console object, and the events kept with them
+        :param lines:       Message records and event dictionaries, as kept by a ConsoleBuffer
+        :param console:     Console on which to display them
+        """
+        for line in lines:
+            if line["event"] == "message":
+                console.output_message_record(line)
+            else:
+                console.output_event(line)
+
+    def check_cancellation(self):
+        """
+        Check back with the parent of this subtask to see if we have been cancelled.
+        Raise a "cancelled" exception if so.
+        """
+        if self._session_controller.thread_cancelled():
+            raise MasterMakerExceptions.SessionCancelled
@@ -3,8 +3,15 @@
 #   Left in, commented out, for historical record, are implementations that were tried and
 #   discarded as better-performing implementations were found.
 #
+#   The step that reduces the stack of calibrated images to one image is done by an "engine" registered
+#   for each combination method.  Each method has a slow "reference" engine that works through the
+#   columns one at a time, written to be obviously correct, and the fast engine the program uses.  Any
+#   faster engine tried in future is registered beside them, and ImageMathEquivalenceCheck.py checks
+#   that every engine gives exactly the same master as the reference before it is put in use.
+#
+import math
 import sys
-from typing import Optional
+from typing import Optional, Callable
 
 import numpy
 from numpy import ma
@@ -12,14 +19,57 @@ from numpy.core.multiarray import ndarray
 
 import MasterMakerExceptions
 from Calibrator import Calibrator
+from Constants import Constants
 from Console import Console
 from FileDescriptor import FileDescriptor
 from RmFitsUtil import RmFitsUtil
 from SessionController import SessionController
+from StageProfiler import StageProfiler
 
 
 class ImageMath:
 
+    # Engines registered for each combination method: method to {engine name: engine}.  An engine is
+    # called with (stack of images, parameter, console, session controller) and returns the combined
+    # image; the parameter is the number of values dropped by min-max clipping or the z-score threshold
+    # of sigma clipping, and is ignored by the mean and median.
+    _engines: {int: {str: Callable[[ndarray, float, Console, SessionController], ndarray]}} = {}
+    # Method to the name of the engine the program combines with
+    _engine_in_use: {int: str} = {}
+
+    @classmethod
+    def register_engine(cls, method: int, name: str,
+                        engine: Callable[[ndarray, float, Console, SessionController], ndarray],
+                        in_use: bool = False):
+        """
+        Register an engine that reduces a stack of images to one by the given combination method
+        :param method:      Combination method, Constants.COMBINE_xxx
+        :param name:        Name of the engine, unique within the method
+        :param engine:      Function (stack, parameter, console, session controller) -> combined image
+        :param in_use:      Make this the engine the program combines with
+        """
+        cls._engines.setdefault(method, {})[name] = engine
+        if in_use:
+            cls._engine_in_use[method] = name
+
+    @classmethod
+    def engines(cls, method: int) -> {str: Callable[[ndarray, float, Console, SessionController], ndarray]}:
+        """
+        Get all the engines registered for a combination method
+        :param method:      Combination method, Constants.COMBINE_xxx
+        :return:            Dictionary of engine name to engine, the reference engine included
+        """
+        return dict(cls._engines.get(method, {}))
+
+    @classmethod
+    def engine(cls, method: int) -> Callable[[ndarray, float, Console, SessionController], ndarray]:
+        """
+        Get the engine the program combines with, for a combination method
+        :param method:      Combination method, Constants.COMBINE_xxx
+        :return:            Engine function
+        """
+        return cls._engines[method][cls._engine_in_use[method]]
+
     @classmethod
     def combine_mean(cls, file_names: [str],
                      calibrator: Calibrator,
@@ -39,16 +89,55 @@ class ImageMath:
         console.message("Combining by simple mean", +1)
         descriptors = RmFitsUtil.make_file_descriptions(file_names)
         file_data: [ndarray]
-        file_data = RmFitsUtil.read_all_files_data(file_names)
+        file_data = RmFitsUtil.read_all_files_data(file_names, console)
 
         cls.check_cancellation(session_controller)
         calibrated_data = calibrator.calibrate_images(file_data, descriptors, console, session_controller)
 
         cls.check_cancellation(session_controller)
-        mean_result = numpy.mean(calibrated_data, axis=0)
+        mean_result = cls.engine(Constants.COMBINE_MEAN)(numpy.asarray(calibrated_data), 0,
+                                                         console, session_controller)
         console.pop_level()
         return mean_result
 
+    @classmethod
+    def mean_of_stack(cls, file_data: ndarray,
+                      _: float,
+                      console: Console,
+                      session_controller: SessionController) -> ndarray:
+        """
+        Engine for the simple mean: average the columns of the stack all at once
+        :param file_data:           3-dimensional stack of image pixel values
+        :param _:                   Parameter, not used by the mean
+        :param console:             Redirectable console output handler
+        :param session_controller:  Controller for this subtask, checking for cancellation
+        :return:                    2-dimensional matrix of resulting pixel values
+        """
+        with StageProfiler.stage("reduce"):
+            return numpy.mean(file_data, axis=0)
+
+    @classmethod
+    def mean_reference(cls, file_data: ndarray,
+                       _: float,
+                       console: Console,
+                       session_controller: SessionController) -> ndarray:
+        """
+        Reference engine for the simple mean: average each column in turn, adding its values in order
+        :param file_data:           3-dimensional stack of image pixel values
+        :param _:                   Parameter, not used by the mean
+        :param console:             Redirectable console output handler
+        :param session_controller:  Controller for this subtask, checking for cancellation
+        :return:                    2-dimensional matrix of resulting pixel values
+        """
+        (_, x_dimension, y_dimension) = file_data.shape
+        result = numpy.zeros(shape=(x_dimension, y_dimension))
+        for x_index in range(x_dimension):
+            cls.check_cancellation(session_controller)
+            for y_index in range(y_dimension):
+                values = file_data[:, x_index, y_index].tolist()
+                result[x_index, y_index] = sum(values) / len(values)
+        return result
+
     # Calculate the min-max clipped mean for the specified column.
     # See the explanation in the previous method for what we're doing.
     # We'll sort the list to more efficiently delete items - so we don't need to search
@@ -466,67 +555,73 @@ class ImageMath:
         :param session_controller:      parent controller for this subtask (to check for cancellation)
         :return:                        2-dimensional matrix representing resulting combined image
         """
+        number_dropped_values = int(number_dropped_values)
         console.push_level()
         console.message(f"Using min-max clip with {number_dropped_values} iterations", +1)
-        masked_array = ma.MaskedArray(file_data)
-        drop_counter = 1
-        while drop_counter <= number_dropped_values:
-            cls.check_cancellation(session_controller)
-            console.push_level()
-            console.message(f"Iteration {drop_counter} of {number_dropped_values}.", +1)
-            drop_counter += 1
-            # Find the minimums in all columns.  This will give a 2d matrix the same size as the images
-            # with the column-minimum in each position
-            minimum_values = masked_array.min(axis=0)
-            cls.check_cancellation(session_controller)
+        with StageProfiler.stage("clip"):
+            masked_array = ma.MaskedArray(file_data)
+            drop_counter = 1
+            while drop_counter <= number_dropped_values:
+                cls.check_cancellation(session_controller)
+                console.push_level()
+                console.message(f"Iteration {drop_counter} of {number_dropped_values}.", +1)
+                drop_counter += 1
+                # Find the minimums in all columns.  This will give a 2d matrix the same size as the images
+                # with the column-minimum in each position
+                minimum_values = masked_array.min(axis=0)
+                cls.check_cancellation(session_controller)
 
-            # Now compare that matrix of minimums down the layers, so we get Trues where
-            # each minimum exists in its column (minimums might exist more than once, and
-            # we want to find all of them)
-            masked_array = ma.masked_where(masked_array == minimum_values, masked_array)
-            cls.check_cancellation(session_controller)
-            console.message("Masked minimums.", +1, temp=True)
+                # Now compare that matrix of minimums down the layers, so we get Trues where
+                # each minimum exists in its column (minimums might exist more than once, and
+                # we want to find all of them)
+                masked_array = ma.masked_where(masked_array == minimum_values, masked_array)
+                cls.check_cancellation(session_controller)
+                console.message("Masked minimums.", +1, temp=True)
 
-            # Now find and mask the maximums, same approach
-            maximum_values = masked_array.max(axis=0)
-            masked_array = ma.masked_where(masked_array == maximum_values, masked_array)
-            cls.check_cancellation(session_controller)
-            console.message("Masked maximums.", +1, temp=True)
-            console.pop_level()
+                # Now find and mask the maximums, same approach
+                maximum_values = masked_array.max(axis=0)
+                masked_array = ma.masked_where(masked_array == maximum_values, masked_array)
+                cls.check_cancellation(session_controller)
+                console.message("Masked maximums.", +1, temp=True)
+                console.pop_level()
 
         console.message(f"Calculating mean of remaining data.", 0)
-        masked_means = numpy.mean(masked_array, axis=0)
-        cls.check_cancellation(session_controller)
-        # If the means matrix contains any masked values, that means that in that column the clipping
-        # eliminated *all* the data.  We will find the offending columns and re-calculate those with
-        # fewer dropped extremes.  This should exactly reproduce the results of the cell-by-cell methods
-        if ma.is_masked(masked_means):
-            console.message("Some columns lost all their values; reducing drops for those columns.", 0)
-            #  Get the mask, and get a 2D matrix showing which columns were entirely masked
-            the_mask = masked_array.mask
-            eliminated_columns_map = ndarray.all(the_mask, axis=0)
-            masked_coordinates = numpy.where(eliminated_columns_map)
+        with StageProfiler.stage("reduce"):
+            masked_means = numpy.mean(masked_array, axis=0)
             cls.check_cancellation(session_controller)
-            x_coordinates = masked_coordinates[0]
-            y_coordinates = masked_coordinates[1]
-            assert len(x_coordinates) == len(y_coordinates)
-            repairs = len(x_coordinates)
-            cp = "s" if repairs > 1 else ""
-            np = "" if repairs > 1 else "s"
-            console.message(f"{repairs} column{cp} need{np} repair.", +1)
-            for index in range(repairs):
+            repairs = 0
+            # If the means matrix contains any masked values, that means that in that column the clipping
+            # eliminated *all* the data.  We will find the offending columns and re-calculate those with
+            # fewer dropped extremes.  This should exactly reproduce the results of the cell-by-cell methods
+            if ma.is_masked(masked_means):
+                console.message("Some columns lost all their values; reducing drops for those columns.", 0)
+                #  Get the mask, and get a 2D matrix showing which columns were entirely masked
+                the_mask = masked_array.mask
+                eliminated_columns_map = ndarray.all(the_mask, axis=0)
+                masked_coordinates = numpy.where(eliminated_columns_map)
                 cls.check_cancellation(session_controller)
-                # print(".", end="\n" if (index > 0) and (index % 50 == 0) else "")
-                column_x = x_coordinates[index]
-                column_y = y_coordinates[index]
-                column = file_data[:, column_x, column_y]
-                min_max_clipped_mean: int = round(cls.calc_mm_clipped_mean(column, number_dropped_values - 1,
-                                                                           console, session_controller))
-                masked_means[column_x, column_y] = min_max_clipped_mean
-            # We've replaced the problematic columns, now the mean should calculate cleanly
-            assert not ma.is_masked(masked_means)
+                x_coordinates = masked_coordinates[0]
+                y_coordinates = masked_coordinates[1]
+                assert len(x_coordinates) == len(y_coordinates)
+                repairs = len(x_coordinates)
+                cp = "s" if repairs > 1 else ""
+                np = "" if repairs > 1 else "s"
+                console.message(f"{repairs} column{cp} need{np} repair.", +1)
+                for index in range(repairs):
+                    cls.check_cancellation(session_controller)
+                    # print(".", end="\n" if (index > 0) and (index % 50 == 0) else "")
+                    column_x = x_coordinates[index]
+                    column_y = y_coordinates[index]
+                    column = file_data[:, column_x, column_y]
+                    min_max_clipped_mean: int = round(cls.calc_mm_clipped_mean(column, number_dropped_values - 1,
+                                                                               console, session_controller))
+                    masked_means[column_x, column_y] = min_max_clipped_mean
+                # We've replaced the problematic columns, now the mean should calculate cleanly
+                assert not ma.is_masked(masked_means)
+        console.event("clip_statistics", method="min-max", pixels_discarded=int(ma.count_masked(masked_array)),
+                      pixels_total=int(file_data.size), columns_repaired=repairs)
         console.pop_level()
-        return masked_means.round()
+        return masked_means.round().filled()
 
     # Combine given files using "sigma clip"
     #
@@ -578,73 +673,130 @@ class ImageMath:
         console.message(f"Combine by sigma-clipped mean, z-score threshold {sigma_threshold}", +1)
 
         descriptors = RmFitsUtil.make_file_descriptions(file_names)
-        file_data = numpy.asarray(RmFitsUtil.read_all_files_data(file_names))
+        file_data = numpy.asarray(RmFitsUtil.read_all_files_data(file_names, console))
         cls.check_cancellation(session_controller)
 
         file_data = calibrator.calibrate_images(file_data, descriptors, console, session_controller)
         cls.check_cancellation(session_controller)
 
+        result = cls.engine(Constants.COMBINE_SIGMA_CLIP)(numpy.asarray(file_data), sigma_threshold,
+                                                          console, session_controller)
+        console.pop_level()
+        return result
+
+    @classmethod
+    def sigma_clip_stack(cls, file_data: ndarray,
+                         sigma_threshold: float,
+                         console: Console,
+                         session_controller: SessionController) -> ndarray:
+        """
+        Engine for sigma clipping: mask the outliers of the whole stack at once, then average what is left
+        :param file_data:               3-dimensional stack of image pixel values
+        :param sigma_threshold:         Z-score threshold for dropping outliers
+        :param console:                 redirectable console output handler
+        :param session_controller:      parent controller for this subtask (to check for cancellation)
+        :return:                        2-dimensional matrix representing resulting combined image
+        """
+        console.push_level()
         console.message("Calculating unclipped means", +1)
-        column_means = numpy.mean(file_data, axis=0)
-        cls.check_cancellation(session_controller)
+        with StageProfiler.stage("clip"):
+            column_means = numpy.mean(file_data, axis=0)
+            cls.check_cancellation(session_controller)
 
-        console.message("Calculating standard deviations", 0)
-        column_stdevs = numpy.std(file_data, axis=0)
-        cls.check_cancellation(session_controller)
-        console.message("Calculating z-scores", 0)
-        # Now what we'd like to do is just:
-        #    z_scores = abs(file_data - column_means) / column_stdevs
-        # Unfortunately, standard deviations can be zero, so that simplistic
-        # statement would generate division-by-zero errors.
-        # Std for a column would be zero if all the values in the column were identical.
-        # In that case we wouldn't want to eliminate any anyway, so we'll set the
-        # zero stdevs to a large number, which causes the z-scores to be small, which
-        # causes no values to be eliminated.
-        column_stdevs[column_stdevs == 0.0] = sys.float_info.max
-        z_scores = abs(file_data - column_means) / column_stdevs
-        cls.check_cancellation(session_controller)
+            console.message("Calculating standard deviations", 0)
+            column_stdevs = numpy.std(file_data, axis=0)
+            cls.check_cancellation(session_controller)
+            console.message("Calculating z-scores", 0)
+            # Now what we'd like to do is just:
+            #    z_scores = abs(file_data - column_means) / column_stdevs
+            # Unfortunately, standard deviations can be zero, so that simplistic
+            # statement would generate division-by-zero errors.
+            # Std for a column would be zero if all the values in the column were identical.
+            # In that case we wouldn't want to eliminate any anyway, so we'll set the
+            # zero stdevs to a large number, which causes the z-scores to be small, which
+            # causes no values to be eliminated.
+            column_stdevs[column_stdevs == 0.0] = sys.float_info.max
+            z_scores = abs(file_data - column_means) / column_stdevs
+            cls.check_cancellation(session_controller)
 
-        console.message("Eliminated data outside threshold", 0)
-        exceeds_threshold = z_scores > sigma_threshold
-        cls.check_cancellation(session_controller)
+            console.message("Eliminated data outside threshold", 0)
+            exceeds_threshold = z_scores > sigma_threshold
+            cls.check_cancellation(session_controller)
 
-        # Calculate and display how much data we are ignoring
-        dimensions = exceeds_threshold.shape
-        total_pixels = dimensions[0] * dimensions[1] * dimensions[2]
-        number_masked = numpy.count_nonzero(exceeds_threshold)
-        percentage_masked = 100.0 * number_masked / total_pixels
-        console.message(f"Discarded {number_masked:,} pixels of {total_pixels:,} "
-                        f"({percentage_masked:.3f}% of data)", +1)
+            # Calculate and display how much data we are ignoring
+            dimensions = exceeds_threshold.shape
+            total_pixels = dimensions[0] * dimensions[1] * dimensions[2]
+            number_masked = numpy.count_nonzero(exceeds_threshold)
+            percentage_masked = 100.0 * number_masked / total_pixels
+            console.message(f"Discarded {number_masked:,} pixels of {total_pixels:,} "
+                            f"({percentage_masked:.3f}% of data)", +1)
 
-        masked_array = ma.masked_array(file_data, exceeds_threshold)
+            masked_array = ma.masked_array(file_data, exceeds_threshold)
         cls.check_cancellation(session_controller)
         console.message("Calculating adjusted means", -1)
-        masked_means = ma.mean(masked_array, axis=0)
-        cls.check_cancellation(session_controller)
+        with StageProfiler.stage("reduce"):
+            masked_means = ma.mean(masked_array, axis=0)
+            cls.check_cancellation(session_controller)
 
-        # If the means matrix contains any masked values, that means that in that column the clipping
-        # eliminated *all* the data.  We will find the offending columns and re-calculate those using
-        # simple min-max clipping.
-        if ma.is_masked(masked_means):
-            console.message("Some columns lost all their values; min-max clipping those columns.", 0)
-            #  Get the mask, and get a 2D matrix showing which columns were entirely masked
-            eliminated_columns_map = ndarray.all(exceeds_threshold, axis=0)
-            masked_coordinates = numpy.where(eliminated_columns_map)
-            x_coordinates = masked_coordinates[0]
-            y_coordinates = masked_coordinates[1]
-            assert len(x_coordinates) == len(y_coordinates)
-            for index in range(len(x_coordinates)):
-                cls.check_cancellation(session_controller)
-                column_x = x_coordinates[index]
-                column_y = y_coordinates[index]
-                column = file_data[:, column_x, column_y]
-                min_max_clipped_mean: int = round(cls.calc_mm_clipped_mean(column, 2, console, session_controller))
-                masked_means[column_x, column_y] = min_max_clipped_mean
-            # We've replaced the problematic columns, now the mean should calculate cleanly
-            assert not ma.is_masked(masked_means)
+            repairs = 0
+            # If the means matrix contains any masked values, that means that in that column the clipping
+            # eliminated *all* the data.  We will find the offending columns and re-calculate those using
+            # simple min-max clipping.
+            if ma.is_masked(masked_means):
+                console.message("Some columns lost all their values; min-max clipping those columns.", 0)
+                #  Get the mask, and get a 2D matrix showing which columns were entirely masked
+                eliminated_columns_map = ndarray.all(exceeds_threshold, axis=0)
+                masked_coordinates = numpy.where(eliminated_columns_map)
+                x_coordinates = masked_coordinates[0]
+                y_coordinates = masked_coordinates[1]
+                assert len(x_coordinates) == len(y_coordinates)
+                repairs = len(x_coordinates)
+                for index in range(repairs):
+                    cls.check_cancellation(session_controller)
+                    column_x = x_coordinates[index]
+                    column_y = y_coordinates[index]
+                    column = file_data[:, column_x, column_y]
+                    min_max_clipped_mean: int = round(cls.calc_mm_clipped_mean(column, 2, console, session_controller))
+                    masked_means[column_x, column_y] = min_max_clipped_mean
+                # We've replaced the problematic columns, now the mean should calculate cleanly
+                assert not ma.is_masked(masked_means)
         cls.check_cancellation(session_controller)
+        console.event("clip_statistics", method="sigma", pixels_discarded=int(number_masked),
+                      pixels_total=int(total_pixels), columns_repaired=repairs)
         console.pop_level()
-        result = masked_means.round().filled()
+        return masked_means.round().filled()
+
+    @classmethod
+    def sigma_clip_reference(cls, file_data: ndarray,
+                             sigma_threshold: float,
+                             console: Console,
+                             session_controller: SessionController) -> ndarray:
+        """
+        Reference engine for sigma clipping: drop the outliers of each column in turn, then average the rest.
+        A column whose values are all dropped is min-max clipped instead, as the fast engine does.
+        :param file_data:               3-dimensional stack of image pixel values
+        :param sigma_threshold:         Z-score threshold for dropping outliers
+        :param console:                 redirectable console output handler
+        :param session_controller:      parent controller for this subtask (to check for cancellation)
+        :return:                        2-dimensional matrix representing resulting combined image
+        """
+        (_, x_dimension, y_dimension) = file_data.shape
+        result = numpy.zeros(shape=(x_dimension, y_dimension))
+        for x_index in range(x_dimension):
+            cls.check_cancellation(session_controller)
+            for y_index in range(y_dimension):
+                column = file_data[:, x_index, y_index]
+                values = column.tolist()
+                mean = sum(values) / len(values)
+                stdev = math.sqrt(sum((value - mean) * (value - mean) for value in values) / len(values))
+                # All the values are the same if the standard deviation is zero; none of them is an outlier
+                kept = values if stdev == 0.0 else [value for value in values
+                                                    if not abs(value - mean) / stdev > sigma_threshold]
+                if len(kept) > 0:
+                    result[x_index, y_index] = round(sum(kept) * 1.0 / len(kept))
+                else:
+                    result[x_index, y_index] = round(cls.calc_mm_clipped_mean(column, 2, console,
+                                                                              session_controller))
         return result
 
     @classmethod
@@ -665,14 +817,66 @@ class ImageMath:
         console.push_level()
         console.message("Combine by simple Median", +1)
         descriptors = RmFitsUtil.make_file_descriptions(file_names)
-        file_data = RmFitsUtil.read_all_files_data(file_names)
+        file_data = RmFitsUtil.read_all_files_data(file_names, console)
         cls.check_cancellation(session_controller)
         file_data = calibrator.calibrate_images(file_data, descriptors, console, session_controller)
         cls.check_cancellation(session_controller)
-        median_result = numpy.median(file_data, axis=0)
+        median_result = cls.engine(Constants.COMBINE_MEDIAN)(numpy.asarray(file_data), 0,
+                                                             console, session_controller)
         console.pop_level()
         return median_result
 
+    @classmethod
+    def median_of_images(cls, file_data: [ndarray]) -> ndarray:
+        """
+        Median-combine already-read image data, pixel by pixel across all the images.
+        Used directly when synthesizing master calibration frames from raw frames.
+        :param file_data:   List of 2-dimensional matrices of pixel values, all the same size
+        :return:            ndarray giving the 2-dimensional matrix of median pixel values
+        """
+        return numpy.median(file_data, axis=0)
+
+    @classmethod
+    def median_of_stack(cls, file_data: ndarray,
+                        _: float,
+                        console: Console,
+                        session_controller: SessionController) -> ndarray:
+        """
+        Engine for the simple median: take the median of the columns of the stack all at once
+        :param file_data:           3-dimensional stack of image pixel values
+        :param _:                   Parameter, not used by the median
+        :param console:             Redirectable console output handler
+        :param session_controller:  Controller for this subtask, checking for cancellation
+        :return:                    2-dimensional matrix of resulting pixel values
+        """
+        with StageProfiler.stage("reduce"):
+            return cls.median_of_images(file_data)
+
+    @classmethod
+    def median_reference(cls, file_data: ndarray,
+                         _: float,
+                         console: Console,
+                         session_controller: SessionController) -> ndarray:
+        """
+        Reference engine for the simple median: sort each column in turn and take its middle value,
+        or the mean of its two middle values
+        :param file_data:           3-dimensional stack of image pixel values
+        :param _:                   Parameter, not used by the median
+        :param console:             Redirectable console output handler
+        :param session_controller:  Controller for this subtask, checking for cancellation
+        :return:                    2-dimensional matrix of resulting pixel values
+        """
+        (number_of_images, x_dimension, y_dimension) = file_data.shape
+        middle = number_of_images // 2
+        result = numpy.zeros(shape=(x_dimension, y_dimension))
+        for x_index in range(x_dimension):
+            cls.check_cancellation(session_controller)
+            for y_index in range(y_dimension):
+                values = sorted(file_data[:, x_index, y_index].tolist())
+                result[x_index, y_index] = values[middle] if number_of_images % 2 == 1 \
+                    else (values[middle - 1] + values[middle]) / 2
+        return result
+
     # Combine given files using "min-max clip"
     # In the following explanation, "column" means all of the points at a given image (x,y) coordinate,
     # across all the provided files.  Imagine that 20 images are given - then one "column" would be the 20 values
@@ -732,64 +936,16 @@ class ImageMath:
         success: bool
         assert len(file_names) > 0  # Otherwise the combine button would have been disabled
         # Get the data to be processed
-        file_data_list: [ndarray] = RmFitsUtil.read_all_files_data(file_names)
+        file_data_list: [ndarray] = RmFitsUtil.read_all_files_data(file_names, console)
         cls.check_cancellation(session_controller)
         descriptors = RmFitsUtil.make_file_descriptions(file_names)
         file_data = numpy.asarray(file_data_list)
         file_data = calibrator.calibrate_images(file_data, descriptors, console, session_controller)
         cls.check_cancellation(session_controller)
-        # Do the math using each algorithm, and display how long it takes
-
-        # time_before_0 = datetime.now()
-        # result0 = cls.min_max_clip_version_0(file_data, number_dropped_values, progress_dots)
-        # time_after_0 = datetime.now()
-        # duration_0 = time_after_0 - time_before_0
-        #
-        # time_before_1 = datetime.now()
-        # result1 = cls.min_max_clip_version_1(file_data, number_dropped_values, progress_dots)
-        # time_after_1 = datetime.now()
-        # duration_1 = time_after_1 - time_before_1
-        #
-        # time_before_2 = datetime.now()
-        # result2 = cls.min_max_clip_version_2(file_data, number_dropped_values, progress_dots)
-        # time_after_2 = datetime.now()
-        # duration_2 = time_after_2 - time_before_2
-        #
-        # time_before_3 = datetime.now()
-        # result3 = cls.min_max_clip_version_3(file_data, number_dropped_values, progress_dots)
-        # time_after_3 = datetime.now()
-        # duration_3 = time_after_3 - time_before_3
-        #
-        # time_before_4 = datetime.now()
-        # result4 = cls.min_max_clip_version_4(file_data, number_dropped_values)
-        # time_after_4 = datetime.now()
-        # duration_4 = time_after_4 - time_before_4
-        #
-        # time_before_5 = datetime.now()
-        # result5 = cls.min_max_clip_version_5(file_data, number_dropped_values)
-        # time_after_5 = datetime.now()
-        # duration_5 = time_after_5 - time_before_5
-        #
-        # print(f"Method 0 time: {duration_0}")
-        # print(f"Method 1 time: {duration_1}")
-        # print(f"Method 2 time: {duration_2}")
-        # print(f"Method 3 time: {duration_3}")
-        # print(f"Method 4 time: {duration_4}")
-        # print(f"Method 5 time: {duration_5}")
-        #
-        # # Also ensure that the different algorithm versions produced exactly the same result
-        # # Using method-0 as the reference
-        # cls.compare_results(result0, result1, "1")
-        # cls.compare_results(result0, result2, "2")
-        # cls.compare_results(result0, result3, "3")
-        # cls.compare_results(result0, result4, "4", dump=False)
-        # cls.compare_results(result0, result5, "5")
-        #
-        # return result0
-        result5 = cls.min_max_clip_version_5(file_data, number_dropped_values, console,
-                                             session_controller)
+        # Do the math.  The --profile option reports how long the clipping and reducing stages take.
+        result = cls.engine(Constants.COMBINE_MINMAX)(file_data, number_dropped_values, console,
+                                                      session_controller)
         cls.check_cancellation(session_controller)
-        result = result5.filled()
         return result
 
     # @classmethod
@@ -813,28 +969,80 @@ class ImageMath:
     #     console.pop_level()
 
     # Min-max clipped mean, version 0.  Simple algorithm, brute-force calculating the mean
-    # across columns of each cell, one at a time.
-    # @classmethod
-    # def min_max_clip_version_0(cls, file_data: ndarray, number_dropped_values: int,
-    #                            console: Console) -> ndarray:
-    #     console.push_level()
-    #     console.message(f"Using min-max clip version 0: simple slow algorithm", +1)
-    #     (x_dimension, y_dimension) = file_data[0].shape
-    #     # Set up the output array and then fill the columns one at a time
-    #     # We'll put a "dot" on the screen every "n" items as a progress indicator
-    #     # and a newline after the dots every 100 dots
-    #     columns_processed = 0
-    #     result = numpy.zeros(shape=(x_dimension, y_dimension))
-    #     for x_index in range(x_dimension):
-    #         for y_index in range(y_dimension):
-    #             # Do the "dot" progress indicator
-    #             columns_processed += 1
-    #             # Fill in the processed mean at this column
-    #             column = file_data[:, x_index, y_index]
-    #             min_max_clipped_mean: int = round(cls.calc_mm_clipped_mean(column, number_dropped_values, console))
-    #             result[x_index, y_index] = min_max_clipped_mean
-    #     console.pop_level()
-    #     return result
+    # across columns of each cell, one at a time.  Kept in use as the reference engine that the
+    # faster versions must match.
+    @classmethod
+    def min_max_clip_version_0(cls, file_data: ndarray,
+                               number_dropped_values: int,
+                               console: Console,
+                               session_controller: SessionController) -> ndarray:
+        """
+        Reference engine for min-max clipping: clip and average each column in turn
+        :param file_data:               3-dimensional stack of image pixel values
+        :param number_dropped_values:   number of min and max values to drop from each column
+        :param console:                 redirectable console output handler
+        :param session_controller:      parent controller for this subtask (to check for cancellation)
+        :return:                        2-dimensional matrix representing resulting combined image
+        """
+        (_, x_dimension, y_dimension) = file_data.shape
+        # Set up the output array and then fill the columns one at a time
+        result = numpy.zeros(shape=(x_dimension, y_dimension))
+        for x_index in range(x_dimension):
+            for y_index in range(y_dimension):
+                # Fill in the processed mean at this column
+                column = file_data[:, x_index, y_index]
+                min_max_clipped_mean: int = round(cls.calc_mm_clipped_mean(column, int(number_dropped_values),
+                                                                           console, session_controller))
+                result[x_index, y_index] = min_max_clipped_mean
+        return result
+
+    @classmethod
+    def combine_in_bands(cls, file_names: [str],
+                         combine_method: int,
+                         parameter: float,
+                         band_rows: int,
+                         calibrator: Calibrator,
+                         console: Console,
+                         session_controller: SessionController) -> ndarray:
+        """
+        Combine the files a band of rows at a time, so only one band of every file is in memory at once.
+        Every combination method works on each column of pixels separately, so the bands combined
+        separately and put together give exactly the image combining the whole files would.
+        :param file_names:          Names of files to be combined
+        :param combine_method:      Combination method, Constants.COMBINE_xxx
+        :param parameter:           Number of values dropped by min-max clipping, or sigma clipping's
+                                    z-score threshold; ignored by the mean and median
+        :param band_rows:           Number of rows in each band
+        :param calibrator:          Calibration object, abstracting precalibration operations
+        :param console:             Redirectable console output handler
+        :param session_controller:  Controller for this subtask, checking for cancellation
+        :return:                    ndarray giving the 2-dimensional matrix of resulting pixel values
+        """
+        assert len(file_names) > 0 and band_rows > 0
+        descriptors = RmFitsUtil.make_file_descriptions(file_names)
+        image_rows = descriptors[0].get_y_dimension()
+        number_of_bands = (image_rows + band_rows - 1) // band_rows
+        console.push_level()
+        console.message(f"Combining by {Constants.combine_method_string(combine_method)} in {number_of_bands} "
+                        f"bands of {band_rows} rows", +1)
+        bands: [ndarray] = []
+        try:
+            for row_start in range(0, image_rows, band_rows):
+                row_end = min(row_start + band_rows, image_rows)
+                console.message(f"Band {len(bands) + 1} of {number_of_bands}: rows {row_start}-{row_end - 1}", 0)
+                file_data = numpy.asarray(RmFitsUtil.read_all_files_rows(file_names, row_start, row_end, console))
+                cls.check_cancellation(session_controller)
+                calibrator.set_row_band(row_start, row_end, image_rows)
+                file_data = numpy.asarray(calibrator.calibrate_images(file_data, descriptors, console,
+                                                                      session_controller))
+                cls.check_cancellation(session_controller)
+                bands.append(cls.engine(combine_method)(file_data, parameter, console, session_controller))
+                # Let go of this band before reading the next
+                del file_data
+        finally:
+            calibrator.clear_row_band()
+        console.pop_level()
+        return numpy.concatenate(bands, axis=0)
 
     @classmethod
     def mean_exposure_and_temperature(cls, file_descriptors: [FileDescriptor]) -> (float, float):
@@ -860,3 +1068,13 @@ class ImageMath:
         """
         if session_controller.thread_cancelled():
             raise MasterMakerExceptions.SessionCancelled
+
+
+ImageMath.register_engine(Constants.COMBINE_MEAN, "reference", ImageMath.mean_reference)
+ImageMath.register_engine(Constants.COMBINE_MEAN, "numpy", ImageMath.mean_of_stack, in_use=True)
+ImageMath.register_engine(Constants.COMBINE_MEDIAN, "reference", ImageMath.median_reference)
+ImageMath.register_engine(Constants.COMBINE_MEDIAN, "numpy", ImageMath.median_of_stack, in_use=True)
+ImageMath.register_engine(Constants.COMBINE_MINMAX, "reference", ImageMath.min_max_clip_version_0)
+ImageMath.register_engine(Constants.COMBINE_MINMAX, "masked-array", ImageMath.min_max_clip_version_5, in_use=True)
+ImageMath.register_engine(Constants.COMBINE_SIGMA_CLIP, "reference", ImageMath.sigma_clip_reference)
+ImageMath.register_engine(Constants.COMBINE_SIGMA_CLIP, "masked-array", ImageMath.sigma_clip_stack, in_use=True)
@@ -0,0 +1,236 @@
+#
+#   Check that every engine registered in ImageMath for each combination method gives exactly the same
+#   master as that method's slow, column-by-column reference engine, so faster engines can be put in
+#   use safely.  Random stacks of images are combined by every engine and the results compared bit for
+#   bit.  As well as ordinary noisy stacks, the stacks include the awkward cases: columns of tied values,
+#   constant columns, columns that clipping empties completely, and saturated pixels.  The values are
+#   whole numbers of ADUs, as read from the 16-bit files the program combines.  Most stacks are first
+#   put through the Calibrator - pedestal, or overscan with and without trimming - so the engines are
+#   checked on what calibration actually hands them, as well as on stacks made directly.
+#
+#   The time each engine took is reported, over the trials and over one larger stack, so a new engine's
+#   speed-up can be seen beside the proof that it gives the same answers.
+#
+#   Run as:  python ImageMathEquivalenceCheck.py [number of trials] [random seed]
+#   Exits with status 1, after listing the differing cases, if any results differ.
+#
+import os
+import sys
+import tempfile
+import time
+
+import numpy
+from numpy import ndarray
+
+from Calibrator import Calibrator
+from Constants import Constants
+from ConsoleBuffer import ConsoleBuffer
+from DataModel import DataModel
+from FileDescriptor import FileDescriptor
+from ImageMath import ImageMath
+from JsonSettings import JsonSettings
+from Preferences import Preferences
+from SessionController import SessionController
+
+
+class ImageMathEquivalenceCheck:
+
+    METHODS = [Constants.COMBINE_MEAN, Constants.COMBINE_MEDIAN, Constants.COMBINE_MINMAX,
+               Constants.COMBINE_SIGMA_CLIP]
+    KINDS = ["random", "ties", "constant columns", "all-clipped columns", "saturated", "mixed"]
+    CALIBRATIONS = ["none", "pedestal", "overscan", "overscan trimmed"]
+    SIGMA_THRESHOLDS = [0.5, 0.8, 1.0, 1.5, 2.0, 2.5, 3.0]
+    SATURATED = 32767.0
+    # Size of the stack timed after the trials: frames, height, width
+    TIMING_STACK = (16, 100, 100)
+
+    @classmethod
+    def random_stack(cls, generator: numpy.random.Generator, trial: int) -> (str, ndarray):
+        """
+        Make a random stack of images to be combined
+        :param generator:   Random number generator
+        :param trial:       Trial number, used to rotate through the kinds of stack
+        :return:            Tuple (kind of stack, 3-dimensional stack of pixel values)
+        """
+        kind = cls.KINDS[trial % len(cls.KINDS)]
+        shape = (int(generator.integers(1, 26)), int(generator.integers(1, 13)), int(generator.integers(1, 13)))
+        stack = numpy.round(generator.normal(generator.uniform(500, 30000), generator.uniform(0, 200), shape))
+        if kind in ["ties", "mixed"]:
+            # Every value one of a few levels, so columns have many equal minimums and maximums
+            levels = numpy.round(generator.uniform(0, 1000, int(generator.integers(1, 5))))
+            ties = generator.choice(levels, shape)
+            stack = ties if kind == "ties" else numpy.where(generator.random(shape) < 0.5, ties, stack)
+        if kind in ["constant columns", "mixed"]:
+            chosen = generator.random(shape[1:]) < 0.3
+            stack[:, chosen] = numpy.round(generator.uniform(0, 1000))
+        if kind in ["all-clipped columns", "mixed"]:
+            # Columns of only two values, half of each: every value is a minimum or maximum, and every
+            # value's z-score is exactly 1, so clipping would drop them all
+            chosen = generator.random(shape[1:]) < 0.5
+            halves = numpy.where(numpy.arange(shape[0]) % 2 == 0, 100.0, 300.0)
+            stack[:, chosen] = halves[:, numpy.newaxis]
+        if kind in ["saturated", "mixed"]:
+            stack[generator.random(shape) < 0.2] = cls.SATURATED
+            # A hot pixel, saturated in every frame
+            stack[:, int(generator.integers(0, shape[1])), int(generator.integers(0, shape[2]))] = cls.SATURATED
+        return kind, stack.clip(0, cls.SATURATED)
+
+    @classmethod
+    def calibrate(cls, generator: numpy.random.Generator, stack: ndarray, data_model: DataModel,
+                  trial: int) -> (str, object):
+        """
+        Put a stack through the Calibrator, as the program does before combining it
+        :param generator:   Random number generator
+        :param stack:       3-dimensional stack of pixel values
+        :param data_model:  Data model, whose calibration settings are changed
+        :param trial:       Trial number, used to rotate through the calibrations
+        :return:            Tuple (description of the calibration, calibrated stack as the Calibrator returns it)
+        """
+        calibration = cls.CALIBRATIONS[(trial // len(cls.KINDS)) % len(cls.CALIBRATIONS)]
+        (_, y_size, x_size) = stack.shape
+        description = calibration
+        if calibration == "none":
+            data_model.set_precalibration_type(Constants.CALIBRATION_NONE)
+        elif calibration == "pedestal":
+            pedestal = int(generator.integers(0, 1000))
+            data_model.set_precalibration_type(Constants.CALIBRATION_PEDESTAL)
+            data_model.set_precalibration_pedestal(pedestal)
+            description = f"pedestal {pedestal}"
+        else:
+            # Trimming needs a column left over after the overscan strip is removed
+            trim = calibration == "overscan trimmed" and x_size > 1
+            x_start = int(generator.integers(1, x_size)) if trim else int(generator.integers(0, x_size))
+            rectangle = (x_start, x_size, 0, y_size)
+            data_model.set_precalibration_type(Constants.CALIBRATION_OVERSCAN)
+            data_model.set_overscan_rectangle(rectangle)
+            data_model.set_overscan_trim(trim)
+            description = f"overscan {rectangle}{' trimmed' if trim else ''}"
+        descriptors = [FileDescriptor(f"frame-{index}.fit") for index in range(len(stack))]
+        calibrated = Calibrator(data_model).calibrate_images(stack, descriptors, ConsoleBuffer(), SessionController())
+        return description, calibrated
+
+    @classmethod
+    def random_parameter(cls, generator: numpy.random.Generator, method: int) -> float:
+        """
+        Choose the parameter of a combination method: the number of values min-max clipping drops,
+        or the z-score threshold of sigma clipping
+        :param generator:   Random number generator
+        :param method:      Combination method
+        :return:            Parameter for the engines
+        """
+        if method == Constants.COMBINE_MINMAX:
+            return int(generator.integers(1, 5))
+        elif method == Constants.COMBINE_SIGMA_CLIP:
+            return float(generator.choice(cls.SIGMA_THRESHOLDS))
+        else:
+            return 0
+
+    @classmethod
+    def combine_all_ways(cls, method: int, stack: object, parameter: float,
+                         seconds: {str: float}) -> {str: ndarray}:
+        """
+        Combine a stack with every engine registered for a method
+        :param method:      Combination method
+        :param stack:       3-dimensional stack of pixel values, possibly as returned by the Calibrator
+        :param parameter:   Parameter of the combination method
+        :param seconds:     Engine name to time taken so far, added to
+        :return:            Engine name to combined image
+        """
+        session_controller = SessionController()
+        results: {str: ndarray} = {}
+        for (name, engine) in ImageMath.engines(method).items():
+            # Each engine gets its own copy, so one altering its input can't affect the next.  The stack is
+            # passed on in whatever form it came, as the program passes on what the Calibrator returns.
+            stack_copy = stack.copy()
+            console = ConsoleBuffer()
+            start = time.perf_counter()
+            results[name] = numpy.asarray(engine(stack_copy, parameter, console, session_controller), dtype=float)
+            seconds[name] = seconds.get(name, 0.0) + time.perf_counter() - start
+        return results
+
+    @classmethod
+    def differences(cls, results: {str: ndarray}) -> [str]:
+        """
+        Compare the results of each engine with the reference engine's
+        :param results:     Engine name to combined image
+        :return:            Description of each engine whose result is different
+        """
+        reference = results["reference"]
+        found: [str] = []
+        for (name, result) in results.items():
+            if result.shape != reference.shape:
+                found.append(f"{name} gave shape {result.shape}, reference {reference.shape}")
+            elif not numpy.array_equal(result, reference):
+                differing = numpy.argwhere(result != reference)
+                (x, y) = differing[0]
+                found.append(f"{name} differs in {len(differing)} pixels, first at ({x}, {y}): "
+                             f"{result[x, y]}, reference {reference[x, y]}")
+        return found
+
+    @classmethod
+    def report_times(cls, title: str, seconds: {str: float}):
+        """
+        Display the time each engine took, and its speed relative to the reference engine
+        :param title:       What was timed
+        :param seconds:     Engine name to time taken
+        """
+        print(f"    {title}:")
+        for (name, engine_seconds) in seconds.items():
+            speed = f"  {seconds['reference'] / engine_seconds:8.1f}x reference" \
+                if name != "reference" and engine_seconds > 0 else ""
+            print(f"        {name:<15} {engine_seconds:9.4f} s{speed}")
+
+    @classmethod
+    def run(cls, trials: int, seed: int) -> bool:
+        """
+        Combine random stacks with every engine of every method and report any differences and the times
+        :param trials:  Number of stacks to try for each method
+        :param seed:    Seed for the random number generator
+        :return:        True if every engine gave the same results as the reference
+        """
+        generator = numpy.random.default_rng(seed)
+        all_same = True
+        settings_directory = tempfile.TemporaryDirectory()
+        # Default preferences, not the user's, so the calibrations are only those set here
+        data_model = DataModel(Preferences(JsonSettings(os.path.join(settings_directory.name, "preferences.json"))))
+        for method in cls.METHODS:
+            method_name = Constants.combine_method_string(method)
+            failed_trials = 0
+            seconds: {str: float} = {}
+            for trial in range(trials):
+                (kind, stack) = cls.random_stack(generator, trial)
+                (calibration, calibrated) = cls.calibrate(generator, stack, data_model, trial)
+                parameter = cls.random_parameter(generator, method)
+                try:
+                    found = cls.differences(cls.combine_all_ways(method, calibrated, parameter, seconds))
+                except Exception as exception:
+                    found = [f"raised {type(exception).__name__}: {exception}"]
+                if len(found) > 0:
+                    failed_trials += 1
+                    print(f"{method_name} trial {trial}, {kind} stack {stack.shape}, {calibration} calibration, "
+                          f"parameter {parameter}:")
+                    for difference in found:
+                        print(f"     {difference}")
+            timing_seconds: {str: float} = {}
+            timing_stack = numpy.round(generator.normal(20000, 100, cls.TIMING_STACK))
+            found = cls.differences(cls.combine_all_ways(method, timing_stack,
+                                                         cls.random_parameter(generator, method), timing_seconds))
+            if len(found) > 0:
+                failed_trials += 1
+                print(f"{method_name} timing stack {timing_stack.shape}:")
+                for difference in found:
+                    print(f"     {difference}")
+            print(f"{method_name}: {trials + 1 - failed_trials} of {trials + 1} stacks gave identical masters "
+                  f"from {len(seconds)} engines")
+            cls.report_times(f"{trials} random stacks", seconds)
+            cls.report_times(f"{cls.TIMING_STACK[0]} frames of {cls.TIMING_STACK[2]} x {cls.TIMING_STACK[1]}",
+                             timing_seconds)
+            all_same = all_same and failed_trials == 0
+        settings_directory.cleanup()
+        return all_same
+
+
+if __name__ == "__main__":
+    number_of_trials = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    random_seed = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    sys.exit(0 if ImageMathEquivalenceCheck.run(number_of_trials, random_seed) else 1)
@@ -0,0 +1,86 @@
+#
+#   Measures how long each module takes to import, for the --import-profile option, so changes that
+#   slow down the program's start can be noticed.  Once started, every import of a module not already
+#   loaded is timed, until the report is printed.  Each module's time is given in total (including the
+#   modules it imports in turn) and by itself (excluding them).
+#
+#   Submodules loaded by "from package import submodule" are not seen separately; their time is
+#   counted in the module doing the import.
+#
+import builtins
+import importlib.util
+import sys
+import time
+
+
+class ImportProfiler:
+
+    # Number of modules listed in the report, slowest first
+    REPORT_LINES = 30
+
+    _original_import = None
+    _start_time: float = 0.0
+    # (module name, total seconds, self seconds), in the order the imports finished
+    _timings: [(str, float, float)] = []
+    # Seconds spent importing other modules, for each import in progress
+    _child_seconds: [float] = []
+
+    @classmethod
+    def start(cls):
+        """
+        Start timing imports, by putting our own function in place of the built-in __import__
+        """
+        if cls._original_import is None:
+            cls._original_import = builtins.__import__
+            cls._start_time = time.perf_counter()
+            builtins.__import__ = cls.profiled_import
+
+    @classmethod
+    def stop(cls):
+        """
+        Stop timing imports, restoring the built-in __import__
+        """
+        if cls._original_import is not None:
+            builtins.__import__ = cls._original_import
+            cls._original_import = None
+
+    @classmethod
+    def profiled_import(cls, name, globals=None, locals=None, fromlist=(), level=0):
+        """
+        Import a module as the built-in __import__ does, timing it if it is not already loaded
+        """
+        module_name = name
+        if level > 0:
+            package = globals.get("__package__") if globals is not None else None
+            try:
+                module_name = importlib.util.resolve_name("." * level + name, package)
+            except (ImportError, ValueError):
+                pass
+        if module_name in sys.modules:
+            return cls._original_import(name, globals, locals, fromlist, level)
+        cls._child_seconds.append(0.0)
+        start = time.perf_counter()
+        try:
+            return cls._original_import(name, globals, locals, fromlist, level)
+        finally:
+            total_seconds = time.perf_counter() - start
+            child_seconds = cls._child_seconds.pop()
+            if len(cls._child_seconds) > 0:
+                cls._child_seconds[-1] += total_seconds
+            cls._timings.append((module_name, total_seconds, total_seconds - child_seconds))
+
+    @classmethod
+    def report(cls, stream=sys.stdout):
+        """
+        Stop timing, and print the slowest imports and the total time spent importing
+        :param stream:  Where to print the report
+        """
+        cls.stop()
+        elapsed_seconds = time.perf_counter() - cls._start_time
+        import_seconds = sum(self_seconds for (_, _, self_seconds) in cls._timings)
+        print(f"Import profile: {len(cls._timings)} modules imported in {import_seconds * 1000:.1f} ms "
+              f"of {elapsed_seconds * 1000:.1f} ms run time", file=stream)
+        print(f"  {'Total ms':>9} {'Self ms':>9}  Module", file=stream)
+        slowest = sorted(cls._timings, key=lambda timing: timing[1], reverse=True)
+        for (module_name, total_seconds, self_seconds) in slowest[:cls.REPORT_LINES]:
+            print(f"  {total_seconds * 1000:9.1f} {self_seconds * 1000:9.1f}  {module_name}", file=stream)
@@ -0,0 +1,58 @@
+#
+#   Text stream put in place of the standard output and error streams while combine jobs run on
+#   threads of their own (in the combine server, or several jobs of a jobs file at once).  What each
+#   thread writes goes to the stream registered for that thread - its job - so the output of jobs
+#   running at the same time is kept apart.  Threads with no stream registered write to the original
+#   stream as usual.
+#
+import sys
+import threading
+from contextlib import contextmanager
+
+
+class JobOutputRouter:
+
+    # Thread-local record of the stream each thread's output is sent to
+    _local = threading.local()
+    _install_mutex = threading.Lock()
+
+    def __init__(self, original_stream):
+        """
+        Initialize a router in front of one of the standard streams
+        :param original_stream:     Stream receiving the output of threads that are not running a job
+        """
+        self._original_stream = original_stream
+
+    @classmethod
+    @contextmanager
+    def capture(cls, stream):
+        """
+        Send everything the current thread writes to standard output or standard error to the given
+        stream, until the end of the with-block
+        :param stream:  Stream (with write and flush methods) to receive the thread's output
+        """
+        cls._install_mutex.acquire()
+        if not isinstance(sys.stdout, JobOutputRouter):
+            sys.stdout = JobOutputRouter(sys.stdout)
+        if not isinstance(sys.stderr, JobOutputRouter):
+            sys.stderr = JobOutputRouter(sys.stderr)
+        cls._install_mutex.release()
+        cls._local.stream = stream
+        try:
+            yield stream
+        finally:
+            cls._local.stream = None
+
+    def target(self):
+        stream = getattr(self._local, "stream", None)
+        return self._original_stream if stream is None else stream
+
+    def write(self, text: str) -> int:
+        return self.target().write(text)
+
+    def flush(self):
+        self.target().flush()
+
+    def __getattr__(self, name):
+        # Other stream attributes (encoding, isatty, ...) are those of the original stream
+        return getattr(self._original_stream, name)
@@ -0,0 +1,132 @@
+#
+#   Jobs-file mode (--jobs-file): runs many combine jobs, listed in a JSON file, in one process, so
+#   they share the loaded modules and the calibration library (indexed calibration headers and
+#   decoded frames) instead of each starting cold.  The file looks like this:
+#
+#       {"jobs": [{"name": "M31",
+#                  "inputs": ["/data/m31/flats/*.fit"],
+#                  "options": ["-gs", "-gf", "-s", "2.5", "-a", "/data/bias", "-od", "/masters/m31"]},
+#                 ...]}
+#
+#   Each job's inputs are file paths or glob patterns, and its options are the command-line options,
+#   so each job runs exactly as the command line would run it.  The jobs run one after the other,
+#   with their output displayed as it happens, or several at once on threads of their own, with each
+#   job's output displayed when it finishes.
+#
+import glob
+import json
+import sys
+import threading
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+
+from CombineJob import CombineJob
+
+
+class JobsFileRunner:
+
+    def __init__(self, arg_parser: ArgumentParser, jobs_file_path: str, concurrent_jobs: int):
+        """
+        Initialize the runner
+        :param arg_parser:          The program's command-line argument parser, used to parse each job
+        :param jobs_file_path:      Path to the JSON jobs file
+        :param concurrent_jobs:     Number of jobs to run at once
+        """
+        self._arg_parser = arg_parser
+        self._jobs_file_path = jobs_file_path
+        self._concurrent_jobs = concurrent_jobs
+        self._output_mutex = threading.Lock()
+
+    def run(self) -> bool:
+        """
+        Run all the jobs in the file
+        :return:    True if every job succeeded
+        """
+        try:
+            entries = self.read_jobs_file(self._jobs_file_path)
+        except OSError as exception:
+            print(f"Unable to read jobs file {self._jobs_file_path}: {exception.strerror}")
+            return False
+        except ValueError as exception:
+            print(f"Jobs file {self._jobs_file_path} is not valid: {exception}")
+            return False
+
+        start_time = time.perf_counter()
+        # Jobs run one at a time echo their output, as it arrives, to the standard output as it is
+        # now, before the jobs' own output is routed to them
+        echo_stream = sys.stdout if self._concurrent_jobs == 1 else None
+        jobs: [(str, CombineJob)] = [(name, CombineJob(number, arguments, echo_stream))
+                                     for (number, (name, arguments)) in enumerate(entries, start=1)]
+        if self._concurrent_jobs == 1:
+            for (name, job) in jobs:
+                self.run_job(name, job, len(jobs))
+        else:
+            with ThreadPoolExecutor(max_workers=self._concurrent_jobs) as executor:
+                for (name, job) in jobs:
+                    executor.submit(self.run_job, name, job, len(jobs))
+
+        succeeded = sum(1 for (_, job) in jobs if job.get_state() == CombineJob.SUCCEEDED)
+        print(f"{len(jobs)} jobs run in {time.perf_counter() - start_time:.1f} seconds: "
+              f"{succeeded} succeeded, {len(jobs) - succeeded} failed")
+        for (name, job) in jobs:
+            if job.get_state() != CombineJob.SUCCEEDED:
+                print(f"   Job {job.get_job_id()} ({name}) {job.get_state()}")
+        return succeeded == len(jobs)
+
+    def run_job(self, name: str, job: CombineJob, job_count: int):
+        """
+        Run one job, displaying its output - as it happens if it is the only job running at once,
+        otherwise all together when it finishes, so it isn't mixed with the output of other jobs
+        :param name:        Name of the job, for its heading
+        :param job:         Job to be run
+        :param job_count:   Number of jobs in the file, for the heading
+        """
+        heading = f"Job {job.get_job_id()} of {job_count}: {name}"
+        if self._concurrent_jobs == 1:
+            print(heading)
+            job.start()
+            job.run(self._arg_parser)
+            print(f"Job {job.get_job_id()} ({name}) {job.get_state()}")
+        else:
+            job.start()
+            job.run(self._arg_parser)
+            self._output_mutex.acquire()
+            print(heading)
+            for line in job.get_output_lines():
+                print(line)
+            print(f"Job {job.get_job_id()} ({name}) {job.get_state()}")
+            self._output_mutex.release()
+
+    @staticmethod
+    def read_jobs_file(path: str) -> [(str, [str])]:
+        """
+        Read the jobs file, expanding each job's inputs into the arguments it would have on the
+        command line.  A pattern matching no files is kept as it is, for the job to report.
+        Exceptions thrown:
+            OSError         The file can't be read
+            ValueError      The file isn't JSON of the expected form
+        :param path:    Path to the jobs file
+        :return:        List of each job's name and command-line arguments
+        """
+        with open(path, "r") as jobs_file:
+            contents = json.load(jobs_file)
+        entries = contents.get("jobs") if isinstance(contents, dict) else contents
+        if not isinstance(entries, list) or len(entries) == 0:
+            raise ValueError("expected a \"jobs\" list with at least one job")
+        result: [(str, [str])] = []
+        for (number, entry) in enumerate(entries, start=1):
+            if not isinstance(entry, dict):
+                raise ValueError(f"job {number} is not an object")
+            name = entry.get("name", f"job {number}")
+            inputs = entry.get("inputs", [])
+            options = entry.get("options", [])
+            if not isinstance(inputs, list) or not all(isinstance(i, str) for i in inputs) \
+                    or not isinstance(options, list) or not all(isinstance(o, str) for o in options):
+                raise ValueError(f"job {number} inputs and options must be lists of strings")
+            file_names: [str] = []
+            for pattern in inputs:
+                matches = sorted(glob.glob(pattern))
+                file_names += matches if len(matches) > 0 else [pattern]
+            result.append((str(name), options + file_names))
+        return result
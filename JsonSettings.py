@@ -0,0 +1,93 @@
+#
+#   Pure-Python store for the preferences, kept as a JSON file, for when the program runs from the
+#   command line and should not need Qt.  It offers the subset of the QSettings interface that the
+#   Preferences class uses - value(), setValue() and allKeys() - so Preferences can use either.
+#
+#   The GUI keeps its preferences in QSettings as before, and writes a copy of each one here as it
+#   is set, so the command line sees the preferences established in the GUI.  Only values JSON can
+#   hold are kept: window sizes and positions are Qt objects, and only the GUI uses them.
+#
+#   The file is replaced as a whole each time a value is set, so a crash leaves the previous
+#   complete version.  A missing or unreadable file is treated as empty.
+#
+import json
+import os
+
+
+class JsonSettings:
+
+    FILE_NAME = "preferences.json"
+
+    def __init__(self, path: str):
+        """
+        Initialize this store, loading any existing values from the given file
+        :param path:    Path of the JSON file holding the values
+        """
+        self._path = path
+        self._values: {str: object} = {}
+        try:
+            with open(path, "r") as settings_file:
+                contents = json.load(settings_file)
+            if isinstance(contents, dict):
+                self._values = contents
+        except (OSError, ValueError):
+            pass
+
+    @classmethod
+    def default_path(cls) -> str:
+        """
+        Get the path of the preferences file, in the program's directory under the user's home
+        :return:    Path of the JSON preferences file
+        """
+        return os.path.join(os.path.expanduser("~"), ".MasterFlatMaker", cls.FILE_NAME)
+
+    def exists(self) -> bool:
+        return os.path.isfile(self._path)
+
+    def fileName(self) -> str:
+        return self._path
+
+    def allKeys(self) -> [str]:
+        return list(self._values)
+
+    def value(self, key: str, defaultValue=None):
+        return self._values.get(key, defaultValue)
+
+    def setValue(self, key: str, value):
+        """
+        Set a value and save the file, if it is a value JSON can hold and differs from the stored one
+        :param key:     Name of the preference
+        :param value:   New value
+        """
+        if self.representable(value) and (key not in self._values or self._values[key] != value):
+            self._values[key] = value
+            self.save()
+
+    def update_from(self, settings):
+        """
+        Copy all the values JSON can hold from another store (such as QSettings), and save the file
+        :param settings:    Store with allKeys() and value() methods
+        """
+        for key in settings.allKeys():
+            value = settings.value(key)
+            if self.representable(value):
+                self._values[key] = value
+        self.save()
+
+    @staticmethod
+    def representable(value) -> bool:
+        return value is None or isinstance(value, (bool, int, float, str))
+
+    def save(self):
+        """
+        Write the file, replacing the previous version only once the new one is complete.
+        Failure to save is not fatal: the preferences are kept in memory for this session.
+        """
+        try:
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+            temporary_path = self._path + ".tmp"
+            with open(temporary_path, "w") as settings_file:
+                json.dump(self._values, settings_file, indent=1, sort_keys=True)
+            os.replace(temporary_path, self._path)
+        except OSError:
+            pass
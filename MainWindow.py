@@ -3,14 +3,19 @@
 #   Manages the UI and initiates a combination action as a subtask if all is well
 #
 
+import copy
 import os
+from typing import Optional
 
 import PyQt5
 from PyQt5 import uic
-from PyQt5.QtCore import QObject, QEvent, QModelIndex
+from PyQt5.QtCore import QObject, QEvent, QModelIndex, QThread
 from PyQt5.QtGui import QResizeEvent, QMoveEvent
 from PyQt5.QtWidgets import QMainWindow, QDialog, QHeaderView, QFileDialog, QMessageBox
 
+from CalibrationLibrary import CalibrationLibrary
+from CalibrationPrewarmWorker import CalibrationPrewarmWorker
+from ConsoleBuffer import ConsoleBuffer
 from ConsoleWindow import ConsoleWindow
 from Constants import Constants
 from DataModel import DataModel
@@ -21,6 +26,7 @@ from MultiOsUtil import MultiOsUtil
 from Preferences import Preferences
 from PreferencesWindow import PreferencesWindow
 from RmFitsUtil import RmFitsUtil
+from SessionController import SessionController
 from SharedUtils import SharedUtils
 from Validators import Validators
 
@@ -42,6 +48,10 @@ class MainWindow(QMainWindow):
         self._table_model: FitsFileTableModel
         self._indent_level = 0
         self._adu_values_known = False
+        # Background threads pre-loading the calibration library, kept until they finish.  Each has
+        # its own session controller so it can be cancelled; only the most recent one is wanted.
+        self._prewarm_threads: [(QThread, CalibrationPrewarmWorker, SessionController)] = []
+        self._prewarm_snapshot: Optional[tuple] = None
 
         # Load algorithm from preferences
 
@@ -78,25 +88,34 @@ class MainWindow(QMainWindow):
             self.ui.noPreClalibrationRB.setChecked(True)
         elif precalibration_option == Constants.CALIBRATION_AUTO_DIRECTORY:
             self.ui.autoPreCalibrationRB.setChecked(True)
+        elif precalibration_option == Constants.CALIBRATION_OVERSCAN:
+            self.ui.overscanRB.setChecked(True)
         else:
             assert precalibration_option == Constants.CALIBRATION_PEDESTAL
             self.ui.fixedPedestalRB.setChecked(True)
         self.ui.fixedPedestalAmount.setText(str(data_model.get_precalibration_pedestal()))
         self.ui.precalibrationPathDisplay.setText(os.path.basename(data_model.get_precalibration_fixed_path()))
         self.ui.autoDirectoryName.setText(os.path.basename(data_model.get_precalibration_auto_directory()))
+        self.ui.overscanRectangle.setText(",".join(str(n) for n in data_model.get_overscan_rectangle()))
+        self.ui.overscanTrim.setChecked(data_model.get_overscan_trim())
 
         self.ui.autoRecursive.setChecked(data_model.get_auto_directory_recursive())
         self.ui.autoBiasOnly.setChecked(data_model.get_auto_directory_bias_only())
+        self.ui.autoScaleDark.setChecked(data_model.get_auto_directory_scale_dark())
+        self.ui.autoSynthesizeBias.setChecked(data_model.get_auto_directory_synthesize_bias())
         self.ui.displayAutoResultsCB.setChecked(data_model.get_display_auto_select_results())
 
         # Grouping boxes and parameters
 
         self.ui.groupBySizeCB.setChecked(data_model.get_group_by_size())
         self.ui.groupByTemperatureCB.setChecked(data_model.get_group_by_temperature())
+        self.ui.groupByExposureCB.setChecked(data_model.get_group_by_exposure())
         self.ui.groupByFilterCB.setChecked(data_model.get_group_by_filter())
         self.ui.ignoreSmallGroupsCB.setChecked(data_model.get_ignore_groups_fewer_than())
+        self.ui.resumeGroupsCB.setChecked(data_model.get_resume_groups())
 
         self.ui.temperatureGroupBandwidth.setText(f"{data_model.get_temperature_group_bandwidth()}")
+        self.ui.exposureGroupBandwidth.setText(f"{data_model.get_exposure_group_bandwidth()}")
         self.ui.minimumGroupSize.setText(str(data_model.get_minimum_group_size()))
 
         # Display average ADUs
@@ -106,6 +125,7 @@ class MainWindow(QMainWindow):
         # Set up the file table
         self._table_model = FitsFileTableModel(self.ui.filesTable, data_model.get_ignore_file_type(),
                                                preferences.get_display_average_adus())
+        self._table_model.set_grouping(data_model)
         self.ui.filesTable.setModel(self._table_model)
         # Columns should resize to best fit their contents
         self.ui.filesTable.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
@@ -120,9 +140,14 @@ class MainWindow(QMainWindow):
         if window_size is not None:
             self.ui.resize(window_size)
 
+        self.validate_overscan_for_calibration_type()
         self.enable_fields()
         self.enable_buttons()
 
+        # Start indexing the auto-calibration directory now, if one is already set up
+        CalibrationLibrary.set_maximum_megabytes(preferences.get_frame_cache_megabytes())
+        self.start_calibration_prewarm()
+
     def connect_responders(self):
         """Connect UI fields and controls to the methods that respond to them"""
         # Menu items
@@ -150,6 +175,10 @@ class MainWindow(QMainWindow):
         # Responder for "Pick Files" button
         self.ui.pickFilesButton.clicked.connect(self.pick_files_button_clicked)
 
+        # Responders for removing files from the table
+        self.ui.removeSelectedButton.clicked.connect(self.remove_selected_clicked)
+        self.ui.clearFilesButton.clicked.connect(self.clear_files_clicked)
+
         # React to changed selection in file table
         table_selection_model = self.ui.filesTable.selectionModel()
         table_selection_model.selectionChanged.connect(self.table_selection_changed)
@@ -163,25 +192,34 @@ class MainWindow(QMainWindow):
 
         # Main "combine" button
         self.ui.combineSelectedButton.clicked.connect(self.combine_selected_clicked)
+        self.ui.refreshPlanButton.clicked.connect(self.refresh_group_plan)
 
         # Buttons and fields in precalibration area
         self.ui.noPreClalibrationRB.clicked.connect(self.precalibration_radio_group_clicked)
         self.ui.fixedPedestalRB.clicked.connect(self.precalibration_radio_group_clicked)
         self.ui.autoPreCalibrationRB.clicked.connect(self.precalibration_radio_group_clicked)
         self.ui.fixedPreCalFileRB.clicked.connect(self.precalibration_radio_group_clicked)
+        self.ui.overscanRB.clicked.connect(self.precalibration_radio_group_clicked)
         self.ui.selectPreCalFile.clicked.connect(self.select_precalibration_file_clicked)
         self.ui.setAutoDirectory.clicked.connect(self.select_auto_calibration_directory_clicked)
         self.ui.fixedPedestalAmount.editingFinished.connect(self.pedestal_amount_changed)
+        self.ui.overscanRectangle.editingFinished.connect(self.overscan_rectangle_changed)
+        self.ui.overscanTrim.clicked.connect(self.overscan_trim_clicked)
         self.ui.autoRecursive.clicked.connect(self.auto_recursive_clicked)
         self.ui.autoBiasOnly.clicked.connect(self.auto_bias_only_clicked)
+        self.ui.autoScaleDark.clicked.connect(self.auto_scale_dark_clicked)
+        self.ui.autoSynthesizeBias.clicked.connect(self.auto_synthesize_bias_clicked)
         self.ui.displayAutoResultsCB.clicked.connect(self.display_auto_results_clicked)
 
         # Grouping controls
         self.ui.groupBySizeCB.clicked.connect(self.group_by_size_clicked)
         self.ui.groupByTemperatureCB.clicked.connect(self.group_by_temperature_clicked)
+        self.ui.groupByExposureCB.clicked.connect(self.group_by_exposure_clicked)
         self.ui.groupByFilterCB.clicked.connect(self.group_by_filter_clicked)
         self.ui.ignoreSmallGroupsCB.clicked.connect(self.ignore_small_groups_clicked)
+        self.ui.resumeGroupsCB.clicked.connect(self.resume_groups_clicked)
         self.ui.temperatureGroupBandwidth.editingFinished.connect(self.temperature_group_bandwidth_changed)
+        self.ui.exposureGroupBandwidth.editingFinished.connect(self.exposure_group_bandwidth_changed)
         self.ui.minimumGroupSize.editingFinished.connect(self.minimum_group_size_changed)
 
         # Display average ADUs
@@ -258,6 +296,7 @@ class MainWindow(QMainWindow):
         Group by size option checkbox has been changed, record new setting
         """
         self._data_model.set_group_by_size(self.ui.groupBySizeCB.isChecked())
+        self.grouping_changed()
         self.enable_fields()
         self.enable_buttons()
 
@@ -266,6 +305,16 @@ class MainWindow(QMainWindow):
         Group by temperature option checkbox has been changed, record new setting
         """
         self._data_model.set_group_by_temperature(self.ui.groupByTemperatureCB.isChecked())
+        self.grouping_changed()
+        self.enable_fields()
+        self.enable_buttons()
+
+    def group_by_exposure_clicked(self):
+        """
+        Group by exposure option checkbox has been changed, record new setting
+        """
+        self._data_model.set_group_by_exposure(self.ui.groupByExposureCB.isChecked())
+        self.grouping_changed()
         self.enable_fields()
         self.enable_buttons()
 
@@ -274,9 +323,16 @@ class MainWindow(QMainWindow):
         Group by filter option checkbox has been changed, record new setting
         """
         self._data_model.set_group_by_filter(self.ui.groupByFilterCB.isChecked())
+        self.grouping_changed()
         self.enable_fields()
         self.enable_buttons()
 
+    def grouping_changed(self):
+        """
+        One of the grouping options has changed; have the file table re-group its files to match
+        """
+        self._table_model.set_grouping(self._data_model)
+
     def ignore_small_groups_clicked(self):
         """
         Ignore groups smaller than xxx setting has been changed, record new setting
@@ -285,6 +341,12 @@ class MainWindow(QMainWindow):
         self.enable_fields()
         self.enable_buttons()
 
+    def resume_groups_clicked(self):
+        """
+        Skip already-combined groups option checkbox has been changed, record new setting
+        """
+        self._data_model.set_resume_groups(self.ui.resumeGroupsCB.isChecked())
+
     def auto_recursive_clicked(self):
         """
         Recursive directory traversal checkbox has been changed, record new setting
@@ -292,6 +354,7 @@ class MainWindow(QMainWindow):
         self._data_model.set_auto_directory_recursive(self.ui.autoRecursive.isChecked())
         self.enable_fields()
         self.enable_buttons()
+        self.start_calibration_prewarm()
 
     def auto_bias_only_clicked(self):
         """
@@ -301,6 +364,22 @@ class MainWindow(QMainWindow):
         self.enable_fields()
         self.enable_buttons()
 
+    def auto_scale_dark_clicked(self):
+        """
+        Bias plus exposure-scaled dark auto-calibration checkbox has been changed, record new setting
+        """
+        self._data_model.set_auto_directory_scale_dark(self.ui.autoScaleDark.isChecked())
+        self.enable_fields()
+        self.enable_buttons()
+
+    def auto_synthesize_bias_clicked(self):
+        """
+        Synthesize master bias for auto-calibration checkbox has been changed, record new setting
+        """
+        self._data_model.set_auto_directory_synthesize_bias(self.ui.autoSynthesizeBias.isChecked())
+        self.enable_fields()
+        self.enable_buttons()
+
     def display_auto_results_clicked(self):
         """
         Display auto-calibration results checkbox has been changed, record new setting
@@ -333,6 +412,26 @@ class MainWindow(QMainWindow):
         self._field_validity[self.ui.fixedPedestalAmount] = valid
         self.enable_buttons()
 
+    def overscan_rectangle_changed(self):
+        """the field giving the overscan region has been changed.
+        Validate it (4 integers, starts less than ends) and store if valid"""
+        proposed_rectangle: str = self.ui.overscanRectangle.text()
+        new_rectangle = Validators.valid_overscan_rectangle(proposed_rectangle)
+        valid = new_rectangle is not None
+        if valid:
+            self._data_model.set_overscan_rectangle(new_rectangle)
+        SharedUtils.background_validity_color(self.ui.overscanRectangle, valid)
+        self._field_validity[self.ui.overscanRectangle] = valid
+        self.enable_buttons()
+
+    def overscan_trim_clicked(self):
+        """
+        Trim overscan columns checkbox has been changed, record new setting
+        """
+        self._data_model.set_overscan_trim(self.ui.overscanTrim.isChecked())
+        self.enable_fields()
+        self.enable_buttons()
+
     def minimum_group_size_changed(self):
         """the field giving the minimum group size to recognize has been changed.
         Validate it (integer > 1) and store if valid"""
@@ -388,14 +487,27 @@ class MainWindow(QMainWindow):
         valid = new_number is not None
         if valid:
             self._data_model.set_temperature_group_bandwidth(new_number)
+            self.grouping_changed()
         SharedUtils.background_validity_color(self.ui.temperatureGroupBandwidth, valid)
         self._field_validity[self.ui.temperatureGroupBandwidth] = valid
 
+    def exposure_group_bandwidth_changed(self):
+        """User has entered value in exposure group bandwidth field.  Validate and save"""
+        proposed_new_number: str = self.ui.exposureGroupBandwidth.text()
+        new_number = Validators.valid_float_in_range(proposed_new_number, 0.1, 50)
+        valid = new_number is not None
+        if valid:
+            self._data_model.set_exposure_group_bandwidth(new_number)
+            self.grouping_changed()
+        SharedUtils.background_validity_color(self.ui.exposureGroupBandwidth, valid)
+        self._field_validity[self.ui.exposureGroupBandwidth] = valid
+
     def enable_fields(self):
         """Enable text fields depending on state of various radio buttons"""
 
         precalibration_type = self._data_model.get_precalibration_type()
         self.ui.fixedPedestalAmount.setEnabled(precalibration_type == Constants.CALIBRATION_PEDESTAL)
+        self.ui.overscanRectangle.setEnabled(precalibration_type == Constants.CALIBRATION_OVERSCAN)
 
         # Enable Algorithm fields depending on which algorithm is selected
         combination_type = self._data_model.get_master_combine_method()
@@ -408,11 +520,13 @@ class MainWindow(QMainWindow):
 
         # Grouping parameters go with their corresponding checkbox
         self.ui.temperatureGroupBandwidth.setEnabled(self._data_model.get_group_by_temperature())
+        self.ui.exposureGroupBandwidth.setEnabled(self._data_model.get_group_by_exposure())
 
     # Open a file dialog to pick files to be processed
 
     def pick_files_button_clicked(self):
-        """'Pick Files' button or 'Open' menu item are selected.  Get the input files from the user."""
+        """'Pick Files' button or 'Open' menu item are selected.  Get the input files from the user
+        and add them to those already in the table."""
         dialog = QFileDialog()
         file_names, _ = QFileDialog.getOpenFileNames(dialog, "Pick Files", "",
                                                      f"FITS files(*.fit)",
@@ -423,17 +537,35 @@ class MainWindow(QMainWindow):
             pass
         else:
             try:
-                file_descriptions = RmFitsUtil.make_file_descriptions(file_names)
+                # Only files not already in the table need to be read and grouped
+                known_paths = set(d.get_absolute_path() for d in self._table_model.get_file_descriptors())
+                new_file_names = [name for name in file_names if os.path.abspath(name) not in known_paths]
+                file_descriptions = RmFitsUtil.make_file_descriptions(new_file_names)
                 if self._data_model.get_display_average_adus():
                     self.get_adu_values_for_descriptors(file_descriptions)
-                    self._adu_values_known = True
                 else:
                     self._adu_values_known = False
-                self._table_model.set_file_descriptors(file_descriptions)
+                self._table_model.add_file_descriptors(file_descriptions)
                 self._table_model.sort(0, PyQt5.QtCore.Qt.AscendingOrder)  # Column 0, ascending order
             except FileNotFoundError as exception:
                 self.error_dialog("File Not Found", f"File \"{exception.filename}\" was not found or not readable")
         self.enable_buttons()
+        self.start_calibration_prewarm()
+
+    def remove_selected_clicked(self):
+        """'Remove Selected' button clicked.  Take the selected files out of the table and its groups;
+        the files themselves are left alone."""
+        for descriptor in self.get_selected_file_descriptors():
+            self._table_model.remove_file_path(descriptor.get_absolute_path())
+        self.ui.filesTable.clearSelection()
+        self.table_selection_changed()
+        self.start_calibration_prewarm()
+
+    def clear_files_clicked(self):
+        """'Clear' button clicked.  Empty the table, so a new set of files can be picked"""
+        self._table_model.clear_table()
+        self.table_selection_changed()
+        self.start_calibration_prewarm()
 
     def error_dialog(self,
                      brief_message: str,
@@ -477,12 +609,28 @@ class MainWindow(QMainWindow):
             calibration_type = Constants.CALIBRATION_FIXED_FILE
         elif self.ui.autoPreCalibrationRB.isChecked():
             calibration_type = Constants.CALIBRATION_AUTO_DIRECTORY
+        elif self.ui.overscanRB.isChecked():
+            calibration_type = Constants.CALIBRATION_OVERSCAN
         else:
             assert self.ui.fixedPedestalRB.isChecked()
             calibration_type = Constants.CALIBRATION_PEDESTAL
         self._data_model.set_precalibration_type(calibration_type)
+        self.validate_overscan_for_calibration_type()
         self.enable_buttons()
         self.enable_fields()
+        self.start_calibration_prewarm()
+
+    def validate_overscan_for_calibration_type(self):
+        """
+        The overscan rectangle only matters when overscan calibration is selected.  Validate it when
+        it is, so an unusable rectangle disables Combine at once; otherwise forget its validity,
+        so a bad value in the (now disabled) field doesn't block Combine.
+        """
+        if self._data_model.get_precalibration_type() == Constants.CALIBRATION_OVERSCAN:
+            self.overscan_rectangle_changed()
+        else:
+            self._field_validity.pop(self.ui.overscanRectangle, None)
+            SharedUtils.background_validity_color(self.ui.overscanRectangle, True)
 
     def select_precalibration_file_clicked(self):
         """Button to select a fixed precalibration file has been clicked.
@@ -503,10 +651,78 @@ class MainWindow(QMainWindow):
         """
         file_name = QFileDialog.getExistingDirectory(parent=None, caption="Calibration File Directory")
         if len(file_name) > 0:
+            if file_name != self._data_model.get_precalibration_auto_directory():
+                # Frames decoded from the old library won't be used again; don't keep holding them
+                self.cancel_calibration_prewarm()
+                CalibrationLibrary.release_frames()
             self._data_model.set_precalibration_auto_directory(file_name)
             self.ui.autoDirectoryName.setText(os.path.basename(file_name))
         self.enable_fields()
         self.enable_buttons()
+        self.start_calibration_prewarm()
+
+    def start_calibration_prewarm(self):
+        """
+        If auto-directory calibration is selected, start a background thread that reads the
+        calibration directory's headers into the calibration library (and, if the preference is set,
+        the calibration frames matching the loaded files) so the first Combine starts immediately.
+        Files already indexed are not read again, so it is cheap to call this whenever settings change.
+        A prewarm already running for the same settings and files is left to finish; one running
+        for out-of-date settings is cancelled in favour of the new one.
+        """
+        directory_path = self._data_model.get_precalibration_auto_directory()
+        if self._data_model.get_precalibration_type() != Constants.CALIBRATION_AUTO_DIRECTORY \
+                or not os.path.isdir(directory_path):
+            return
+        descriptors = list(self._table_model.get_file_descriptors())
+        decode_frames = self._preferences.get_prewarm_decode_frames()
+        snapshot = (directory_path,
+                    self._data_model.get_auto_directory_recursive(),
+                    self._data_model.get_auto_directory_bias_only(),
+                    self._data_model.get_auto_directory_scale_dark(),
+                    self._data_model.get_auto_directory_synthesize_bias(),
+                    self._data_model.get_bias_cache_directory(),
+                    decode_frames,
+                    tuple(d.get_absolute_path() for d in descriptors))
+        if snapshot == self._prewarm_snapshot and len(self._prewarm_threads) > 0:
+            return
+        self.cancel_calibration_prewarm()
+        self._prewarm_snapshot = snapshot
+
+        # The worker gets a snapshot of the settings and files, since the user may keep changing them
+        session_controller = SessionController()
+        worker = CalibrationPrewarmWorker(copy.copy(self._data_model), descriptors,
+                                          decode_frames, session_controller)
+        qthread = QThread()
+        worker.moveToThread(qthread)
+        qthread.started.connect(worker.run_prewarm)
+        worker.finished.connect(qthread.quit)
+        qthread.finished.connect(self.prewarm_thread_finished)
+        self._prewarm_threads.append((qthread, worker, session_controller))
+        qthread.start()
+
+    def prewarm_thread_finished(self):
+        """A calibration prewarm thread has finished; release it"""
+        finished_thread = self.sender()
+        finished_thread.wait()
+        self._prewarm_threads = [(t, w, c) for (t, w, c) in self._prewarm_threads if t is not finished_thread]
+
+    def cancel_calibration_prewarm(self):
+        """
+        Ask any running calibration prewarm threads to stop.  They finish, and are released,
+        after the file they are currently reading.
+        """
+        for (_, _, session_controller) in self._prewarm_threads:
+            session_controller.cancel_thread()
+
+    def stop_calibration_prewarm(self):
+        """
+        Application is quitting.  Stop any calibration prewarm threads still running and wait for them,
+        since a thread object must not be destroyed while its thread runs.
+        """
+        self.cancel_calibration_prewarm()
+        for (qthread, _, _) in self._prewarm_threads:
+            qthread.wait()
 
     def enable_buttons(self):
         """Enable buttons on the main window depending on validity and settings
@@ -516,10 +732,17 @@ class MainWindow(QMainWindow):
         self.ui.selectPreCalFile.setEnabled(calibration_type == Constants.CALIBRATION_FIXED_FILE)
         self.ui.setAutoDirectory.setEnabled(calibration_type == Constants.CALIBRATION_AUTO_DIRECTORY)
         self.ui.minimumGroupSize.setEnabled(self._data_model.get_ignore_groups_fewer_than())
+        self.ui.resumeGroupsCB.setEnabled(self._data_model.get_group_by_size()
+                                          or self._data_model.get_group_by_temperature()
+                                          or self._data_model.get_group_by_exposure()
+                                          or self._data_model.get_group_by_filter())
 
         self.ui.autoRecursive.setEnabled(calibration_type == Constants.CALIBRATION_AUTO_DIRECTORY)
         self.ui.autoBiasOnly.setEnabled(calibration_type == Constants.CALIBRATION_AUTO_DIRECTORY)
+        self.ui.autoScaleDark.setEnabled(calibration_type == Constants.CALIBRATION_AUTO_DIRECTORY)
+        self.ui.autoSynthesizeBias.setEnabled(calibration_type == Constants.CALIBRATION_AUTO_DIRECTORY)
         self.ui.displayAutoResultsCB.setEnabled(calibration_type == Constants.CALIBRATION_AUTO_DIRECTORY)
+        self.ui.overscanTrim.setEnabled(calibration_type == Constants.CALIBRATION_OVERSCAN)
 
         # "combineSelectedButton" is enabled only if
         #   - No text fields are in error state
@@ -587,6 +810,8 @@ class MainWindow(QMainWindow):
         any_rows = self._table_model.rowCount(QModelIndex()) > 0
         self.ui.selectNoneButton.setEnabled(any_rows)
         self.ui.selectAllButton.setEnabled(any_rows)
+        self.ui.clearFilesButton.setEnabled(any_rows)
+        self.ui.removeSelectedButton.setEnabled(len(self.ui.filesTable.selectionModel().selectedRows()) > 0)
 
     def preferences_menu_triggered(self):
         """Respond to preferences menu by opening preferences dialog"""
@@ -616,6 +841,8 @@ class MainWindow(QMainWindow):
             # output file, get the path
             output_path = self.get_appropriate_output_path(selected_files[0])
             if output_path is not None:
+                # The session reads what it needs itself; don't compete with it for the disk
+                self.cancel_calibration_prewarm()
                 # Open console window, which will create and run the worker thread
                 console_window: ConsoleWindow = ConsoleWindow(self._preferences, self._data_model,
                                                               selected_files, output_path, self.remove_from_ui)
@@ -640,9 +867,12 @@ class MainWindow(QMainWindow):
         self.min_max_drop_changed()
         self.minimum_group_size_changed()
         self.pedestal_amount_changed()
+        if self._data_model.get_precalibration_type() == Constants.CALIBRATION_OVERSCAN:
+            self.overscan_rectangle_changed()
         self.sigma_threshold_changed()
         self.sub_folder_name_changed()
         self.temperature_group_bandwidth_changed()
+        self.exposure_group_bandwidth_changed()
         self.enable_buttons()
         return self.ui.combineSelectedButton.isEnabled()
 
@@ -703,6 +933,7 @@ class MainWindow(QMainWindow):
         """
         if self._data_model.get_group_by_size() \
                 or self._data_model.get_group_by_temperature() \
+                or self._data_model.get_group_by_exposure() \
                 or self._data_model.get_group_by_filter():
             return self.get_group_output_directory()
         else:
@@ -728,11 +959,20 @@ class MainWindow(QMainWindow):
                 precal_parts.append("Recursive")
             if self._data_model.get_auto_directory_bias_only():
                 precal_parts.append("Bias/Flat")
+            if self._data_model.get_auto_directory_scale_dark():
+                precal_parts.append("ScaledDark")
+            if self._data_model.get_auto_directory_synthesize_bias():
+                precal_parts.append("MasterBias")
             precal_type_string = ",".join(precal_parts)
             precal_option_2 = os.path.basename(self._data_model.get_precalibration_auto_directory())
         elif precal_type == Constants.CALIBRATION_PEDESTAL:
             precal_type_string += f" {self._data_model.get_precalibration_pedestal()}"
             precal_option_2 = ""
+        elif precal_type == Constants.CALIBRATION_OVERSCAN:
+            (x_start, x_end, y_start, y_end) = self._data_model.get_overscan_rectangle()
+            precal_option_2 = f"x {x_start}:{x_end}, y {y_start}:{y_end}"
+            if self._data_model.get_overscan_trim():
+                precal_option_2 += ", trim"
         self.ui.preCalInfo1.setText(precal_type_string)
         self.ui.preCalInfo2.setText(precal_option_2)
 
@@ -755,6 +995,8 @@ class MainWindow(QMainWindow):
             group_parts.append("Size")
         if self._data_model.get_group_by_temperature():
             group_parts.append("Temp")
+        if self._data_model.get_group_by_exposure():
+            group_parts.append("Exposure")
         if self._data_model.get_group_by_filter():
             group_parts.append("Filter")
         if self._data_model.get_ignore_groups_fewer_than():
@@ -773,9 +1015,35 @@ class MainWindow(QMainWindow):
 
     def tab_changed(self):
         """
-        The tab view has changed. Re-generate the options summary
+        The tab view has changed. Re-generate the options summary, and the group plan if it is shown
         """
         self.fill_options_readout()
+        if self.ui.tabWidget.currentWidget() is self.ui.planTab:
+            self.refresh_group_plan()
+
+    def refresh_group_plan(self):
+        """
+        Show, in the group plan tab, the groups the selected files would be combined in and their
+        estimated costs.  Only the file headers already read are used, so this is quick.
+        """
+        self.commit_fields_continue()
+        selected_files: [FileDescriptor] = self.get_selected_file_descriptors()
+        if not (self._data_model.get_group_by_size()
+                or self._data_model.get_group_by_temperature()
+                or self._data_model.get_group_by_exposure()
+                or self._data_model.get_group_by_filter()):
+            plan_text = "No group-by options are selected: the selected files would be combined into one file."
+        elif len(selected_files) == 0:
+            plan_text = "No files are selected."
+        else:
+            console = ConsoleBuffer()
+            try:
+                FileCombiner(SessionController(), None).preview_groups(self._data_model, selected_files,
+                                                                       None, console)
+                plan_text = console.take_text()
+            except FileNotFoundError as exception:
+                plan_text = f"File \"{exception.filename}\" not found or not readable"
+        self.ui.groupPlanText.setPlainText(plan_text)
 
     def remove_from_ui(self, path_to_remove: str):
         """
@@ -1,17 +1,16 @@
 #!/Library/Frameworks/Python.framework/Versions/3.8/bin/python3.8
 import sys
 from argparse import ArgumentParser
+from multiprocessing import freeze_support
 
-from PyQt5 import QtWidgets
-
-from CommandLineHandler import CommandLineHandler
-from DataModel import DataModel
-from MainWindow import MainWindow
+from ImportProfiler import ImportProfiler
 # First phase in development of automated calibration frame combination.
 # This program combines Flat Frames into a master flat.  If run without parameters, a GUI
 # window opens.  If run given a list of file names as args, then those are immediately processed
 # without the UI interaction.  Preferences control how they are combined and where the result goes.
-from Preferences import Preferences
+# Qt is imported only when the GUI is opened, so the command line starts quickly and runs without it.
+# The program's own modules are imported only once the arguments are parsed, so --help and argument
+# errors are reported at once, and --import-profile can time them.
 
 # Set up command line arguments
 arg_parser = ArgumentParser(description="Combine Flat-Frame FITS files into a master flat")
@@ -28,13 +27,24 @@ precal_arg_group.add_argument("-b", "--bias", metavar="<Bias FITS file>",
                               help="Precalibrate by subtracting bias file")
 precal_arg_group.add_argument("-a", "--auto", type=str, metavar="<auto bias directory>",
                               help="Select best bias file from given directory of bias files")
+precal_arg_group.add_argument("-os", "--overscan", type=int, nargs=4,
+                              metavar=("<x start>", "<x end>", "<y start>", "<y end>"),
+                              help="Precalibrate by subtracting per-row median of given overscan region")
 
+arg_parser.add_argument("-ot", "--overscantrim", action="store_true",
+                        help="Trim the overscan columns from the calibrated images")
 arg_parser.add_argument("-ar", "--autorecursive", action="store_true",
                         help="Recursively check sub-folders for auto calibration")
 arg_parser.add_argument("-ab", "--autobias", action="store_true",
                         help="Restrict auto calibration files considered to only Bias files")
 arg_parser.add_argument("-ax", "--autoresults", action="store_true",
                         help="Display results of each auto-calibration file selection search")
+arg_parser.add_argument("-ad", "--autoscaledark", action="store_true",
+                        help="Auto calibration subtracts a bias plus a dark scaled to each file's exposure")
+arg_parser.add_argument("-as", "--autosynthesize", action="store_true",
+                        help="Auto calibration median-combines all matching bias files into a master bias")
+arg_parser.add_argument("-bc", "--biascache", type=str, metavar="<directory>",
+                        help="Directory where synthesized master bias files are saved for re-use")
 
 # # combination algorithm options - only one may be used
 method_arg_group = arg_parser.add_mutually_exclusive_group()
@@ -54,10 +64,25 @@ arg_parser.add_argument("-gf", "--groupfilter", action="store_true",
                         help="Group files by filter name")
 arg_parser.add_argument("-gt", "--grouptemperature", type=float, metavar="<Bandwidth>",
                         help="Group by temperature with given bandwidth")
+arg_parser.add_argument("-ge", "--groupexposure", type=float, metavar="<Bandwidth>",
+                        help="Group by exposure time, splitting where exposures are more than bandwidth seconds apart")
 arg_parser.add_argument("-mg", "--minimumgroup", type=int, metavar="<Minimum group size>",
                         help="Ignore groups smaller than given size")
 arg_parser.add_argument("-od", "--outputdirectory", type=str, metavar="Output directory",
                         help="Directory to receive outputs of grouped combines")
+arg_parser.add_argument("-cg", "--concurrentgroups", type=int, metavar="<Number of groups>",
+                        help="Combine this many groups at once, each in its own worker process")
+arg_parser.add_argument("-wm", "--workermemory", type=int, metavar="<Megabytes>",
+                        help="Memory budget of each group worker process (0 for no limit)")
+arg_parser.add_argument("-mx", "--maxmemory", "--max-memory", type=int, metavar="<Megabytes>",
+                        help="Ceiling on the estimated memory of all groups combined at once; a group over "
+                             "it by itself is combined in bands of rows (0 for none)")
+arg_parser.add_argument("-w", "--watch", type=str, metavar="<directory>",
+                        help="Watch a directory, combining each group once it is complete, until interrupted")
+arg_parser.add_argument("-wq", "--watchquiet", type=float, metavar="<seconds>",
+                        help="When watching, combine a group once no file has joined it for this long (default 60)")
+arg_parser.add_argument("-r", "--resume", action="store_true",
+                        help="Skip groups already combined, with the same files and options, into the output directory")
 
 # File disposition and other options
 arg_parser.add_argument("-v", "--moveinputs", metavar="<directory>",
@@ -67,21 +92,71 @@ arg_parser.add_argument("-t", "--ignoretype", action="store_true",
 arg_parser.add_argument("-o", "--output", metavar="<output path>",
                         help="Name of output file (default: constructed name at location of inputs)")
 
+arg_parser.add_argument("-pl", "--plan", action="store_true",
+                        help="Report the calibration files each input would use, without combining")
+arg_parser.add_argument("-dr", "--dry-run", action="store_true",
+                        help="Report the groups that would be combined and their estimated costs, without combining")
+arg_parser.add_argument("-pf", "--profile", action="store_true",
+                        help="At the end of the session, list the time and memory taken by each stage of combining")
+arg_parser.add_argument("-lf", "--log-format", choices=["text", "jsonl"], default="text",
+                        help="Session output as text, or as JSON lines of messages and timed events")
+arg_parser.add_argument("-sv", "--serve", type=int, metavar="<port>",
+                        help="Run as a server, accepting combine jobs over HTTP on the given local port")
+arg_parser.add_argument("-jf", "--jobs-file", type=str, metavar="<JSON file>",
+                        help="Run all the combine jobs listed in a JSON file, in one process")
+arg_parser.add_argument("-cj", "--concurrentjobs", type=int, metavar="<Number of jobs>",
+                        help="With --jobs-file, run this many jobs at once (default 1)")
+arg_parser.add_argument("-ip", "--import-profile", action="store_true",
+                        help="After running, list the time taken to import each module, slowest first")
+
 arg_parser.add_argument("filenames", nargs="*")
-args = arg_parser.parse_args()
 
-preferences: Preferences = Preferences()
-data_model: DataModel = DataModel(preferences)
+# Group worker processes are started with "spawn", which imports this module again in each worker.
+# The guard keeps the workers from parsing the arguments and running the program themselves, and
+# freeze_support lets them start from a frozen (pyinstaller) executable.
+if __name__ == "__main__":
+    freeze_support()
+    args = arg_parser.parse_args()
+    if args.import_profile:
+        ImportProfiler.start()
+    from DataModel import DataModel
+    from Preferences import Preferences
 
-# If no arguments were given, or if the --gui argument was given, open the GUI window
-if len(sys.argv) == 1 or args.gui:
-    app = QtWidgets.QApplication(sys.argv)
-    window = MainWindow(preferences, data_model)
-    window.set_up_ui()
-    window.ui.show()
-    app.exec_()
-else:
-    # We're operating in pure command-line mode
-    command_line_handler = CommandLineHandler(args, data_model)
-    command_line_handler.execute()
+    # If no arguments were given, or if the --gui argument was given, open the GUI window
+    if len(sys.argv) == 1 or args.gui:
+        from PyQt5 import QtWidgets
+        from MainWindow import MainWindow
+        if args.profile:
+            from StageProfiler import StageProfiler
+            StageProfiler.start()
+        preferences: Preferences = Preferences.for_gui()
+        data_model: DataModel = DataModel(preferences)
+        app = QtWidgets.QApplication(sys.argv)
+        window = MainWindow(preferences, data_model)
+        window.set_up_ui()
+        app.aboutToQuit.connect(window.stop_calibration_prewarm)
+        window.ui.show()
+        app.exec_()
+    elif args.serve is not None:
+        # Long-running server, taking jobs with the same arguments as the command line
+        from CombineServer import CombineServer
+        CombineServer(arg_parser, args.serve).serve()
+    elif args.jobs_file is not None:
+        # Many jobs, each with its own arguments, in this one process
+        from JobsFileRunner import JobsFileRunner
+        concurrent_jobs = args.concurrentjobs if args.concurrentjobs is not None else 1
+        if concurrent_jobs > 0:
+            JobsFileRunner(arg_parser, args.jobs_file, concurrent_jobs).run()
+        else:
+            print(f"Number of jobs run at once must be > 0, not {concurrent_jobs}")
+    else:
+        # We're operating in pure command-line mode
+        from CommandLineHandler import CommandLineHandler
+        preferences: Preferences = Preferences.for_command_line()
+        data_model: DataModel = DataModel(preferences)
+        command_line_handler = CommandLineHandler(args, data_model)
+        command_line_handler.execute()
 
+    if args.import_profile:
+        # Standard output carries only JSON lines in jsonl mode, so the report goes to standard error
+        ImportProfiler.report(sys.stderr if args.log_format == "jsonl" else sys.stdout)
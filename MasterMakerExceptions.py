@@ -3,6 +3,10 @@
 #   to the outer-level control loop.  We use the built-in Python exceptions whenever possible,
 #   and the following custom exceptions when necessary
 #
+#   Groups may be processed in worker processes, which send any exception back to the main process
+#   by pickling it.  So exceptions carrying a value pass it to Exception.__init__, which records it
+#   in "args", the values pickle uses to re-create the exception.
+#
 
 
 #
@@ -15,6 +19,16 @@ class NoSuitableAutoBias(Exception):
     pass
 
 
+#
+#   Auto-calibration with a scaled dark is selected, but the directory contains no dark
+#   file with a non-zero exposure of the right size (dimensions and binning)
+#
+
+
+class NoSuitableAutoDark(Exception):
+    pass
+
+
 #
 #   Group processing is selected, which puts created files in a directory
 #   The specified directory does not exist
@@ -23,6 +37,7 @@ class NoSuitableAutoBias(Exception):
 
 class NoGroupOutputDirectory(Exception):
     def __init__(self, directory_name: str):
+        Exception.__init__(self, directory_name)
         self._directory_name = directory_name
 
     def get_directory_name(self) -> str:
@@ -51,6 +66,7 @@ class TestException(Exception):
 
 class NoAutoCalibrationDirectory(Exception):
     def __init__(self, directory_name: str):
+        Exception.__init__(self, directory_name)
         self._directory_name = directory_name
 
     def get_directory_name(self) -> str:
@@ -59,6 +75,7 @@ class NoAutoCalibrationDirectory(Exception):
 
 class AutoCalibrationDirectoryEmpty(Exception):
     def __init__(self, directory_name: str):
+        Exception.__init__(self, directory_name)
         self._directory_name = directory_name
 
     def get_directory_name(self) -> str:
@@ -71,3 +88,13 @@ class AutoCalibrationNoBiasFiles(Exception):
 
 class SessionCancelled(Exception):
     pass
+
+
+#
+#   Overscan calibration is selected, but the overscan rectangle is empty or extends
+#   outside the images being calibrated
+#
+
+
+class InvalidOverscanRegion(Exception):
+    pass
@@ -1,9 +1,19 @@
-from PyQt5.QtCore import QSettings, QSize, QPoint
+#
+#   The program's preferences: the default settings established in the Preferences window.
+#   The values are kept in a store with the value() and setValue() methods of QSettings.  In the GUI
+#   that is QSettings itself, with each value also copied to a pure-Python JSON store; the command
+#   line reads that JSON store, so it runs without importing Qt.
+#
+import os
 
 from Constants import Constants
+from JsonSettings import JsonSettings
 
 
-class Preferences(QSettings):
+class Preferences:
+    QT_ORGANIZATION = "EarwigHavenObservatory.com"
+    QT_APPLICATION = "MasterFlatMaker_b"
+
     # The following are the preferences available
 
     # How should frames be combined?  Stored as an integer corresponding to one of
@@ -47,27 +57,100 @@ class Preferences(QSettings):
     AUTO_DIRECTORY_RECURSIVE = "auto_directory_recursive"
     # Should auto-directory restrict files considered to only BIAS files?
     AUTO_DIRECTORY_BIAS_ONLY = "auto_directory_bias_only"
+    # Should auto-directory subtract a bias plus a dark scaled to each file's exposure?
+    AUTO_DIRECTORY_SCALE_DARK = "auto_directory_scale_dark"
+    # Should auto-directory median-combine all matching bias files into a master bias?
+    AUTO_DIRECTORY_SYNTHESIZE_BIAS = "auto_directory_synthesize_bias"
+    # Directory where synthesized master bias files are saved for re-use (empty for none)
+    BIAS_CACHE_DIRECTORY = "bias_cache_directory"
     DISPLAY_AUTO_SELECT_RESULTS = "display_auto_select_results"
+    # When the auto-directory is set in the GUI, should the calibration frames matching the loaded files
+    # also be read into memory in the background (as well as the directory's headers being indexed)?
+    PREWARM_DECODE_FRAMES = "prewarm_decode_frames"
+    # Most memory, in megabytes, used to keep decoded calibration frames between sessions
+    FRAME_CACHE_MEGABYTES = "frame_cache_megabytes"
+
+    # Overscan region, in pixels, if overscan calibration is chosen: columns x_start up to (not including)
+    # x_end, and rows y_start up to y_end.  And should the overscan columns be trimmed from the result?
+    OVERSCAN_X_START = "overscan_x_start"
+    OVERSCAN_X_END = "overscan_x_end"
+    OVERSCAN_Y_START = "overscan_y_start"
+    OVERSCAN_Y_END = "overscan_y_end"
+    OVERSCAN_TRIM = "overscan_trim"
 
     # Are we processing multiple file sets at once using grouping?
     GROUP_BY_SIZE = "group_by_size"
     GROUP_BY_TEMPERATURE = "group_by_temperature"
+    GROUP_BY_EXPOSURE = "group_by_exposure"
     GROUP_BY_FILTER = "group_by_filter"
 
     # How much, as a percentage, can temperatures vary before being considered a different group?
     TEMPERATURE_GROUP_BANDWIDTH = "temperature_group_bandwidth"
+    # How large a gap, in seconds, between exposure times starts a different group?
+    EXPOSURE_GROUP_BANDWIDTH = "exposure_group_bandwidth"
 
     # Should we ignore small groups (probably haven't finished collecting them yet)?  How small
     IGNORE_GROUPS_FEWER_THAN = "ignore_groups_fewer_than"
     MINIMUM_GROUP_SIZE = "minimum_group_size"
 
+    # How many groups are combined at once, each in its own worker process, and how much memory,
+    # in megabytes, each worker should use (0 for no limit)
+    CONCURRENT_GROUPS = "concurrent_groups"
+    WORKER_MEMORY_MEGABYTES = "worker_memory_megabytes"
+    # Ceiling, in megabytes, on the estimated peak memory of all the groups combined at once (0 for none)
+    MAXIMUM_MEMORY_MEGABYTES = "maximum_memory_megabytes"
+
     # Should ADU values for FITS files be displayed in the main window (slows down processing
     # since every file has to be read in its entirety to populate the window)
     DISPLAY_AVERAGE_ADUS = "display_average_adus"
 
-    def __init__(self):
-        QSettings.__init__(self, "EarwigHavenObservatory.com", "MasterFlatMaker_b")
-        # print(f"Preferences file path: {self.fileName()}")
+    def __init__(self, settings, mirror: JsonSettings = None):
+        """
+        Initialize preferences kept in the given store
+        :param settings:    Store holding the values: QSettings, or a JsonSettings
+        :param mirror:      Optional second store to receive a copy of each value set
+        """
+        self._settings = settings
+        self._mirror = mirror
+        # print(f"Preferences file path: {self._settings.fileName()}")
+
+    @classmethod
+    def for_gui(cls) -> "Preferences":
+        """
+        Create the preferences for the GUI, kept in QSettings and copied to the JSON store.  All the
+        existing values are copied when the GUI starts, so the command line sees them from then on.
+        :return:    Preferences object
+        """
+        from PyQt5.QtCore import QSettings
+        settings = QSettings(cls.QT_ORGANIZATION, cls.QT_APPLICATION)
+        mirror = JsonSettings(JsonSettings.default_path())
+        mirror.update_from(settings)
+        return cls(settings, mirror)
+
+    @classmethod
+    def for_command_line(cls) -> "Preferences":
+        """
+        Create the preferences for the command line, read from the JSON store without using Qt.
+        If the GUI has not been run since the JSON store was introduced, the values are copied
+        from QSettings this one time, if Qt is available.
+        :return:    Preferences object
+        """
+        settings = JsonSettings(JsonSettings.default_path())
+        if not settings.exists():
+            try:
+                from PyQt5.QtCore import QSettings
+                settings.update_from(QSettings(cls.QT_ORGANIZATION, cls.QT_APPLICATION))
+            except ImportError:
+                pass
+        return cls(settings)
+
+    def value(self, key: str, defaultValue=None):
+        return self._settings.value(key, defaultValue=defaultValue)
+
+    def setValue(self, key: str, value):
+        self._settings.setValue(key, value)
+        if self._mirror is not None:
+            self._mirror.setValue(key, value)
 
     # Getters and setters for preferences values
 
@@ -133,34 +216,34 @@ class Preferences(QSettings):
 
     # Main window size when resized
 
-    def get_main_window_size(self) -> QSize:
+    def get_main_window_size(self) -> "QSize":
         return self.value(self.MAIN_WINDOW_SIZE, defaultValue=None)
 
-    def set_main_window_size(self, size: QSize):
+    def set_main_window_size(self, size: "QSize"):
         self.setValue(self.MAIN_WINDOW_SIZE, size)
 
     # Main window position when moved
 
-    def get_main_window_position(self) -> QPoint:
+    def get_main_window_position(self) -> "QPoint":
         return self.value(self.MAIN_WINDOW_POSITION, defaultValue=None)
 
-    def set_main_window_position(self, position: QPoint):
+    def set_main_window_position(self, position: "QPoint"):
         self.setValue(self.MAIN_WINDOW_POSITION, position)
 
     # Console window size when resized
 
-    def get_console_window_size(self) -> QSize:
+    def get_console_window_size(self) -> "QSize":
         return self.value(self.CONSOLE_WINDOW_SIZE, defaultValue=None)
 
-    def set_console_window_size(self, size: QSize):
+    def set_console_window_size(self, size: "QSize"):
         self.setValue(self.CONSOLE_WINDOW_SIZE, size)
 
     # Console window position when moved
 
-    def get_console_window_position(self) -> QPoint:
+    def get_console_window_position(self) -> "QPoint":
         return self.value(self.CONSOLE_WINDOW_POSITION, defaultValue=None)
 
-    def set_console_window_position(self, position: QPoint):
+    def set_console_window_position(self, position: "QPoint"):
         self.setValue(self.CONSOLE_WINDOW_POSITION, position)
 
     # Pre-calibration method
@@ -170,6 +253,7 @@ class Preferences(QSettings):
         assert (result == Constants.CALIBRATION_NONE) \
             or (result == Constants.CALIBRATION_FIXED_FILE) \
             or (result == Constants.CALIBRATION_AUTO_DIRECTORY) \
+            or (result == Constants.CALIBRATION_OVERSCAN) \
             or (result == Constants.CALIBRATION_PEDESTAL)
         return result
 
@@ -177,6 +261,7 @@ class Preferences(QSettings):
         assert (value == Constants.CALIBRATION_NONE) \
                or (value == Constants.CALIBRATION_FIXED_FILE) \
                or (value == Constants.CALIBRATION_AUTO_DIRECTORY) \
+               or (value == Constants.CALIBRATION_OVERSCAN) \
                or (value == Constants.CALIBRATION_PEDESTAL)
         self.setValue(self.IMAGE_PRE_CALIBRATION, value)
 
@@ -220,6 +305,54 @@ class Preferences(QSettings):
     def set_auto_directory_bias_only(self, path: bool):
         self.setValue(self.AUTO_DIRECTORY_BIAS_ONLY, path)
 
+    # Should auto-directory subtract a bias plus a dark scaled to each file's exposure?
+
+    def get_auto_directory_scale_dark(self) -> bool:
+        return bool(self.value(self.AUTO_DIRECTORY_SCALE_DARK, defaultValue=False))
+
+    def set_auto_directory_scale_dark(self, scale_dark: bool):
+        self.setValue(self.AUTO_DIRECTORY_SCALE_DARK, scale_dark)
+
+    # Should auto-directory median-combine all matching bias files into a master bias?
+
+    def get_auto_directory_synthesize_bias(self) -> bool:
+        return bool(self.value(self.AUTO_DIRECTORY_SYNTHESIZE_BIAS, defaultValue=False))
+
+    def set_auto_directory_synthesize_bias(self, synthesize: bool):
+        self.setValue(self.AUTO_DIRECTORY_SYNTHESIZE_BIAS, synthesize)
+
+    # Directory where synthesized master bias files are saved for re-use (empty for none)
+
+    def get_bias_cache_directory(self) -> str:
+        default_directory = os.path.join(os.path.expanduser("~"), ".MasterFlatMaker", "bias-cache")
+        return str(self.value(self.BIAS_CACHE_DIRECTORY, defaultValue=default_directory))
+
+    def set_bias_cache_directory(self, path: str):
+        self.setValue(self.BIAS_CACHE_DIRECTORY, path)
+
+    # Overscan region (x_start, x_end, y_start, y_end) used if overscan calibration is chosen
+
+    def get_overscan_rectangle(self) -> (int, int, int, int):
+        return (int(self.value(self.OVERSCAN_X_START, defaultValue=0)),
+                int(self.value(self.OVERSCAN_X_END, defaultValue=0)),
+                int(self.value(self.OVERSCAN_Y_START, defaultValue=0)),
+                int(self.value(self.OVERSCAN_Y_END, defaultValue=0)))
+
+    def set_overscan_rectangle(self, rectangle: (int, int, int, int)):
+        (x_start, x_end, y_start, y_end) = rectangle
+        self.setValue(self.OVERSCAN_X_START, x_start)
+        self.setValue(self.OVERSCAN_X_END, x_end)
+        self.setValue(self.OVERSCAN_Y_START, y_start)
+        self.setValue(self.OVERSCAN_Y_END, y_end)
+
+    # Should the overscan columns be trimmed from the calibrated images?
+
+    def get_overscan_trim(self) -> bool:
+        return bool(self.value(self.OVERSCAN_TRIM, defaultValue=False))
+
+    def set_overscan_trim(self, trim: bool):
+        self.setValue(self.OVERSCAN_TRIM, trim)
+
     # Are we processing multiple file sets at once using grouping?
 
     def get_group_by_size(self) -> bool:
@@ -234,6 +367,12 @@ class Preferences(QSettings):
     def set_group_by_temperature(self, is_grouped: bool):
         self.setValue(self.GROUP_BY_TEMPERATURE, is_grouped)
 
+    def get_group_by_exposure(self) -> bool:
+        return bool(self.value(self.GROUP_BY_EXPOSURE, defaultValue=False))
+
+    def set_group_by_exposure(self, is_grouped: bool):
+        self.setValue(self.GROUP_BY_EXPOSURE, is_grouped)
+
     def get_group_by_filter(self) -> bool:
         return bool(self.value(self.GROUP_BY_FILTER, defaultValue=False))
 
@@ -246,6 +385,20 @@ class Preferences(QSettings):
     def set_display_auto_select_results(self, display: bool):
         self.setValue(self.DISPLAY_AUTO_SELECT_RESULTS, display)
 
+    # Background pre-loading of the auto-directory's matching calibration frames in the GUI
+
+    def get_prewarm_decode_frames(self) -> bool:
+        return bool(self.value(self.PREWARM_DECODE_FRAMES, defaultValue=False))
+
+    def set_prewarm_decode_frames(self, decode: bool):
+        self.setValue(self.PREWARM_DECODE_FRAMES, decode)
+
+    def get_frame_cache_megabytes(self) -> int:
+        return int(self.value(self.FRAME_CACHE_MEGABYTES, defaultValue=Constants.CALIBRATION_LIBRARY_MEGABYTES))
+
+    def set_frame_cache_megabytes(self, megabytes: int):
+        self.setValue(self.FRAME_CACHE_MEGABYTES, megabytes)
+
     # Bandwidth to use for clustering temperatures into groups
 
     def get_temperature_group_bandwidth(self) -> float:
@@ -257,6 +410,17 @@ class Preferences(QSettings):
         assert 0.1 <= bandwidth <= 50.0
         self.setValue(self.TEMPERATURE_GROUP_BANDWIDTH, bandwidth)
 
+    # Gap between exposure times, in seconds, that separates exposure groups
+
+    def get_exposure_group_bandwidth(self) -> float:
+        bandwidth: float = float(self.value(self.EXPOSURE_GROUP_BANDWIDTH, defaultValue=1.0))
+        assert 0.1 <= bandwidth <= 50.0
+        return bandwidth
+
+    def set_exposure_group_bandwidth(self, bandwidth: float):
+        assert 0.1 <= bandwidth <= 50.0
+        self.setValue(self.EXPOSURE_GROUP_BANDWIDTH, bandwidth)
+
     # Should we ignore small groups (probably haven't finished collecting them yet)?  How small?
 
     def get_ignore_groups_fewer_than(self) -> bool:
@@ -271,6 +435,26 @@ class Preferences(QSettings):
     def set_minimum_group_size(self, value: int):
         self.setValue(self.MINIMUM_GROUP_SIZE, value)
 
+    # How many groups are combined at once, and the memory budget of each worker process
+
+    def get_concurrent_groups(self) -> int:
+        return int(self.value(self.CONCURRENT_GROUPS, defaultValue=1))
+
+    def set_concurrent_groups(self, value: int):
+        self.setValue(self.CONCURRENT_GROUPS, value)
+
+    def get_worker_memory_megabytes(self) -> int:
+        return int(self.value(self.WORKER_MEMORY_MEGABYTES, defaultValue=0))
+
+    def set_worker_memory_megabytes(self, megabytes: int):
+        self.setValue(self.WORKER_MEMORY_MEGABYTES, megabytes)
+
+    def get_maximum_memory_megabytes(self) -> int:
+        return int(self.value(self.MAXIMUM_MEMORY_MEGABYTES, defaultValue=0))
+
+    def set_maximum_memory_megabytes(self, megabytes: int):
+        self.setValue(self.MAXIMUM_MEMORY_MEGABYTES, megabytes)
+
     # Should ADU values for FITS files be displayed in the main window (slows down processing
     # since every file has to be read in its entirety to populate the window)
 
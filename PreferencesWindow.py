@@ -3,6 +3,7 @@ import os
 from PyQt5 import uic
 from PyQt5.QtWidgets import QDialog, QFileDialog
 
+from CalibrationLibrary import CalibrationLibrary
 from Constants import Constants
 from MultiOsUtil import MultiOsUtil
 from Preferences import Preferences
@@ -58,25 +59,38 @@ class PreferencesWindow(QDialog):
             self.ui.noPreClalibrationRB.setChecked(True)
         elif precalibration_option == Constants.CALIBRATION_AUTO_DIRECTORY:
             self.ui.autoPreCalibrationRB.setChecked(True)
+        elif precalibration_option == Constants.CALIBRATION_OVERSCAN:
+            self.ui.overscanRB.setChecked(True)
         else:
             assert precalibration_option == Constants.CALIBRATION_PEDESTAL
             self.ui.fixedPedestalRB.setChecked(True)
         self.ui.fixedPedestalAmount.setText(str(preferences.get_precalibration_pedestal()))
         self.ui.precalibrationPathDisplay.setText(os.path.basename(preferences.get_precalibration_fixed_path()))
         self.ui.autoDirectoryName.setText(os.path.basename(preferences.get_precalibration_auto_directory()))
+        self.ui.overscanRectangle.setText(",".join(str(n) for n in preferences.get_overscan_rectangle()))
+        self.ui.overscanTrim.setChecked(preferences.get_overscan_trim())
 
         self.ui.autoRecursive.setChecked(preferences.get_auto_directory_recursive())
         self.ui.autoBiasOnly.setChecked(preferences.get_auto_directory_bias_only())
+        self.ui.autoScaleDark.setChecked(preferences.get_auto_directory_scale_dark())
+        self.ui.autoSynthesizeBias.setChecked(preferences.get_auto_directory_synthesize_bias())
         self.ui.displayAutoResultsCB.setChecked(preferences.get_display_auto_select_results())
+        self.ui.prewarmDecodeFrames.setChecked(preferences.get_prewarm_decode_frames())
+        self.ui.frameCacheMegabytes.setText(str(preferences.get_frame_cache_megabytes()))
 
         # Grouping information
         self.ui.groupBySizeCB.setChecked(preferences.get_group_by_size())
         self.ui.groupByTemperatureCB.setChecked(preferences.get_group_by_temperature())
+        self.ui.groupByExposureCB.setChecked(preferences.get_group_by_exposure())
         self.ui.groupByFilterCB.setChecked(preferences.get_group_by_filter())
         self.ui.ignoreSmallGroupsCB.setChecked(preferences.get_ignore_groups_fewer_than())
 
         self.ui.temperatureGroupBandwidth.setText(f"{preferences.get_temperature_group_bandwidth()}")
+        self.ui.exposureGroupBandwidth.setText(f"{preferences.get_exposure_group_bandwidth()}")
         self.ui.minimumGroupSize.setText(str(preferences.get_minimum_group_size()))
+        self.ui.concurrentGroups.setText(str(preferences.get_concurrent_groups()))
+        self.ui.workerMemoryMegabytes.setText(str(preferences.get_worker_memory_megabytes()))
+        self.ui.maximumMemoryMegabytes.setText(str(preferences.get_maximum_memory_megabytes()))
 
         # Display average ADUs
         self.ui.displayAverageADUs.setChecked(preferences.get_display_average_adus())
@@ -94,18 +108,24 @@ class PreferencesWindow(QDialog):
         self.ui.fixedPedestalRB.clicked.connect(self.precalibration_pedestal_clicked)
         self.ui.FixedPreCalFileRB.clicked.connect(self.precalibration_file_clicked)
         self.ui.autoPreCalibrationRB.clicked.connect(self.precalibration_auto_clicked)
+        self.ui.overscanRB.clicked.connect(self.precalibration_overscan_clicked)
+        self.ui.overscanTrim.clicked.connect(self.overscan_trim_clicked)
 
         self.ui.selectPreCalFile.clicked.connect(self.select_precalibration_file_clicked)
         self.ui.setAutoDirectory.clicked.connect(self.select_auto_calibration_directory_clicked)
 
         self.ui.groupBySizeCB.clicked.connect(self.group_by_size_clicked)
         self.ui.groupByTemperatureCB.clicked.connect(self.group_by_temperature_clicked)
+        self.ui.groupByExposureCB.clicked.connect(self.group_by_exposure_clicked)
         self.ui.groupByFilterCB.clicked.connect(self.group_by_filter_clicked)
         self.ui.ignoreSmallGroupsCB.clicked.connect(self.ignore_small_groups_clicked)
 
         self.ui.autoRecursive.clicked.connect(self.auto_recursive_clicked)
         self.ui.autoBiasOnly.clicked.connect(self.auto_bias_only_clicked)
+        self.ui.autoScaleDark.clicked.connect(self.auto_scale_dark_clicked)
+        self.ui.autoSynthesizeBias.clicked.connect(self.auto_synthesize_bias_clicked)
         self.ui.displayAutoResultsCB.clicked.connect(self.display_auto_results_clicked)
+        self.ui.prewarmDecodeFrames.clicked.connect(self.prewarm_decode_frames_clicked)
 
         self.ui.displayAverageADUs.clicked.connect(self.display_average_adus_clicked)
 
@@ -116,8 +136,14 @@ class PreferencesWindow(QDialog):
         self.ui.sigmaThreshold.editingFinished.connect(self.sigma_threshold_changed)
         self.ui.subFolderName.editingFinished.connect(self.sub_folder_name_changed)
         self.ui.fixedPedestalAmount.editingFinished.connect(self.pedestal_amount_changed)
+        self.ui.frameCacheMegabytes.editingFinished.connect(self.frame_cache_megabytes_changed)
+        self.ui.overscanRectangle.editingFinished.connect(self.overscan_rectangle_changed)
         self.ui.temperatureGroupBandwidth.editingFinished.connect(self.temperature_group_bandwidth_changed)
+        self.ui.exposureGroupBandwidth.editingFinished.connect(self.exposure_group_bandwidth_changed)
         self.ui.minimumGroupSize.editingFinished.connect(self.minimum_group_size_changed)
+        self.ui.concurrentGroups.editingFinished.connect(self.concurrent_groups_changed)
+        self.ui.workerMemoryMegabytes.editingFinished.connect(self.worker_memory_megabytes_changed)
+        self.ui.maximumMemoryMegabytes.editingFinished.connect(self.maximum_memory_megabytes_changed)
 
         # Tiny fonts in path display fields
         tiny_font = self.ui.precalibrationPathDisplay.font()
@@ -135,6 +161,10 @@ class PreferencesWindow(QDialog):
         self._preferences.set_group_by_temperature(self.ui.groupByTemperatureCB.isChecked())
         self.enableFields()
 
+    def group_by_exposure_clicked(self):
+        self._preferences.set_group_by_exposure(self.ui.groupByExposureCB.isChecked())
+        self.enableFields()
+
     def group_by_filter_clicked(self):
         self._preferences.set_group_by_filter(self.ui.groupByFilterCB.isChecked())
         self.enableFields()
@@ -147,10 +177,22 @@ class PreferencesWindow(QDialog):
         self._preferences.set_auto_directory_bias_only(self.ui.autoBiasOnly.isChecked())
         self.enableFields()
 
+    def auto_scale_dark_clicked(self):
+        self._preferences.set_auto_directory_scale_dark(self.ui.autoScaleDark.isChecked())
+        self.enableFields()
+
+    def auto_synthesize_bias_clicked(self):
+        self._preferences.set_auto_directory_synthesize_bias(self.ui.autoSynthesizeBias.isChecked())
+        self.enableFields()
+
     def display_auto_results_clicked(self):
         self._preferences.set_display_auto_select_results(self.ui.displayAutoResultsCB.isChecked())
         self.enableFields()
 
+    def prewarm_decode_frames_clicked(self):
+        self._preferences.set_prewarm_decode_frames(self.ui.prewarmDecodeFrames.isChecked())
+        self.enableFields()
+
     def ignore_small_groups_clicked(self):
         self._preferences.set_ignore_groups_fewer_than(self.ui.ignoreSmallGroupsCB.isChecked())
         self.enableFields()
@@ -205,6 +247,15 @@ class PreferencesWindow(QDialog):
         self._preferences.set_precalibration_type(Constants.CALIBRATION_AUTO_DIRECTORY)
         self.enableFields()
 
+    def precalibration_overscan_clicked(self):
+        """User has selected 'overscan strip precalibration' option. Store that preference."""
+        self._preferences.set_precalibration_type(Constants.CALIBRATION_OVERSCAN)
+        self.enableFields()
+
+    def overscan_trim_clicked(self):
+        self._preferences.set_overscan_trim(self.ui.overscanTrim.isChecked())
+        self.enableFields()
+
     def select_precalibration_file_clicked(self):
         (file_name, _) = QFileDialog.getOpenFileName(parent=self,
                                                      caption="Select dark or bias file",
@@ -232,6 +283,25 @@ class PreferencesWindow(QDialog):
             self._preferences.set_precalibration_pedestal(new_number)
         SharedUtils.background_validity_color(self.ui.fixedPedestalAmount, valid)
 
+    def frame_cache_megabytes_changed(self):
+        """User has entered the memory limit for kept calibration frames.  Validate and save"""
+        proposed_new_number: str = self.ui.frameCacheMegabytes.text()
+        new_number = Validators.valid_int_in_range(proposed_new_number, 0, 1024 * 1024)
+        valid = new_number is not None
+        if valid:
+            self._preferences.set_frame_cache_megabytes(new_number)
+            CalibrationLibrary.set_maximum_megabytes(new_number)
+        SharedUtils.background_validity_color(self.ui.frameCacheMegabytes, valid)
+
+    def overscan_rectangle_changed(self):
+        """User has entered value in overscan region field.  Validate and save"""
+        proposed_rectangle: str = self.ui.overscanRectangle.text()
+        new_rectangle = Validators.valid_overscan_rectangle(proposed_rectangle)
+        valid = new_rectangle is not None
+        if valid:
+            self._preferences.set_overscan_rectangle(new_rectangle)
+        SharedUtils.background_validity_color(self.ui.overscanRectangle, valid)
+
     def temperature_group_bandwidth_changed(self):
         """User has entered value in temperature group bandwidth field.  Validate and save"""
         proposed_new_number: str = self.ui.temperatureGroupBandwidth.text()
@@ -241,6 +311,15 @@ class PreferencesWindow(QDialog):
             self._preferences.set_temperature_group_bandwidth(new_number)
         SharedUtils.background_validity_color(self.ui.temperatureGroupBandwidth, valid)
 
+    def exposure_group_bandwidth_changed(self):
+        """User has entered value in exposure group bandwidth field.  Validate and save"""
+        proposed_new_number: str = self.ui.exposureGroupBandwidth.text()
+        new_number = Validators.valid_float_in_range(proposed_new_number, 0.1, 50.0)
+        valid = new_number is not None
+        if valid:
+            self._preferences.set_exposure_group_bandwidth(new_number)
+        SharedUtils.background_validity_color(self.ui.exposureGroupBandwidth, valid)
+
     def minimum_group_size_changed(self):
         """User has entered value in minimum group size field.  Validate and save"""
         proposed_new_number: str = self.ui.minimumGroupSize.text()
@@ -250,6 +329,33 @@ class PreferencesWindow(QDialog):
             self._preferences.set_minimum_group_size(new_number)
         SharedUtils.background_validity_color(self.ui.minimumGroupSize, valid)
 
+    def concurrent_groups_changed(self):
+        """User has entered the number of groups combined at once.  Validate and save"""
+        proposed_new_number: str = self.ui.concurrentGroups.text()
+        new_number = Validators.valid_int_in_range(proposed_new_number, 1, 256)
+        valid = new_number is not None
+        if valid:
+            self._preferences.set_concurrent_groups(new_number)
+        SharedUtils.background_validity_color(self.ui.concurrentGroups, valid)
+
+    def worker_memory_megabytes_changed(self):
+        """User has entered the memory budget of each group worker.  Validate and save"""
+        proposed_new_number: str = self.ui.workerMemoryMegabytes.text()
+        new_number = Validators.valid_int_in_range(proposed_new_number, 0, 1024 * 1024)
+        valid = new_number is not None
+        if valid:
+            self._preferences.set_worker_memory_megabytes(new_number)
+        SharedUtils.background_validity_color(self.ui.workerMemoryMegabytes, valid)
+
+    def maximum_memory_megabytes_changed(self):
+        """User has entered the memory ceiling for all groups combined at once.  Validate and save"""
+        proposed_new_number: str = self.ui.maximumMemoryMegabytes.text()
+        new_number = Validators.valid_int_in_range(proposed_new_number, 0, 1024 * 1024)
+        valid = new_number is not None
+        if valid:
+            self._preferences.set_maximum_memory_megabytes(new_number)
+        SharedUtils.background_validity_color(self.ui.maximumMemoryMegabytes, valid)
+
     def min_max_drop_changed(self):
         """the field giving the number of minimum and maximum values to drop has been changed.
         Validate it (integer > 0) and store if valid"""
@@ -293,12 +399,19 @@ class PreferencesWindow(QDialog):
         self.ui.setAutoDirectory.setEnabled(
             self._preferences.get_precalibration_type() == Constants.CALIBRATION_AUTO_DIRECTORY)
         self.ui.temperatureGroupBandwidth.setEnabled(self._preferences.get_group_by_temperature())
+        self.ui.exposureGroupBandwidth.setEnabled(self._preferences.get_group_by_exposure())
         self.ui.minimumGroupSize.setEnabled(self._preferences.get_ignore_groups_fewer_than())
 
         calibration_type = self._preferences.get_precalibration_type()
         self.ui.autoRecursive.setEnabled(calibration_type == Constants.CALIBRATION_AUTO_DIRECTORY)
         self.ui.autoBiasOnly.setEnabled(calibration_type == Constants.CALIBRATION_AUTO_DIRECTORY)
+        self.ui.autoScaleDark.setEnabled(calibration_type == Constants.CALIBRATION_AUTO_DIRECTORY)
+        self.ui.overscanRectangle.setEnabled(calibration_type == Constants.CALIBRATION_OVERSCAN)
+        self.ui.overscanTrim.setEnabled(calibration_type == Constants.CALIBRATION_OVERSCAN)
+        self.ui.autoSynthesizeBias.setEnabled(calibration_type == Constants.CALIBRATION_AUTO_DIRECTORY)
         self.ui.displayAutoResultsCB.setEnabled(calibration_type == Constants.CALIBRATION_AUTO_DIRECTORY)
+        self.ui.prewarmDecodeFrames.setEnabled(calibration_type == Constants.CALIBRATION_AUTO_DIRECTORY)
+        self.ui.frameCacheMegabytes.setEnabled(calibration_type == Constants.CALIBRATION_AUTO_DIRECTORY)
 
     def close_button_clicked(self):
         """Close button has been clicked - close the preferences window"""
@@ -309,6 +422,14 @@ class PreferencesWindow(QDialog):
             self.sigma_threshold_changed()
         if self.ui.dispositionSubFolderRB.isChecked():
             self.sub_folder_name_changed()
+        if self.ui.overscanRB.isChecked():
+            self.overscan_rectangle_changed()
+        if self.ui.groupByExposureCB.isChecked():
+            self.exposure_group_bandwidth_changed()
+        self.frame_cache_megabytes_changed()
+        self.concurrent_groups_changed()
+        self.worker_memory_megabytes_changed()
+        self.maximum_memory_megabytes_changed()
 
         self.ui.close()
 
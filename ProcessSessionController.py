@@ -0,0 +1,23 @@
+# Session controller for a combination running in a worker process.  The "cancel" flag is a
+# multiprocessing Event shared by the main process and all the workers, so cancelling the
+# session in the main process stops every worker at its next cancellation check.
+from SessionController import SessionController
+
+
+class ProcessSessionController(SessionController):
+
+    def __init__(self, cancel_event):
+        """
+        Initialize this object around the shared cancellation event
+        :param cancel_event:    multiprocessing Event that is set when the session is cancelled
+        """
+        SessionController.__init__(self)
+        self._cancel_event = cancel_event
+
+    def cancel_thread(self):
+        """Set flag to cancel the controlled workers"""
+        self._cancel_event.set()
+
+    def thread_running(self):
+        """Indicate if the controlled workers are still to run"""
+        return not self._cancel_event.is_set()
@@ -1,8 +1,14 @@
+import os
+import time
+from typing import Optional
+
 import numpy
 from astropy.io import fits
 from numpy.core.multiarray import ndarray
 
+from Console import Console
 from FileDescriptor import FileDescriptor
+from StageProfiler import StageProfiler
 
 
 class RmFitsUtil:
@@ -160,7 +166,43 @@ class RmFitsUtil:
         hdul = fits.HDUList([primary_hdu])
 
         # Write to file
-        hdul.writeto(name, output_verify="fix", overwrite=True, checksum=True)
+        with StageProfiler.stage("write"):
+            hdul.writeto(name, output_verify="fix", overwrite=True, checksum=True)
+
+    @classmethod
+    def create_calibration_cache_file(cls, name: str,
+                                      data: ndarray,
+                                      file_type_code: int,
+                                      image_type_string: str,
+                                      temperature: float,
+                                      binning: int,
+                                      comment: str):
+        """
+        Write a synthesized calibration frame (e.g. a master bias) for later re-use.
+        Unlike combined output files, the data is kept as 32-bit floating point so a median
+        of integer frames loses no precision when it is read back.  The file is written under
+        a temporary name and then renamed, so a concurrent reader never sees a partial file.
+        :param name:                File name
+        :param data:                2-dimensional array of pixel values, the file contents
+        :param file_type_code:      What kind of FITS image file is this (dark, bias, flat, etc.)?
+        :param image_type_string:   String for FITS file "IMAGETYP" parameter
+        :param temperature:         Temperature in degrees if known, else 0
+        :param binning:             Binning value of this frame (1, 2, 3, or 4)
+        :param comment:             General comment describing this file
+        """
+        header = fits.Header()
+        header["COMMENT"] = comment
+        header["EXPTIME"] = 0.0
+        header["CCD-TEMP"] = temperature
+        header["XBINNING"] = binning
+        header["YBINNING"] = binning
+        header["PICTTYPE"] = file_type_code
+        header["IMAGETYP"] = image_type_string
+        primary_hdu = fits.PrimaryHDU(data.astype("f4"), header=header)
+        temporary_name = f"{name}.{os.getpid()}.tmp"
+        with StageProfiler.stage("write"):
+            fits.HDUList([primary_hdu]).writeto(temporary_name, output_verify="fix", overwrite=True, checksum=True)
+            os.replace(temporary_name, name)
 
     @classmethod
     def fits_file_type_string(cls, file_type):
@@ -180,15 +222,46 @@ class RmFitsUtil:
         else:
             return "UNKNOWN"
     @classmethod
-    def read_all_files_data(cls, file_names: [str]) -> [ndarray]:
+    def read_all_files_data(cls, file_names: [str], console: Optional[Console] = None) -> [ndarray]:
         """
         Read ndarray data arrays for all the given file names.
         :param file_names:  List of file names
+        :param console:     Console to which each file read is reported as an event, if given
         :return:            List of 2-dimensional matrices of pixel values
         """
         result_array: [ndarray] = []
         for name in file_names:
-            result_array.append(cls.fits_data_from_path(name))
+            start_time = time.monotonic()
+            with StageProfiler.stage("read"):
+                result_array.append(cls.fits_data_from_path(name))
+            if console is not None:
+                console.event("file_read", path=name, bytes=os.path.getsize(name),
+                              seconds=round(time.monotonic() - start_time, 6))
+        return result_array
+
+    @classmethod
+    def read_all_files_rows(cls, file_names: [str], row_start: int, row_end: int,
+                            console: Optional[Console] = None) -> [ndarray]:
+        """
+        Read a band of rows of all the given files, for combining a large group a band at a time.
+        Only the band's rows are read from each file, not the whole image.
+        :param file_names:  List of file names
+        :param row_start:   First row of the band
+        :param row_end:     Row after the last row of the band
+        :param console:     Console to which each file read is reported as an event, if given
+        :return:            List of 2-dimensional matrices of the band's pixel values
+        """
+        result_array: [ndarray] = []
+        for name in file_names:
+            start_time = time.monotonic()
+            with StageProfiler.stage("read"):
+                with fits.open(name) as hdul:
+                    primary = hdul[0]
+                    result_array.append(primary.section[row_start:row_end].astype(float))
+                    bytes_read = (row_end - row_start) * primary.header["NAXIS1"] * abs(primary.header["BITPIX"]) // 8
+            if console is not None:
+                console.event("file_read", path=name, bytes=bytes_read, rows=[row_start, row_end],
+                              seconds=round(time.monotonic() - start_time, 6))
         return result_array
 
     @classmethod
@@ -210,9 +283,10 @@ class RmFitsUtil:
         :return:            List of descriptors
         """
         result: [FileDescriptor] = []
-        for absolute_path in file_names:
-            descriptor = RmFitsUtil.make_file_descriptor(absolute_path)
-            result.append(descriptor)
+        with StageProfiler.stage("describe"):
+            for absolute_path in file_names:
+                descriptor = RmFitsUtil.make_file_descriptor(absolute_path)
+                result.append(descriptor)
         return result
 
     @classmethod
@@ -1,26 +1,27 @@
 # Class with an instance shared by the main event controller and the session worker
 # Using mutex-lock, basic status such as "cancel the thread" can be set by the main controller
-# and safely read and responded to by the worker.
-from PyQt5.QtCore import QMutex
+# and safely read and responded to by the worker.  The lock is Python's own, not Qt's, so the
+# command line runs without Qt.
+import threading
 
 
 class SessionController:
 
     def __init__(self):
-        self._mutex = QMutex()
+        self._mutex = threading.Lock()
         self._thread_ok_to_run = True
 
     def cancel_thread(self):
         """Set flag to cancel the controlled thread"""
-        self._mutex.lock()
+        self._mutex.acquire()
         self._thread_ok_to_run = False
-        self._mutex.unlock()
+        self._mutex.release()
 
     def thread_running(self):
         """Indicate if the controlled thread is still running"""
-        self._mutex.lock()
+        self._mutex.acquire()
         result = self._thread_ok_to_run
-        self._mutex.unlock()
+        self._mutex.release()
         return result
 
     def thread_cancelled(self):
@@ -7,10 +7,6 @@ import sys
 import glob
 from datetime import datetime
 
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QColor
-from PyQt5.QtWidgets import QWidget
-
 from Constants import Constants
 from FileDescriptor import FileDescriptor
 from Validators import Validators
@@ -23,13 +19,18 @@ class SharedUtils:
     _error_blue = 0x84
     ERROR_FIELD_BACKGROUND_COLOUR = f"#{_error_red:02X}{_error_green:02X}{_error_blue:02X}"
 
+    # The field colour methods are used only by the GUI, so they import Qt themselves, leaving
+    # the command line free of it
+
     @classmethod
-    def valid_or_error_field_color(cls, validity: bool) -> QColor:
+    def valid_or_error_field_color(cls, validity: bool) -> "QColor":
         """
         Return a QT colour for a form field that is valid (white) or in error (light red)
         :param validity:    Flag if valid or not
         :return:            QColour for field
         """
+        from PyQt5.QtCore import Qt
+        from PyQt5.QtGui import QColor
         if validity:
             result = QColor(Qt.white)
         else:
@@ -37,7 +38,7 @@ class SharedUtils:
         return result
 
     @classmethod
-    def background_validity_color(cls, field: QWidget, is_valid: bool):
+    def background_validity_color(cls, field: "QWidget", is_valid: bool):
         """
         set background colour of field if it has not passed validation
         :param field:       Field (QWidget) whose background to set
@@ -152,7 +153,7 @@ class SharedUtils:
                 # A file exists that conflicts with the desired directory
                 # Display an error and fail
                 print("A file (not a directory) already exists with the name and location "
-                      "you specified. Choose a different name or location.")
+                      "you specified. Choose a different name or location.", file=sys.stderr)
                 success = False
         else:
             # Nothing of that name exists.  Make a directory
@@ -185,13 +186,15 @@ class SharedUtils:
     def get_file_name_portion(cls, combine_method,
                               sample_input_file,
                               sigma_threshold,
-                              min_max_clipped) -> str:
+                              min_max_clipped,
+                              include_exposure: bool = False) -> str:
         """
         Make up the file name portion of a name for a file with given metadata
         :param combine_method:      How were inputs combined to make this file?
         :param sample_input_file:   Sample of the input files for their metadata
         :param sigma_threshold:     Sigma threshold if sigma clip was used
         :param min_max_clipped:     Min-Max drop count if min-max was used
+        :param include_exposure:    Include the exposure time, to tell apart files grouped by exposure
         :return:                    String of file name (not full path, just name)
         """
         # Get other components of name
@@ -207,7 +210,8 @@ class SharedUtils:
             method += str(sigma_threshold)
         elif combine_method == Constants.COMBINE_MINMAX:
             method += str(min_max_clipped)
-        file_name = f"FLAT-{filter_name}-{binning}-{method}-{date_time_string}-{temperature}C.fit"
+        exposure = f"{sample_input_file.get_exposure():g}s-" if include_exposure else ""
+        file_name = f"FLAT-{filter_name}-{binning}-{method}-{date_time_string}-{exposure}{temperature}C.fit"
 
         return file_name
 
@@ -253,7 +257,7 @@ class SharedUtils:
         while os.path.exists(destination_path):
             unique_counter += 1
             if unique_counter > 5000:
-                print("Unable to find a unique file name after 5000 tries.")
+                print("Unable to find a unique file name after 5000 tries.", file=sys.stderr)
                 sys.exit(1)
             destination_path = os.path.join(directory_path, str(unique_counter) + "-" + file_name)
 
@@ -0,0 +1,141 @@
+#
+#   Measures the time and memory taken by each stage of combining files, for the --profile option:
+#   reading the images, describing the files from their headers, calibrating, clipping, reducing the
+#   stack to one image, writing the output, and moving the inputs after processing.  For each stage it
+#   records the number of times it ran, the wall-clock time, the CPU time of the thread running it, and
+#   the process's peak resident memory as of the end of the stage.  Peak memory only ever grows, so the
+#   first stage showing the highest figure is the one where memory peaked.
+#
+#   Stages can run inside one another (calibrating may read calibration files, for instance); the times
+#   of a stage exclude those of the stages inside it, so the stages' times add up to the whole.
+#   When profiling is not in use, marking a stage costs only a check of a flag.
+#
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from Console import Console
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, where peak memory is not measured
+    resource = None
+
+
+class StageProfiler:
+
+    # The stages, in the order they are reported
+    STAGES = ["read", "describe", "calibrate", "clip", "reduce", "write", "move"]
+
+    _enabled = False
+    _mutex = threading.Lock()
+    # Stack, for each thread, of the stages in progress: [name, wall start, CPU start, wall and CPU of inner stages]
+    _local = threading.local()
+    # Stage name to [calls, wall seconds, CPU seconds, peak memory bytes]
+    _totals: {str: [int, float, float, int]} = {}
+
+    @classmethod
+    def start(cls):
+        """
+        Start recording the stages, with none recorded so far
+        """
+        cls.take_totals()
+        cls._enabled = True
+
+    @classmethod
+    def stop(cls):
+        """
+        Stop recording the stages
+        """
+        cls._enabled = False
+
+    @classmethod
+    def is_enabled(cls) -> bool:
+        return cls._enabled
+
+    @classmethod
+    @contextmanager
+    def stage(cls, name: str):
+        """
+        Record the time and memory of the work done in the with-block as the given stage
+        :param name:    Name of the stage, one of STAGES
+        """
+        if not cls._enabled:
+            yield
+            return
+        stack = cls._local.__dict__.setdefault("stack", [])
+        frame = [name, time.perf_counter(), time.thread_time(), 0.0, 0.0]
+        stack.append(frame)
+        try:
+            yield
+        finally:
+            stack.pop()
+            wall_seconds = time.perf_counter() - frame[1]
+            cpu_seconds = time.thread_time() - frame[2]
+            if len(stack) > 0:
+                stack[-1][3] += wall_seconds
+                stack[-1][4] += cpu_seconds
+            cls.add_totals({name: [1, wall_seconds - frame[3], cpu_seconds - frame[4], cls.peak_memory_bytes()]})
+
+    @staticmethod
+    def peak_memory_bytes() -> int:
+        """
+        Get the peak resident memory of this process so far
+        :return:    Peak memory in bytes, or 0 if it can't be measured
+        """
+        if resource is None:
+            return 0
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, macOS bytes
+        return peak if sys.platform == "darwin" else peak * 1024
+
+    @classmethod
+    def add_totals(cls, totals: {str: [int, float, float, int]}):
+        """
+        Add stage measurements to those recorded so far, as when a worker process sends back its own
+        :param totals:  Stage name to [calls, wall seconds, CPU seconds, peak memory bytes]
+        """
+        cls._mutex.acquire()
+        for (name, (calls, wall_seconds, cpu_seconds, peak_bytes)) in totals.items():
+            total = cls._totals.setdefault(name, [0, 0.0, 0.0, 0])
+            total[0] += calls
+            total[1] += wall_seconds
+            total[2] += cpu_seconds
+            total[3] = max(total[3], peak_bytes)
+        cls._mutex.release()
+
+    @classmethod
+    def take_totals(cls) -> {str: [int, float, float, int]}:
+        """
+        Return the stage measurements recorded so far, and start again with none
+        :return:    Stage name to [calls, wall seconds, CPU seconds, peak memory bytes]
+        """
+        cls._mutex.acquire()
+        totals = cls._totals
+        cls._totals = {}
+        cls._mutex.release()
+        return totals
+
+    @classmethod
+    def report(cls, console: Console):
+        """
+        Display a table of the stages recorded during the session, and start again with none
+        :param console:     Console on which to display the table
+        """
+        totals = cls.take_totals()
+        megabyte = 1024 * 1024
+        console.message("Stage profile:", 0)
+        console.push_level()
+        console.message(f"{'Stage':<10} {'Calls':>7} {'Wall s':>9} {'CPU s':>9} {'Peak MB':>9}", +1)
+        names = [name for name in cls.STAGES if name in totals] + sorted(set(totals) - set(cls.STAGES))
+        for name in names:
+            (calls, wall_seconds, cpu_seconds, peak_bytes) = totals[name]
+            peak = f"{peak_bytes / megabyte:9.1f}" if peak_bytes > 0 else f"{'-':>9}"
+            console.message(f"{name:<10} {calls:7d} {wall_seconds:9.3f} {cpu_seconds:9.3f} {peak}", 0)
+            console.event("stage_profile", stage=name, calls=calls, wall_seconds=round(wall_seconds, 6),
+                          cpu_seconds=round(cpu_seconds, 6), peak_memory_bytes=peak_bytes)
+        console.message(f"{'total':<10} {'':>7} {sum(t[1] for t in totals.values()):9.3f} "
+                        f"{sum(t[2] for t in totals.values()):9.3f}", 0)
+        console.pop_level()
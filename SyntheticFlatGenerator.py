@@ -0,0 +1,154 @@
+#
+#   Makes synthetic FITS files like those the program combines, for the benchmarks: stacks of flat
+#   frames, and the bias and dark frames of a calibration library.  The same seed always gives the
+#   same files, so benchmark runs on different days, or different versions of the code, combine
+#   exactly the same data.
+#
+#   Each frame is a bias level, plus (for flats) an illumination level dimmed towards the corners by
+#   vignetting, plus (for darks) dark current in proportion to the exposure, plus gaussian read noise.
+#   The sensor's hot pixels are in the same places in every frame and are near saturation.  The
+#   rightmost columns of every frame are an overscan strip, which receives no light, so the overscan
+#   calibration has a strip to measure.
+#
+#   Run as:  python SyntheticFlatGenerator.py <directory> [number of frames] [width] [height]
+#   to write one stack of flats into a directory, for trying the program by hand.
+#
+import os
+import sys
+
+import numpy
+from numpy import ndarray
+
+from FileDescriptor import FileDescriptor
+from RmFitsUtil import RmFitsUtil
+
+
+class SyntheticFlatGenerator:
+
+    # Width of the strip of columns, at the right of each frame, that receives no light
+    OVERSCAN_COLUMNS = 16
+    BIAS_LEVEL = 1000.0
+    # Dark current, in ADUs per second of exposure
+    DARK_CURRENT = 0.5
+    # Value of a hot pixel, close to the 16-bit signed limit of the files written
+    HOT_PIXEL_LEVEL = 32000.0
+
+    def __init__(self, seed: int,
+                 width: int,
+                 height: int,
+                 binning: int = 1,
+                 flat_level: float = 20000.0,
+                 noise: float = 50.0,
+                 hot_pixels: int = 100,
+                 vignetting: float = 0.3):
+        """
+        Initialize the generator
+        :param seed:            Seed for the random number generator
+        :param width:           Width of each frame in pixels, including the overscan strip
+        :param height:          Height of each frame in pixels
+        :param binning:         Binning recorded in each file's header
+        :param flat_level:      Illumination of a flat frame at its centre, in ADUs above the bias
+        :param noise:           Standard deviation of the read noise, in ADUs
+        :param hot_pixels:      Number of hot pixels on the sensor
+        :param vignetting:      Fraction of the illumination lost in the corners of a flat frame
+        """
+        assert width > self.OVERSCAN_COLUMNS and height > 0
+        self._generator = numpy.random.default_rng(seed)
+        self._width = width
+        self._height = height
+        self._binning = binning
+        self._flat_level = flat_level
+        self._noise = noise
+        self._vignetting = vignetting
+        self._hot_pixel_indices = self._generator.choice(width * height, min(hot_pixels, width * height),
+                                                         replace=False)
+        # Illumination of each pixel as a fraction of the centre's, falling off with the square of the radius
+        (y_grid, x_grid) = numpy.mgrid[-1.0:1.0:height * 1j, -1.0:1.0:width * 1j]
+        self._illumination = 1.0 - vignetting * (x_grid ** 2 + y_grid ** 2) / 2.0
+        self._illumination[:, width - self.OVERSCAN_COLUMNS:] = 0.0
+
+    def get_overscan_rectangle(self) -> (int, int, int, int):
+        """
+        Get the overscan strip of the frames, as the overscan calibration takes it
+        :return:    (x start, x end, y start, y end), ends excluded
+        """
+        return self._width - self.OVERSCAN_COLUMNS, self._width, 0, self._height
+
+    def frame(self, light_level: float, exposure: float) -> ndarray:
+        """
+        Make the pixels of one frame
+        :param light_level:     Illumination at the centre, in ADUs above the bias; 0 for a bias or dark
+        :param exposure:        Exposure time in seconds, for the dark current
+        :return:                2-dimensional matrix of pixel values
+        """
+        pixels = self.BIAS_LEVEL + light_level * self._illumination + self.DARK_CURRENT * exposure \
+            + self._generator.normal(0.0, self._noise, (self._height, self._width))
+        pixels.flat[self._hot_pixel_indices] = self.HOT_PIXEL_LEVEL
+        return pixels.clip(0, self.HOT_PIXEL_LEVEL)
+
+    def write_frames(self, directory: str,
+                     name_prefix: str,
+                     count: int,
+                     file_type: int,
+                     exposure: float,
+                     temperature: float,
+                     filter_name: str = "") -> [str]:
+        """
+        Write a number of frames of one kind into a directory
+        :param directory:       Directory to receive the files; created if necessary
+        :param name_prefix:     Start of each file's name, followed by its number
+        :param count:           Number of frames
+        :param file_type:       FileDescriptor type code: flat, bias or dark
+        :param exposure:        Exposure time in seconds
+        :param temperature:     Sensor temperature recorded in the headers
+        :param filter_name:     Filter name recorded in the headers
+        :return:                Paths of the files written
+        """
+        os.makedirs(directory, exist_ok=True)
+        light_level = self._flat_level if file_type == FileDescriptor.FILE_TYPE_FLAT else 0.0
+        image_type = {FileDescriptor.FILE_TYPE_FLAT: "Flat Frame",
+                      FileDescriptor.FILE_TYPE_BIAS: "Bias Frame",
+                      FileDescriptor.FILE_TYPE_DARK: "Dark Frame"}[file_type]
+        paths: [str] = []
+        for index in range(count):
+            path = os.path.join(directory, f"{name_prefix}-{index:03d}.fit")
+            RmFitsUtil.create_combined_fits_file(path, self.frame(light_level, exposure), file_type, image_type,
+                                                 exposure, temperature, filter_name, self._binning,
+                                                 "Synthetic frame")
+            paths.append(path)
+        return paths
+
+    def write_flat_stack(self, directory: str, count: int,
+                         filter_name: str = "Lum",
+                         exposure: float = 2.0,
+                         temperature: float = -10.0) -> [str]:
+        return self.write_frames(directory, f"flat-{filter_name}", count, FileDescriptor.FILE_TYPE_FLAT,
+                                 exposure, temperature, filter_name)
+
+    def write_calibration_library(self, directory: str,
+                                  bias_count: int,
+                                  dark_exposures: [float],
+                                  temperature: float = -10.0) -> [str]:
+        """
+        Write a calibration library: bias frames, and one dark frame for each given exposure
+        :param directory:       Directory to receive the files
+        :param bias_count:      Number of bias frames
+        :param dark_exposures:  Exposure times of the dark frames
+        :param temperature:     Sensor temperature recorded in the headers
+        :return:                Paths of the files written
+        """
+        paths = self.write_frames(directory, "bias", bias_count, FileDescriptor.FILE_TYPE_BIAS, 0.0, temperature)
+        for exposure in dark_exposures:
+            paths += self.write_frames(directory, f"dark-{exposure:g}s", 1, FileDescriptor.FILE_TYPE_DARK,
+                                       exposure, temperature)
+        return paths
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python SyntheticFlatGenerator.py <directory> [number of frames] [width] [height]")
+        sys.exit(1)
+    generator = SyntheticFlatGenerator(1, int(sys.argv[3]) if len(sys.argv) > 3 else 1024,
+                                       int(sys.argv[4]) if len(sys.argv) > 4 else 1024)
+    written = generator.write_flat_stack(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 16)
+    print(f"Wrote {len(written)} flat frames to {sys.argv[1]}")
@@ -50,6 +50,26 @@ class Validators:
             pass
         return result
 
+    @classmethod
+    def valid_overscan_rectangle(cls, proposed_value: str) -> Optional[tuple]:
+        """
+        Validate that a string gives an overscan rectangle as 4 comma-separated integers,
+        x_start, x_end, y_start, y_end, with the starts >= 0 and less than the ends
+        :param proposed_value:      String to be tested
+        :return:                    Tuple of the 4 integers if valid, None if not valid
+        """
+        result: Optional[tuple] = None
+        try:
+            parts = [int(part) for part in proposed_value.split(",")]
+            if len(parts) == 4:
+                (x_start, x_end, y_start, y_end) = parts
+                if 0 <= x_start < x_end and 0 <= y_start < y_end:
+                    result = (x_start, x_end, y_start, y_end)
+        except ValueError:
+            # Let result go back as "none", indicating error
+            pass
+        return result
+
     @classmethod
     def valid_file_name(cls, proposed_name,
                         min_length,
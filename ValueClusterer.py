@@ -0,0 +1,222 @@
+#
+#   Fast clustering of one-dimensional values (temperatures, exposure times) into groups.
+#   This gives the same groups as the Mean Shift clusterer in mean_shift.py, with the same Gaussian
+#   kernel, bandwidth, stopping rule and grouping tolerance, but uses the values being one-dimensional
+#   to avoid shifting every value, one at a time, through many iterations.
+#
+#   In one dimension the Gaussian mean shift m(x) - the kernel-weighted mean of the values around x -
+#   never decreases as x increases.  So if value a shifts down, and the next value up, b, shifts to or
+#   below a, no value between them stops short of a: they all end up where a does.  Likewise upward.
+#   This is used to:
+#       -   Shift only a sample of the sorted distinct values, adding more samples only where the
+#           above can't be shown, which is only near the places values converge to or diverge from
+#       -   Run the real, iterated mean shift only from the sampled values whose destination can't be
+#           taken from a neighbour, all together in vectorized chunks
+#       -   Give every other value the final position of the neighbour it is known to follow
+#   Repeated values (files taken at the same set-point) are weighed once, by their count, and each
+#   value only weighs the values within a few bandwidths of it.  The final positions are grouped by
+#   sorting them and splitting where neighbours are at least the grouping tolerance apart, and the
+#   cluster ids are numbered in order of each cluster's first appearance in the input, as Mean Shift does.
+#
+#   cluster_by_gaps() is a simpler clusterer, used for exposure times: the values are sorted and split
+#   wherever neighbours are more than a given gap apart.  It needs only the sort, so it handles large
+#   sessions in a fraction of the time, and its clusters are numbered in ascending order of value.
+#
+import numpy
+from numpy import ndarray
+
+import mean_shift as ms
+
+
+class ValueClusterer:
+
+    # Values more than this many bandwidths away are ignored when shifting a value.  Their
+    # Gaussian weight is below 1e-13 of a value at the same spot, so they cannot change the result.
+    KERNEL_CUTOFF_BANDWIDTHS = 8.0
+
+    # Number of distinct values initially sampled.  More are added where needed.
+    INITIAL_SAMPLES = 256
+
+    # Largest number of value-to-value distances computed at once, to bound memory use
+    MAXIMUM_CHUNK_ELEMENTS = 1000000
+
+    @classmethod
+    def cluster(cls, values: [float], bandwidth: float) -> ndarray:
+        """
+        Cluster the given values using Mean Shift with a Gaussian kernel
+        :param values:      List of values to be clustered
+        :param bandwidth:   Bandwidth of the cluster search algorithm
+        :return:            Array of integer cluster ids, one per input value, numbered from 0 in order
+                            of each cluster's first appearance in the input
+        """
+        data = numpy.asarray(values, dtype=float).ravel()
+        if len(data) == 0:
+            return numpy.zeros(0, dtype=int)
+        (unique_values, value_index, counts) = numpy.unique(data, return_inverse=True, return_counts=True)
+        final_positions = cls.final_positions(unique_values, counts, bandwidth)
+        labels = cls.group_by_gaps(final_positions)[value_index.ravel()]
+        # Renumber clusters in order of first appearance, as the Mean Shift point grouper does
+        (_, first_appearance, cluster_index) = numpy.unique(labels, return_index=True, return_inverse=True)
+        order_of_appearance = numpy.empty(len(first_appearance), dtype=int)
+        order_of_appearance[numpy.argsort(first_appearance)] = numpy.arange(len(first_appearance))
+        return order_of_appearance[cluster_index.ravel()]
+
+    @classmethod
+    def cluster_by_gaps(cls, values: [float], maximum_gap: float) -> ndarray:
+        """
+        Cluster the given values by sorting them and starting a new cluster wherever a value is more
+        than the maximum gap above the next-lower value
+        :param values:          List of values to be clustered
+        :param maximum_gap:     Largest difference between neighbouring values in one cluster
+        :return:                Array of integer cluster ids, one per input value, numbered from 0 in
+                                ascending order of value
+        """
+        data = numpy.asarray(values, dtype=float).ravel()
+        order = numpy.argsort(data, kind="stable")
+        new_cluster = numpy.diff(data[order]) > maximum_gap
+        labels = numpy.empty(len(data), dtype=int)
+        labels[order] = numpy.concatenate(([0], numpy.cumsum(new_cluster)))[:len(data)]
+        return labels
+
+    @classmethod
+    def final_positions(cls, unique_values: ndarray, counts: ndarray, bandwidth: float) -> ndarray:
+        """
+        Find the position that mean shift moves each distinct value to
+        :param unique_values:   Distinct values, in ascending order
+        :param counts:          Number of times each distinct value occurs in the input
+        :param bandwidth:       Bandwidth of the Gaussian kernel
+        :return:                Array of the final positions, one per distinct value
+        """
+        number_of_values = len(unique_values)
+        cutoff = cls.KERNEL_CUTOFF_BANDWIDTHS * bandwidth
+
+        # Shift a sample of the values, then keep adding the middle value of any run of unsampled values
+        # that can't be shown to follow one of the sampled values either side of it
+        sampled = numpy.unique(numpy.concatenate((numpy.linspace(0, number_of_values - 1, cls.INITIAL_SAMPLES)
+                                                  .round().astype(int), [number_of_values - 1])))
+        shifted = cls.shift(unique_values[sampled], unique_values, counts, bandwidth, cutoff)
+        while True:
+            (follows_lower, follows_upper) = cls.following_neighbours(unique_values[sampled], shifted)
+            has_interior = numpy.diff(sampled) > 1
+            undecided = has_interior & ~follows_lower[1:] & ~follows_upper[:-1]
+            if not undecided.any():
+                break
+            middles = (sampled[:-1][undecided] + sampled[1:][undecided]) // 2
+            middle_shifted = cls.shift(unique_values[middles], unique_values, counts, bandwidth, cutoff)
+            sampled = numpy.concatenate((sampled, middles))
+            shifted = numpy.concatenate((shifted, middle_shifted))
+            order = numpy.argsort(sampled)
+            (sampled, shifted) = (sampled[order], shifted[order])
+
+        # Values that don't move at all stay where they are, as Mean Shift stops them at once
+        positions = unique_values[sampled]
+        stationary = numpy.abs(shifted - positions) < ms.MIN_DISTANCE
+        (follows_lower, follows_upper) = cls.following_neighbours(positions, shifted)
+        seeds = ~stationary & ~follows_lower & ~follows_upper
+        final = positions.copy()
+        final[seeds] = cls.shift_to_modes(positions[seeds], unique_values, counts, bandwidth, cutoff)
+
+        # Every other sample ends up where the neighbour it follows does
+        leader = numpy.arange(len(sampled))
+        leader[follows_lower] -= 1
+        leader[follows_upper] += 1
+        for _ in range(len(sampled)):
+            next_leader = leader[leader]
+            if numpy.array_equal(next_leader, leader):
+                break
+            leader = next_leader
+        final = final[leader]
+
+        # And unsampled values end up where the sample they follow does: downward-moving runs
+        # follow the sample below them, upward-moving runs the sample above
+        interval = numpy.searchsorted(sampled, numpy.arange(number_of_values), side="right") - 1
+        interval = numpy.minimum(interval, len(sampled) - 2) if len(sampled) > 1 else interval
+        result = numpy.empty(number_of_values)
+        result[sampled] = final
+        unsampled = numpy.setdiff1d(numpy.arange(number_of_values), sampled, assume_unique=True)
+        if len(unsampled) > 0:
+            lower_sample = interval[unsampled]
+            result[unsampled] = numpy.where(follows_lower[lower_sample + 1],
+                                            final[lower_sample], final[lower_sample + 1])
+        return result
+
+    @classmethod
+    def following_neighbours(cls, positions: ndarray, shifted: ndarray) -> (ndarray, ndarray):
+        """
+        Find which sampled values are known to end up where their neighbour does.  A value moving
+        down follows the sample below it if it shifts to or past that sample (and that sample is also
+        moving down); since the mean shift never decreases with position, every value between them
+        then does the same.  Likewise for values moving up.
+        :param positions:   Ascending sampled values
+        :param shifted:     Their positions after one mean shift
+        :return:            Flags of samples following the sample below, and of those following the one above
+        """
+        steps = shifted - positions
+        moving_down = steps <= -ms.MIN_DISTANCE
+        moving_up = steps >= ms.MIN_DISTANCE
+        follows_lower = numpy.zeros(len(positions), dtype=bool)
+        follows_upper = numpy.zeros(len(positions), dtype=bool)
+        follows_lower[1:] = moving_down[1:] & moving_down[:-1] & (shifted[1:] <= positions[:-1])
+        follows_upper[:-1] = moving_up[:-1] & moving_up[1:] & (shifted[:-1] >= positions[1:])
+        return follows_lower, follows_upper
+
+    @classmethod
+    def shift_to_modes(cls, starts: ndarray, unique_values: ndarray, counts: ndarray,
+                       bandwidth: float, cutoff: float) -> ndarray:
+        """
+        Run the mean shift from each of the given positions until it moves less than the Mean Shift
+        minimum distance, all the still-moving positions being shifted together
+        :param starts:          Starting positions
+        :param unique_values:   Distinct original values, in ascending order
+        :param counts:          Number of times each distinct value occurs
+        :param bandwidth:       Bandwidth of the Gaussian kernel
+        :param cutoff:          Distance beyond which values are ignored
+        :return:                Array of the final positions
+        """
+        shifted = starts.copy()
+        moving = numpy.arange(len(starts))
+        while len(moving) > 0:
+            moving = moving[numpy.argsort(shifted[moving], kind="stable")]
+            new_positions = cls.shift(shifted[moving], unique_values, counts, bandwidth, cutoff)
+            distances = numpy.abs(new_positions - shifted[moving])
+            shifted[moving] = new_positions
+            moving = moving[distances >= ms.MIN_DISTANCE]
+        return shifted
+
+    @classmethod
+    def shift(cls, positions: ndarray, unique_values: ndarray, counts: ndarray,
+              bandwidth: float, cutoff: float) -> ndarray:
+        """
+        Shift each of the given positions once: to the kernel-weighted mean of the original values around it
+        :param positions:       Ascending positions to be shifted
+        :param unique_values:   Distinct original values, in ascending order
+        :param counts:          Number of times each distinct value occurs
+        :param bandwidth:       Bandwidth of the Gaussian kernel
+        :param cutoff:          Distance beyond which values are ignored
+        :return:                Array of the shifted positions
+        """
+        result = positions.copy()
+        chunk_rows = max(1, cls.MAXIMUM_CHUNK_ELEMENTS // len(unique_values))
+        for start in range(0, len(positions), chunk_rows):
+            rows = positions[start:start + chunk_rows]
+            low = numpy.searchsorted(unique_values, rows.min() - cutoff, side="left")
+            high = numpy.searchsorted(unique_values, rows.max() + cutoff, side="right")
+            neighbours = unique_values[low:high]
+            offsets = neighbours[numpy.newaxis, :] - rows[:, numpy.newaxis]
+            weights = numpy.exp(-0.5 * (offsets / bandwidth) ** 2) * counts[low:high]
+            result[start:start + chunk_rows] = (weights * neighbours).sum(axis=1) / weights.sum(axis=1)
+        return result
+
+    @classmethod
+    def group_by_gaps(cls, positions: ndarray) -> ndarray:
+        """
+        Group shifted values by sorting them and splitting wherever neighbours are at least the
+        Mean Shift grouping tolerance apart
+        :param positions:   Shifted position of each distinct value
+        :return:            Array of arbitrary integer group labels, one per distinct value
+        """
+        order = numpy.argsort(positions, kind="stable")
+        new_group = numpy.diff(positions[order]) >= ms.GROUP_DISTANCE_TOLERANCE
+        labels = numpy.empty(len(positions), dtype=int)
+        labels[order] = numpy.concatenate(([0], numpy.cumsum(new_group)))
+        return labels
@@ -0,0 +1,69 @@
+#
+#   Check that the fast one-dimensional clusterer (ValueClusterer) gives the same cluster ids as the
+#   original Mean Shift implementation (mean_shift.MeanShift) for the same values and bandwidth.
+#   Random sets of values like those the program clusters - temperatures and exposures around a few
+#   set-points, rounded or not, and some spread evenly - are clustered both ways and compared.
+#
+#   Run as:  python ValueClustererCheck.py [number of trials] [random seed]
+#   Exits with status 1, after listing the differing cases, if any results differ.
+#
+import sys
+
+import numpy
+
+import mean_shift as ms
+from ValueClusterer import ValueClusterer
+
+
+class ValueClustererCheck:
+
+    BANDWIDTHS = [0.1, 0.3, 0.5, 1.0, 2.0, 5.0, 10.0, 50.0]
+
+    @classmethod
+    def random_values(cls, generator: numpy.random.Generator, trial: int) -> numpy.ndarray:
+        """
+        Make a random set of values to be clustered
+        :param generator:   Random number generator
+        :param trial:       Trial number, used to rotate through the kinds of value set
+        :return:            Array of values
+        """
+        number_of_values = int(generator.integers(1, 70))
+        set_points = generator.uniform(-25, 25, generator.integers(1, 6))
+        values = generator.choice(set_points, number_of_values) \
+            + generator.normal(0, generator.uniform(0, 2), number_of_values)
+        kind = trial % 3
+        if kind == 0:
+            # As read from FITS headers recorded to one decimal place
+            values = numpy.round(values, 1)
+        elif kind == 2:
+            values = generator.uniform(-10, 10, number_of_values)
+        return values
+
+    @classmethod
+    def run(cls, trials: int, seed: int) -> bool:
+        """
+        Cluster random value sets both ways and report any differences
+        :param trials:  Number of value sets to try
+        :param seed:    Seed for the random number generator
+        :return:        True if all the results were the same
+        """
+        generator = numpy.random.default_rng(seed)
+        differences = 0
+        for trial in range(trials):
+            values = cls.random_values(generator, trial)
+            bandwidth = float(generator.choice(cls.BANDWIDTHS))
+            expected = ms.MeanShift().cluster(values.reshape(-1, 1), kernel_bandwidth=bandwidth).cluster_ids
+            actual = ValueClusterer.cluster(values, bandwidth)
+            if not numpy.array_equal(expected, actual):
+                differences += 1
+                print(f"Trial {trial}, bandwidth {bandwidth}: values {values.tolist()}")
+                print(f"     mean_shift ids {expected.tolist()}")
+                print(f"     ValueClusterer ids {actual.tolist()}")
+        print(f"{trials - differences} of {trials} trials gave the same clusters")
+        return differences == 0
+
+
+if __name__ == "__main__":
+    number_of_trials = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    random_seed = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    sys.exit(0 if ValueClustererCheck.run(number_of_trials, random_seed) else 1)
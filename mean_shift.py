@@ -1,5 +1,4 @@
 import math
-import sys
 import numpy
 
 # This implementation of the Mean Shift clustering algorithm was written by Matt Nedrich
@@ -54,7 +53,7 @@ def euclidean_dist(point_a: numpy.ndarray,
 
 
 def gaussian_kernel(distance: numpy.ndarray, bandwidth: float) -> numpy.ndarray:
-    euclidean_distance = numpy.sqrt((distance ** 2).sum(axis=1))
+    euclidean_distance = numpy.sqrt((distance ** 2).sum(axis=-1))
     val = (1/(bandwidth*math.sqrt(2*math.pi))) * numpy.exp(-0.5 * (euclidean_distance / bandwidth) ** 2)
     return val
 
@@ -68,7 +67,7 @@ def multivariate_gaussian_kernel(distances, bandwidths):
     cov = numpy.multiply(numpy.power(bandwidths, 2), numpy.eye(dim))
 
     # Compute Multivariate gaussian (vectorized implementation)
-    exponent = -0.5 * numpy.sum(numpy.multiply(numpy.dot(distances, numpy.linalg.inv(cov)), distances), axis=1)
+    exponent = -0.5 * numpy.sum(numpy.multiply(numpy.dot(distances, numpy.linalg.inv(cov)), distances), axis=-1)
     val = (1 / numpy.power((2 * math.pi), (dim/2)) * numpy.power(numpy.linalg.det(cov), 0.5)) * numpy.exp(exponent)
 
     return val
@@ -79,39 +78,84 @@ GROUP_DISTANCE_TOLERANCE = .1
 
 
 class PointGrouper(object):
-    def group_points(self, points: [[float]]) -> numpy.array:
-        group_assignment = []
-        groups = []
-        group_index = 0
-        for point in points:
-            nearest_group_index = self._determine_nearest_group(point, groups)
-            if nearest_group_index is None:
-                # create new group
-                groups.append([point])
-                group_assignment.append(group_index)
-                group_index += 1
-            else:
-                group_assignment.append(nearest_group_index)
-                groups[nearest_group_index].append(point)
-        return numpy.array(group_assignment)
-
-    def _determine_nearest_group(self, point: [float], groups: [[[float]]]) -> int:
-        nearest_group_index = None
-        index = 0
-        for group in groups:
-            distance_to_group = self._distance_to_group(point, group)
-            if distance_to_group < GROUP_DISTANCE_TOLERANCE:
-                nearest_group_index = index
-            index += 1
-        return nearest_group_index
-
-    def _distance_to_group(self, point: [float], group: [[float]]) -> float:
-        min_distance = sys.float_info.max
-        for pt in group:
-            dist = euclidean_dist(point, pt)
-            if dist < min_distance:
-                min_distance = dist
-        return min_distance
+    # Vectorized replacement for the original grouper, which compared each point with every member
+    # of every group in Python loops.  Points closer than GROUP_DISTANCE_TOLERANCE are put in the same
+    # group, chaining through intermediate points; groups are numbered in order of first appearance,
+    # as before.  Shifted points sit tightly at their modes, so this is the same grouping the original
+    # sequential assignment made.  One-dimensional points are sorted and split at gaps; others are
+    # binned into grid cells so only points in neighbouring cells are ever compared.
+
+    # Largest number of point-to-point distances computed at once, to bound memory use
+    MAXIMUM_CHUNK_ELEMENTS = 1000000
+
+    def group_points(self, points: numpy.ndarray) -> numpy.array:
+        points = numpy.asarray(points, dtype=float)
+        if points.ndim == 1:
+            points = points.reshape(-1, 1)
+        if len(points) == 0:
+            return numpy.zeros(0, dtype=int)
+        if points.shape[1] == 1:
+            labels = self._group_sorted_values(points[:, 0])
+        else:
+            labels = self._group_by_cells(points)
+        # Number groups in order of their first member
+        (_, first_member, group_index) = numpy.unique(labels, return_index=True, return_inverse=True)
+        order_of_appearance = numpy.empty(len(first_member), dtype=int)
+        order_of_appearance[numpy.argsort(first_member)] = numpy.arange(len(first_member))
+        return order_of_appearance[group_index.ravel()]
+
+    def _group_sorted_values(self, values: numpy.ndarray) -> numpy.ndarray:
+        # One dimension: sort, and start a new group wherever neighbours are not within the tolerance
+        order = numpy.argsort(values, kind="stable")
+        new_group = numpy.diff(values[order]) >= GROUP_DISTANCE_TOLERANCE
+        labels = numpy.empty(len(values), dtype=int)
+        labels[order] = numpy.concatenate(([0], numpy.cumsum(new_group)))
+        return labels
+
+    def _group_by_cells(self, points: numpy.ndarray) -> numpy.ndarray:
+        # Several dimensions: put the points in a grid of cells whose diagonal is the tolerance, so
+        # all the points in a cell belong together.  Then join each cell with any nearby cell holding
+        # a point within the tolerance of one of its own.  Only the occupied cells are examined.
+        dimensions = points.shape[1]
+        cell_size = GROUP_DISTANCE_TOLERANCE / math.sqrt(dimensions)
+        (cells, cell_of_point) = numpy.unique(numpy.floor(points / cell_size).astype(numpy.int64),
+                                              axis=0, return_inverse=True)
+        cell_of_point = cell_of_point.ravel()
+        order = numpy.argsort(cell_of_point, kind="stable")
+        boundaries = numpy.searchsorted(cell_of_point[order], numpy.arange(len(cells) + 1))
+        members = [points[order[boundaries[i]:boundaries[i + 1]]] for i in range(len(cells))]
+        cell_numbers = {tuple(cell): i for (i, cell) in enumerate(cells.tolist())}
+
+        # Points within the tolerance can be this many cells apart along each axis
+        reach = int(math.ceil(math.sqrt(dimensions)))
+        offsets = numpy.array(numpy.meshgrid(*[numpy.arange(-reach, reach + 1)] * dimensions)).reshape(dimensions, -1).T
+        offsets = [tuple(offset) for offset in offsets.tolist() if tuple(offset) > (0,) * dimensions]
+
+        parent = list(range(len(cells)))
+
+        def root(cell_number: int) -> int:
+            while parent[cell_number] != cell_number:
+                parent[cell_number] = parent[parent[cell_number]]
+                cell_number = parent[cell_number]
+            return cell_number
+
+        for (cell_number, cell) in enumerate(cells.tolist()):
+            for offset in offsets:
+                neighbour = cell_numbers.get(tuple(c + o for (c, o) in zip(cell, offset)))
+                if neighbour is not None and root(cell_number) != root(neighbour) \
+                        and self._any_within_tolerance(members[cell_number], members[neighbour]):
+                    parent[root(neighbour)] = root(cell_number)
+        return numpy.array([root(c) for c in range(len(cells))])[cell_of_point]
+
+    def _any_within_tolerance(self, first_points: numpy.ndarray, second_points: numpy.ndarray) -> bool:
+        # Is any point of the first set closer than the tolerance to any point of the second?
+        chunk_rows = max(1, self.MAXIMUM_CHUNK_ELEMENTS // len(second_points))
+        for start in range(0, len(first_points), chunk_rows):
+            rows = first_points[start:start + chunk_rows]
+            squared_distances = ((rows[:, numpy.newaxis, :] - second_points[numpy.newaxis, :, :]) ** 2).sum(axis=-1)
+            if (squared_distances < GROUP_DISTANCE_TOLERANCE ** 2).any():
+                return True
+        return False
 # end import from mean_shift_utils
 
 # Original mean_shift file
@@ -121,14 +165,33 @@ MIN_DISTANCE = 0.000001
 
 
 class MeanShift(object):
-    def __init__(self, kernel=gaussian_kernel):
+    # Batch mode shifts all the still-moving points together, with one kernel evaluation over every
+    # (moving point, original point) pair per iteration, instead of one point at a time.  The pairs
+    # are taken in chunks of at most chunk_elements distance components, to bound the memory used.
+    # Each point is still shifted against the original points and stopped when it moves less than
+    # MIN_DISTANCE, so the result is the same as the one-at-a-time loop.
+    DEFAULT_CHUNK_ELEMENTS = 1000000
+
+    def __init__(self, kernel=gaussian_kernel, batch: bool = True, chunk_elements: int = DEFAULT_CHUNK_ELEMENTS):
         if kernel == 'multivariate_gaussian':
             kernel = multivariate_gaussian_kernel
         self.kernel = kernel
+        self.batch = batch
+        self.chunk_elements = chunk_elements
 
     def cluster(self, points: numpy.ndarray, kernel_bandwidth: float, iteration_callback=None):
         if iteration_callback:
             iteration_callback(points, 0)
+        if self.batch:
+            shift_points = self._shift_all_points(points, kernel_bandwidth, iteration_callback)
+        else:
+            shift_points = self._shift_each_point(points, kernel_bandwidth, iteration_callback)
+        point_grouper = PointGrouper()
+        group_assignments = point_grouper.group_points(shift_points)
+        return MeanShiftResult(points, shift_points, group_assignments)
+
+    def _shift_each_point(self, points: numpy.ndarray, kernel_bandwidth: float,
+                          iteration_callback) -> numpy.ndarray:
         shift_points = numpy.array(points)
         max_min_dist = 1
         iteration_number = 0
@@ -152,10 +215,36 @@ class MeanShift(object):
                 shift_points[i] = p_new
             if iteration_callback:
                 iteration_callback(shift_points, iteration_number)
-        point_grouper = PointGrouper()
-        points_as_list: [[float]] = shift_points.tolist()
-        group_assignments = point_grouper.group_points(points_as_list)
-        return MeanShiftResult(points, shift_points, group_assignments)
+        return shift_points
+
+    def _shift_all_points(self, points: numpy.ndarray, kernel_bandwidth: float,
+                          iteration_callback) -> numpy.ndarray:
+        points = numpy.asarray(points, dtype=float)
+        shift_points = numpy.array(points)
+        still_shifting = numpy.arange(len(points))
+        iteration_number = 0
+        while len(still_shifting) > 0:
+            iteration_number += 1
+            moving_points = shift_points[still_shifting]
+            new_points = self._shift_points(moving_points, points, kernel_bandwidth)
+            distances = numpy.sqrt(((new_points - moving_points) ** 2).sum(axis=-1))
+            shift_points[still_shifting] = new_points
+            still_shifting = still_shifting[distances >= MIN_DISTANCE]
+            if iteration_callback:
+                iteration_callback(shift_points, iteration_number)
+        return shift_points
+
+    def _shift_points(self, moving_points: numpy.ndarray, points: numpy.ndarray,
+                      kernel_bandwidth: float) -> numpy.ndarray:
+        # Shift every moving point once, a chunk of rows of the pairwise-difference array at a time
+        shifted_points = numpy.empty_like(moving_points)
+        chunk_rows = max(1, self.chunk_elements // points.size)
+        for start in range(0, len(moving_points), chunk_rows):
+            rows = moving_points[start:start + chunk_rows]
+            point_weights = self.kernel(rows[:, numpy.newaxis, :] - points[numpy.newaxis, :, :], kernel_bandwidth)
+            shifted_points[start:start + chunk_rows] = \
+                numpy.dot(point_weights, points) / point_weights.sum(axis=1)[:, numpy.newaxis]
+        return shifted_points
 
     def _shift_point(self, point: numpy.ndarray, points: numpy.ndarray, kernel_bandwidth: float) -> numpy.ndarray:
         # from http://en.wikipedia.org/wiki/Mean-shift